@@ -0,0 +1,82 @@
+"""Поля ресурсов API и их сериализация без экземпляров моделей.
+
+Списки читаются через ``values()``: ORM не создаёт объекты моделей, а
+из базы выбираются только столбцы запрошенных полей (``?fields=``) и
+ключа курсора. Связанные таблицы присоединяются, только если их поле
+запрошено.
+"""
+from posts.models import Post
+
+
+def image_url(name):
+    if not name:
+        return None
+    return Post._meta.get_field('image').storage.url(name)
+
+
+class Resource:
+    """Поля ресурса: имя в ответе -> (столбец values(), преобразование).
+
+    ``keys`` — поля ключа курсора по убыванию, последнее уникально.
+    """
+
+    def __init__(self, fields, keys=('id',)):
+        self.fields = fields
+        self.keys = keys
+
+    def parse_fields(self, value):
+        """Имена полей из ``?fields=``; ValueError для неизвестных."""
+        if not value:
+            return list(self.fields)
+        names = [name.strip() for name in value.split(',') if name.strip()]
+        unknown = [name for name in names if name not in self.fields]
+        if unknown or not names:
+            raise ValueError(
+                'Неизвестные поля: {}. Доступны: {}.'.format(
+                    ', '.join(unknown) or '—', ', '.join(self.fields)))
+        return names
+
+    def rows(self, queryset, names):
+        columns = {self.fields[name][0] for name in names}
+        columns.update(self.keys)
+        return queryset.values(*columns)
+
+    def dump(self, row, names):
+        data = {}
+        for name in names:
+            column, convert = self.fields[name]
+            value = row[column]
+            data[name] = convert(value) if convert else value
+        return data
+
+
+POSTS = Resource({
+    'id': ('id', None),
+    'text': ('text', None),
+    'pub_date': ('pub_date', None),
+    'author': ('author__username', None),
+    'group': ('group__slug', None),
+    'image': ('image', image_url),
+    'comments_count': ('comments_count', None),
+}, keys=('pub_date', 'id'))
+
+COMMENTS = Resource({
+    'id': ('id', None),
+    'post': ('post_id', None),
+    'author': ('author__username', None),
+    'text': ('text', None),
+    'created': ('created', None),
+}, keys=('created', 'id'))
+
+GROUPS = Resource({
+    'id': ('id', None),
+    'title': ('title', None),
+    'slug': ('slug', None),
+    'description': ('description', None),
+})
+
+FOLLOWS = Resource({
+    'id': ('id', None),
+    'user': ('user__username', None),
+    'author': ('author__username', None),
+})
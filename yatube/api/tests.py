@@ -0,0 +1,196 @@
+import json
+from http import HTTPStatus
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+
+from posts import utils
+from posts.models import Comment, Follow, Group, Post
+
+from . import auth
+
+User = get_user_model()
+
+
+class ApiTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(
+            username='auth', password='пароль-для-теста')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Тестовая группа', slug='test_slug', description='')
+        cls.posts = [
+            Post.objects.create(
+                author=cls.user, group=cls.group, text=f'Публикация {number}')
+            for number in range(5)
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    def call(self, method, url, data=None, user=None, **extra):
+        if user is not None:
+            extra['HTTP_AUTHORIZATION'] = f'Bearer {auth.make_token(user)}'
+        if data is not None:
+            extra.update(data=json.dumps(data),
+                         content_type='application/json')
+        response = getattr(self.client, method)(url, **extra)
+        return response, response.json() if response.content else None
+
+    def test_post_list_pages_by_cursor_with_selected_fields(self):
+        """Список публикаций: курсор и выбор полей, страница — один запрос."""
+        url = reverse('api:post_list')
+        with self.assertNumQueries(1):
+            response, data = self.call(
+                'get', url, QUERY_STRING='fields=id,text&limit=2')
+        self.assertEqual(response.status_code, HTTPStatus.OK.value)
+        self.assertEqual(data['results'], [
+            {'id': post.pk, 'text': post.text}
+            for post in self.posts[:-3:-1]
+        ])
+        self.assertIsNone(data['previous'])
+        seen = [row['id'] for row in data['results']]
+        while data['next']:
+            _, data = self.call('get', data['next'])
+            self.assertEqual(set(data['results'][0]), {'id', 'text'})
+            seen.extend(row['id'] for row in data['results'])
+        self.assertEqual(seen, [post.pk for post in reversed(self.posts)])
+
+    def test_tampered_cursor_returns_first_page(self):
+        """Подделанный курсор в API даёт первую страницу, а не 500."""
+        urls = (reverse('api:post_list'),
+                reverse('api:comment_list', args=(self.posts[0].pk,)))
+        for url in urls:
+            for values in (['notadate', 1], [None, None], [{'a': 1}, 'x']):
+                cursor = utils.encode_cursor(values, utils.NEXT)
+                with self.subTest(url=url, values=values):
+                    response, data = self.call(
+                        'get', url, QUERY_STRING=f'cursor={cursor}')
+                    self.assertEqual(response.status_code,
+                                     HTTPStatus.OK.value)
+                    self.assertIsNone(data['previous'])
+
+    def test_batch_fetch_by_ids_keeps_requested_order(self):
+        """?ids= возвращает записи в порядке запроса одним запросом."""
+        ids = [self.posts[3].pk, 0, self.posts[1].pk]
+        with self.assertNumQueries(1):
+            _, data = self.call(
+                'get', reverse('api:post_list'),
+                QUERY_STRING='ids={}&fields=id,author,group'.format(
+                    ','.join(map(str, ids))))
+        self.assertEqual(data, {'results': [
+            {'id': self.posts[3].pk, 'author': 'auth', 'group': 'test_slug'},
+            {'id': self.posts[1].pk, 'author': 'auth', 'group': 'test_slug'},
+        ]})
+
+    def test_bad_parameters_are_rejected(self):
+        """Неизвестные поля и кривые ids дают 400 с описанием."""
+        for query in ('fields=id,password', 'ids=1,x'):
+            with self.subTest(query=query):
+                response, data = self.call(
+                    'get', reverse('api:post_list'), QUERY_STRING=query)
+                self.assertEqual(response.status_code,
+                                 HTTPStatus.BAD_REQUEST.value)
+                self.assertIn('detail', data)
+
+    def test_token_authorizes_writes(self):
+        """Токен выдаётся по паролю; запись без токена запрещена."""
+        response, data = self.call('post', reverse('api:token'), {
+            'username': 'auth', 'password': 'пароль-для-теста'})
+        self.assertEqual(response.status_code, HTTPStatus.OK.value)
+        url = reverse('api:post_list')
+        response, _ = self.call('post', url, {'text': 'Без токена'})
+        self.assertEqual(response.status_code, HTTPStatus.UNAUTHORIZED.value)
+        response, _ = self.call('post', url, {'text': 'С токеном'},
+                                HTTP_AUTHORIZATION=f'Bearer {data["token"]}')
+        self.assertEqual(response.status_code, HTTPStatus.CREATED.value)
+        response, _ = self.call('post', url, {'text': 'Чужой токен'},
+                                HTTP_AUTHORIZATION='Bearer испорчен')
+        self.assertEqual(response.status_code, HTTPStatus.UNAUTHORIZED.value)
+
+    def test_password_change_revokes_tokens(self):
+        """После смены пароля старый токен недействителен."""
+        user = User.objects.create_user(username='mobile', password='1')
+        token = auth.make_token(user)
+        self.assertEqual(auth.user_from_token(token), user)
+        user.set_password('2')
+        user.save()
+        self.assertIsNone(auth.user_from_token(token))
+
+    def test_post_create_edit_and_delete(self):
+        """Автор создаёт, правит и удаляет публикацию, чужой — нет."""
+        response, data = self.call(
+            'post', reverse('api:post_list'),
+            {'text': 'Новая публикация', 'group': 'test_slug'},
+            user=self.user)
+        self.assertEqual(response.status_code, HTTPStatus.CREATED.value)
+        self.assertEqual(
+            (data['text'], data['author'], data['group'], data['image']),
+            ('Новая публикация', 'auth', 'test_slug', None))
+        url = reverse('api:post_detail', args=(data['id'],))
+        response, _ = self.call(
+            'patch', url, {'text': 'Чужая правка'}, user=self.reader)
+        self.assertEqual(response.status_code, HTTPStatus.FORBIDDEN.value)
+        response, data = self.call(
+            'patch', url, {'text': 'Исправлено'}, user=self.user)
+        self.assertEqual((data['text'], data['group']),
+                         ('Исправлено', 'test_slug'))
+        for group in ('missing', True, 1, ['test_slug']):
+            with self.subTest(group=group):
+                response, _ = self.call(
+                    'patch', url, {'group': group}, user=self.user)
+                self.assertEqual(response.status_code,
+                                 HTTPStatus.BAD_REQUEST.value)
+        response, data = self.call(
+            'patch', url, {'group': None}, user=self.user)
+        self.assertIsNone(data['group'])
+        response, _ = self.call('delete', url, user=self.user)
+        self.assertEqual(response.status_code, HTTPStatus.NO_CONTENT.value)
+        self.assertFalse(Post.objects.filter(pk=data['id']).exists())
+
+    def test_comments_list_and_create(self):
+        """Комментарии поста: создание, список и 404 для чужого id."""
+        post = self.posts[0]
+        url = reverse('api:comment_list', args=(post.pk,))
+        response, data = self.call(
+            'post', url, {'text': 'Комментарий'}, user=self.reader)
+        self.assertEqual(response.status_code, HTTPStatus.CREATED.value)
+        self.assertEqual((data['post'], data['author'], data['text']),
+                         (post.pk, 'reader', 'Комментарий'))
+        _, data = self.call('get', url, QUERY_STRING='fields=text')
+        self.assertEqual(data['results'], [{'text': 'Комментарий'}])
+        self.assertEqual(Comment.objects.get().author, self.reader)
+        response, _ = self.call(
+            'get', reverse('api:comment_list', args=(0,)))
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND.value)
+
+    def test_groups_and_follows(self):
+        """Сообщества читаются всеми, подписки — по токену."""
+        _, data = self.call(
+            'get', reverse('api:group_detail', args=('test_slug',)))
+        self.assertEqual(data['title'], 'Тестовая группа')
+        _, data = self.call('get', reverse('api:group_list'))
+        self.assertEqual([row['slug'] for row in data['results']],
+                         ['test_slug'])
+        url = reverse('api:follow_list')
+        response, _ = self.call('get', url)
+        self.assertEqual(response.status_code, HTTPStatus.UNAUTHORIZED.value)
+        response, data = self.call(
+            'post', url, {'author': 'auth'}, user=self.reader)
+        self.assertEqual(response.status_code, HTTPStatus.CREATED.value)
+        self.assertEqual((data['user'], data['author']), ('reader', 'auth'))
+        response, _ = self.call(
+            'post', url, {'author': 'reader'}, user=self.reader)
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST.value)
+        _, data = self.call('get', url, user=self.reader)
+        self.assertEqual([row['author'] for row in data['results']],
+                         ['auth'])
+        response, _ = self.call(
+            'delete', reverse('api:follow_detail', args=('auth',)),
+            user=self.reader)
+        self.assertEqual(response.status_code, HTTPStatus.NO_CONTENT.value)
+        self.assertFalse(Follow.objects.exists())
@@ -0,0 +1,284 @@
+"""JSON API публикаций, сообществ, комментариев и подписок.
+
+Списки постраничные по курсору (``?cursor=``, ``?limit=``), поля ответа
+выбираются ``?fields=a,b``, а ``?ids=1,2,3`` возвращает записи по списку
+идентификаторов одним запросом. Запись требует токена из ``token/``.
+"""
+import json
+from functools import wraps
+
+from django.conf import settings
+from django.contrib.auth import authenticate
+from django.db import transaction
+from django.http import HttpResponse, JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+
+from posts.forms import CommentForm, PostForm
+from posts.models import Comment, Follow, Group, Post, User
+from posts.utils import KeysetPaginator
+
+from . import auth, serializers
+
+
+class ApiError(Exception):
+    def __init__(self, status, detail=None, errors=None):
+        super().__init__(detail)
+        self.status = status
+        self.data = {'detail': detail} if errors is None else {
+            'errors': errors}
+
+
+def respond(data, status=200):
+    return JsonResponse(data, status=status, json_dumps_params={
+        'ensure_ascii': False, 'separators': (',', ':')})
+
+
+def api_view(*methods):
+    """Декоратор: допустимые методы, токен и ошибки в формате JSON."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in methods:
+                response = respond(
+                    {'detail': 'Метод не поддерживается.'}, status=405)
+                response['Allow'] = ', '.join(methods)
+                return response
+            user = auth.authenticate(request)
+            if user is None:
+                response = respond(
+                    {'detail': 'Недействительный токен.'}, status=401)
+                response['WWW-Authenticate'] = 'Bearer'
+                return response
+            request.user = user
+            try:
+                return view(request, *args, **kwargs)
+            except ApiError as error:
+                return respond(error.data, status=error.status)
+        return csrf_exempt(wrapper)
+    return decorator
+
+
+def require_user(request):
+    if not request.user.is_authenticated:
+        raise ApiError(401, 'Нужен токен авторизации.')
+
+
+def parse_body(request):
+    if request.content_type != 'application/json':
+        return request.POST
+    try:
+        data = json.loads(request.body or b'{}')
+    except ValueError:
+        raise ApiError(400, 'Тело запроса — не JSON.')
+    if not isinstance(data, dict):
+        raise ApiError(400, 'Тело запроса должно быть объектом JSON.')
+    return data
+
+
+def requested_fields(request, resource):
+    try:
+        return resource.parse_fields(request.GET.get('fields'))
+    except ValueError as error:
+        raise ApiError(400, str(error))
+
+
+def requested_limit(request):
+    try:
+        limit = int(request.GET.get('limit', settings.API_PAGE_SIZE))
+    except ValueError:
+        raise ApiError(400, 'limit должен быть числом.')
+    return min(max(limit, 1), settings.API_MAX_PAGE_SIZE)
+
+
+def requested_ids(request):
+    try:
+        ids = [int(pk) for pk in request.GET['ids'].split(',') if pk]
+    except ValueError:
+        raise ApiError(400, 'ids — список чисел через запятую.')
+    if len(ids) > settings.API_MAX_PAGE_SIZE:
+        raise ApiError(
+            400, f'Не больше {settings.API_MAX_PAGE_SIZE} ids за запрос.')
+    return ids
+
+
+def page_link(request, cursor):
+    if cursor is None:
+        return None
+    params = request.GET.copy()
+    params['cursor'] = cursor
+    return f'{request.path}?{params.urlencode()}'
+
+
+def list_page(request, resource, queryset):
+    """Страница списка по курсору или записи по ``?ids=``."""
+    names = requested_fields(request, resource)
+    if 'ids' in request.GET:
+        ids = requested_ids(request)
+        rows = {
+            row['id']: row
+            for row in resource.rows(queryset.filter(pk__in=ids), names)
+        }
+        return {'results': [
+            resource.dump(rows[pk], names) for pk in ids if pk in rows]}
+    page = KeysetPaginator(
+        resource.rows(queryset, names), requested_limit(request),
+        resource.keys,
+    ).get_page(request.GET.get('cursor'))
+    return {
+        'results': [resource.dump(row, names) for row in page],
+        'next': page_link(request, page.next_cursor),
+        'previous': page_link(request, page.previous_cursor),
+    }
+
+
+def object_response(request, resource, queryset, status=200, **lookup):
+    names = requested_fields(request, resource)
+    row = resource.rows(queryset.filter(**lookup), names).first()
+    if row is None:
+        raise ApiError(404, 'Не найдено.')
+    return respond(resource.dump(row, names), status=status)
+
+
+def post_form_data(data, post=None):
+    """Данные PostForm: сообщество передаётся slug, как в ответах API."""
+    form_data = {'text': post.text, 'group': post.group_id} if post else {}
+    if 'text' in data:
+        form_data['text'] = data['text']
+    slug = data.get('group')
+    if slug is not None and not isinstance(slug, str):
+        # Иначе true из JSON дошло бы до формы как pk 1.
+        raise ApiError(400, errors={'group': ['Нужен slug сообщества.']})
+    if slug:
+        form_data['group'] = Group.objects.filter(slug=slug).values_list(
+            'pk', flat=True).first()
+        if form_data['group'] is None:
+            raise ApiError(400, errors={'group': ['Сообщество не найдено.']})
+    elif 'group' in data:
+        form_data['group'] = None
+    return form_data
+
+
+@api_view('POST')
+def token(request):
+    """Токен по имени и паролю."""
+    data = parse_body(request)
+    user = authenticate(request, username=data.get('username'),
+                        password=data.get('password'))
+    if user is None:
+        raise ApiError(400, 'Неверное имя пользователя или пароль.')
+    return respond({'token': auth.make_token(user)})
+
+
+@api_view('GET', 'POST')
+def post_list(request):
+    if request.method == 'POST':
+        require_user(request)
+        form = PostForm(post_form_data(parse_body(request)),
+                        files=request.FILES or None)
+        if not form.is_valid():
+            raise ApiError(400, errors=form.errors)
+        with transaction.atomic():
+            post = form.save(commit=False)
+            post.author = request.user
+            post.save()
+        return object_response(
+            request, serializers.POSTS, Post.objects, status=201,
+            pk=post.pk)
+    posts = Post.objects.all()
+    if 'group' in request.GET:
+        posts = posts.filter(group__slug=request.GET['group'])
+    if 'author' in request.GET:
+        posts = posts.filter(author__username=request.GET['author'])
+    return respond(list_page(request, serializers.POSTS, posts))
+
+
+@api_view('GET', 'PATCH', 'DELETE')
+def post_detail(request, post_id):
+    if request.method == 'GET':
+        return object_response(
+            request, serializers.POSTS, Post.objects, pk=post_id)
+    require_user(request)
+    post = Post.objects.filter(pk=post_id).first()
+    if post is None:
+        raise ApiError(404, 'Не найдено.')
+    if post.author_id != request.user.pk:
+        raise ApiError(403, 'Изменять публикацию может только автор.')
+    if request.method == 'DELETE':
+        post.delete()
+        return HttpResponse(status=204)
+    form = PostForm(post_form_data(parse_body(request), post), instance=post)
+    if not form.is_valid():
+        raise ApiError(400, errors=form.errors)
+    form.save()
+    return object_response(
+        request, serializers.POSTS, Post.objects, pk=post_id)
+
+
+@api_view('GET', 'POST')
+def comment_list(request, post_id):
+    if request.method == 'POST':
+        require_user(request)
+        if not Post.objects.filter(pk=post_id).exists():
+            raise ApiError(404, 'Не найдено.')
+        form = CommentForm(parse_body(request))
+        if not form.is_valid():
+            raise ApiError(400, errors=form.errors)
+        with transaction.atomic():
+            comment = form.save(commit=False)
+            comment.author = request.user
+            comment.post_id = post_id
+            comment.save()
+        return object_response(
+            request, serializers.COMMENTS, Comment.objects, status=201,
+            pk=comment.pk)
+    page = list_page(request, serializers.COMMENTS,
+                     Comment.objects.filter(post_id=post_id))
+    # Пустой список — единственный случай, когда пост надо проверить.
+    if not page['results'] and not Post.objects.filter(
+            pk=post_id).exists():
+        raise ApiError(404, 'Не найдено.')
+    return respond(page)
+
+
+@api_view('GET')
+def group_list(request):
+    return respond(
+        list_page(request, serializers.GROUPS, Group.objects.all()))
+
+
+@api_view('GET')
+def group_detail(request, slug):
+    return object_response(
+        request, serializers.GROUPS, Group.objects, slug=slug)
+
+
+@api_view('GET', 'POST')
+def follow_list(request):
+    """Подписки пользователя токена."""
+    require_user(request)
+    follows = Follow.objects.filter(user=request.user)
+    if request.method == 'GET':
+        return respond(list_page(request, serializers.FOLLOWS, follows))
+    author = User.objects.filter(
+        username=parse_body(request).get('author')).first()
+    if author is None:
+        raise ApiError(400, errors={'author': ['Автор не найден.']})
+    if author == request.user:
+        raise ApiError(
+            400, errors={'author': ['Нельзя подписаться на себя.']})
+    with transaction.atomic():
+        follow, created = Follow.objects.get_or_create(
+            user=request.user, author=author)
+    return object_response(
+        request, serializers.FOLLOWS, follows,
+        status=201 if created else 200, pk=follow.pk)
+
+
+@api_view('DELETE')
+def follow_detail(request, username):
+    require_user(request)
+    deleted, _ = Follow.objects.filter(
+        user=request.user, author__username=username).delete()
+    if not deleted:
+        raise ApiError(404, 'Не найдено.')
+    return HttpResponse(status=204)
@@ -3,3 +3,10 @@ from django.apps import AppConfig
 
 class CoreConfig(AppConfig):
     name = 'core'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+
+        from . import metrics, sqlite
+        metrics.instrument_templates()
+        connection_created.connect(sqlite.configure_connection)
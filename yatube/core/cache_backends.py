@@ -0,0 +1,284 @@
+"""Общие для всех процессов бэкенды кэша.
+
+``LocMemCache`` у каждого воркера свой: фрагменты прогреваются в каждом
+процессе заново, а версии ``posts.cache``, которые меняют сигналы,
+расходятся между воркерами. Здесь собраны бэкенды общего уровня:
+
+* ``SQLiteCache`` — файл SQLite на узле, для одного сервера без
+  отдельной службы кэша (для нескольких серверов — memcached, бэкенд
+  Django ``MemcachedCache``);
+* ``TwoLevelCache`` — небольшой кэш в памяти процесса (L1) перед общим
+  (L2).
+
+В L1 попадают только ключи с префиксами ``LOCAL_PREFIXES``. Это ключи,
+значение которых по ключу не меняется: в них входит версия данных
+(карточки ``card:``, фрагменты ``template.cache.``). Версии ``ver:``,
+блокировки ``lock:`` и страницы ``page:`` всегда читаются из L2, иначе
+сброс в одном процессе не увидели бы остальные.
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.cache.backends.locmem import LocMemCache
+
+SQLITE_SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS cache ('
+    'key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL'
+    ') WITHOUT ROWID',
+    'CREATE INDEX IF NOT EXISTS cache_expires ON cache (expires)',
+)
+# Параметров в одном запросе SQLite не больше 999.
+SQLITE_CHUNK = 500
+# Проверка переполнения раз на столько записей, а не на каждую.
+SQLITE_CULL_EVERY = 100
+
+
+class SQLiteCache(BaseCache):
+    """Кэш в файле SQLite, общий для процессов одного узла.
+
+    WAL позволяет читать, пока другой процесс пишет. ``add`` — один
+    атомарный upsert, поэтому блокировки ``lock:`` работают между
+    воркерами. Соединение своё у каждого потока и процесса.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        self._path = location
+        self._local = threading.local()
+        self._writes = 0
+
+    @property
+    def _db(self):
+        db = getattr(self._local, 'db', None)
+        if db is None or self._local.pid != os.getpid():
+            if not os.path.exists(self._path):
+                # В файле pickle: читать и писать его может только
+                # владелец процесса.
+                os.makedirs(os.path.dirname(self._path) or '.',
+                            exist_ok=True)
+                os.close(os.open(self._path, os.O_CREAT | os.O_WRONLY,
+                                 0o600))
+            db = sqlite3.connect(
+                self._path, timeout=5, isolation_level=None,
+                check_same_thread=False)
+            db.execute('PRAGMA journal_mode = WAL')
+            db.execute('PRAGMA synchronous = NORMAL')
+            for statement in SQLITE_SCHEMA:
+                db.execute(statement)
+            self._local.db, self._local.pid = db, os.getpid()
+        return db
+
+    def get_backend_timeout(self, timeout=DEFAULT_TIMEOUT):
+        """Момент истечения (time.time()) или None — без срока."""
+        if timeout == DEFAULT_TIMEOUT:
+            timeout = self.default_timeout
+        return None if timeout is None else time.time() + timeout
+
+    def _rows(self, keys):
+        """Неистёкшие значения по готовым ключам."""
+        now = time.time()
+        found = {}
+        for start in range(0, len(keys), SQLITE_CHUNK):
+            chunk = keys[start:start + SQLITE_CHUNK]
+            rows = self._db.execute(
+                'SELECT key, value FROM cache WHERE key IN ({}) '
+                'AND (expires IS NULL OR expires > ?)'.format(
+                    ', '.join('?' * len(chunk))),
+                (*chunk, now))
+            found.update(
+                (key, pickle.loads(value)) for key, value in rows)
+        return found
+
+    def get(self, key, default=None, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return self._rows([key]).get(key, default)
+
+    def get_many(self, keys, version=None):
+        key_map = {self.make_key(key, version=version): key for key in keys}
+        for key in key_map:
+            self.validate_key(key)
+        return {
+            key_map[key]: value
+            for key, value in self._rows(list(key_map)).items()
+        }
+
+    def _write(self, rows):
+        self._db.executemany(
+            'INSERT OR REPLACE INTO cache (key, value, expires) '
+            'VALUES (?, ?, ?)', rows)
+        self._writes += len(rows)
+        if self._writes >= SQLITE_CULL_EVERY:
+            self._writes = 0
+            self._cull()
+
+    def _row(self, key, value, timeout, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return (key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL),
+                self.get_backend_timeout(timeout))
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self._write([self._row(key, value, timeout, version)])
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        rows = [self._row(key, value, timeout, version)
+                for key, value in data.items()]
+        with self._db:
+            self._db.execute('BEGIN')
+            self._write(rows)
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        # Существующая запись заменяется, только если она истекла.
+        cursor = self._db.execute(
+            'INSERT INTO cache (key, value, expires) VALUES (?, ?, ?) '
+            'ON CONFLICT (key) DO UPDATE SET value = excluded.value, '
+            'expires = excluded.expires '
+            'WHERE cache.expires IS NOT NULL AND cache.expires <= ?',
+            (*self._row(key, value, timeout, version), time.time()))
+        return cursor.rowcount == 1
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        cursor = self._db.execute(
+            'UPDATE cache SET expires = ? WHERE key = ? '
+            'AND (expires IS NULL OR expires > ?)',
+            (self.get_backend_timeout(timeout), key, time.time()))
+        return cursor.rowcount == 1
+
+    def has_key(self, key, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key in self._rows([key])
+
+    def delete(self, key, version=None):
+        self.delete_many([key], version=version)
+
+    def delete_many(self, keys, version=None):
+        keys = [self.make_key(key, version=version) for key in keys]
+        self._db.executemany(
+            'DELETE FROM cache WHERE key = ?', [(key,) for key in keys])
+
+    def clear(self):
+        self._db.execute('DELETE FROM cache')
+
+    def _cull(self):
+        """Удаляет истёкшие записи, а при переполнении — каждую
+        ``cull_frequency``-ю запись с ближайшим сроком.
+        """
+        db = self._db
+        db.execute('DELETE FROM cache WHERE expires <= ?', (time.time(),))
+        count = db.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+        if count > self._max_entries:
+            db.execute(
+                'DELETE FROM cache WHERE key IN (SELECT key FROM cache '
+                'ORDER BY expires IS NULL, expires LIMIT ?)',
+                (max(count // self._cull_frequency, 1),))
+
+
+class TwoLevelCache(BaseCache):
+    """Кэш процесса (L1) перед общим кэшем ``SHARED`` (L2).
+
+    OPTIONS: ``SHARED`` — псевдоним общего кэша в CACHES,
+    ``LOCAL_PREFIXES`` — префиксы неизменяемых ключей для L1,
+    ``LOCAL_TIMEOUT`` и ``LOCAL_MAX_ENTRIES`` — срок и размер L1.
+    Префикс и версию ключей задаёт общий кэш.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._shared_alias = options['SHARED']
+        self._local_prefixes = tuple(options.get('LOCAL_PREFIXES', ()))
+        self._local_timeout = options.get('LOCAL_TIMEOUT', 60)
+        # Экземпляры LocMemCache с одним LOCATION делят хранилище, так что
+        # L1 общий для потоков процесса.
+        self._l1 = LocMemCache(location or 'two-level', {
+            'TIMEOUT': self._local_timeout,
+            'OPTIONS': {
+                'MAX_ENTRIES': options.get('LOCAL_MAX_ENTRIES', 1000),
+            },
+        })
+
+    @property
+    def _l2(self):
+        return caches[self._shared_alias]
+
+    def _is_local(self, key):
+        return key.startswith(self._local_prefixes)
+
+    def _local_expiry(self, timeout):
+        if timeout == DEFAULT_TIMEOUT or timeout is None:
+            return self._local_timeout
+        return min(timeout, self._local_timeout)
+
+    def get(self, key, default=None, version=None):
+        return self.get_many([key], version=version).get(key, default)
+
+    def get_many(self, keys, version=None):
+        local = [key for key in keys if self._is_local(key)]
+        found = self._l1.get_many(local, version=version) if local else {}
+        missing = [key for key in keys if key not in found]
+        if missing:
+            shared = self._l2.get_many(missing, version=version)
+            fill = {key: value for key, value in shared.items()
+                    if self._is_local(key)}
+            if fill:
+                self._l1.set_many(
+                    fill, self._local_timeout, version=version)
+            found.update(shared)
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.set_many({key: value}, timeout, version=version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        local = {key: value for key, value in data.items()
+                 if self._is_local(key)}
+        if local:
+            self._l1.set_many(
+                local, self._local_expiry(timeout), version=version)
+        return self._l2.set_many(data, timeout, version=version)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        added = self._l2.add(key, value, timeout, version=version)
+        if added and self._is_local(key):
+            self._l1.set(
+                key, value, self._local_expiry(timeout), version=version)
+        return added
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self._l2.touch(key, timeout, version=version)
+
+    def has_key(self, key, version=None):
+        if self._is_local(key) and self._l1.has_key(key, version=version):
+            return True
+        return self._l2.has_key(key, version=version)
+
+    def delete(self, key, version=None):
+        self.delete_many([key], version=version)
+
+    def delete_many(self, keys, version=None):
+        keys = list(keys)
+        self._l1.delete_many(keys, version=version)
+        self._l2.delete_many(keys, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        return self._l2.incr(key, delta, version=version)
+
+    def decr(self, key, delta=1, version=None):
+        return self._l2.decr(key, delta, version=version)
+
+    def clear(self):
+        self._l1.clear()
+        self._l2.clear()
+
+    def close(self, **kwargs):
+        self._l2.close(**kwargs)
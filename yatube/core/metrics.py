@@ -0,0 +1,243 @@
+"""Метрики производительности запросов в памяти процесса.
+
+``PerformanceMiddleware`` для доли запросов ``PERF_SAMPLE_RATE`` снимает
+время ответа, число и время SQL-запросов, время отрисовки шаблонов,
+попадания и промахи кэша фрагментов и вызовы построения миниатюр.
+Значения складываются в гистограммы с фиксированными границами (как в
+Prometheus), так что запись — несколько сложений под блокировкой.
+Счётчик запросов ведётся для всех запросов, без выборки.
+
+Данные свои у каждого процесса: при нескольких воркерах Prometheus
+опрашивает каждый из них.
+"""
+import bisect
+import random
+import threading
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+TIME_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5,
+                5, 10)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+HELP = {
+    'yatube_requests_total': 'Обработано запросов.',
+    'yatube_sampled_requests_total': 'Запросов попало в выборку.',
+    'yatube_request_duration_seconds': 'Время ответа.',
+    'yatube_db_queries': 'SQL-запросов на запрос.',
+    'yatube_db_duration_seconds': 'Время SQL-запросов на запрос.',
+    'yatube_template_duration_seconds': 'Время отрисовки шаблонов.',
+    'yatube_cache_total': 'Обращения к кэшу фрагментов.',
+    'yatube_thumbnail_calls_total': 'Построений миниатюр.',
+}
+
+_lock = threading.Lock()
+_counters = {}
+_histograms = {}
+_local = threading.local()
+
+
+class Histogram:
+    __slots__ = ('bounds', 'buckets', 'sum', 'count')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.buckets = [0] * (len(bounds) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.buckets[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+def inc(name, amount=1, **labels):
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+
+def observe(name, value, bounds=TIME_BUCKETS, **labels):
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = Histogram(bounds)
+        histogram.observe(value)
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+
+
+class RequestMetrics:
+    """Показатели одного запроса из выборки."""
+    __slots__ = ('queries', 'db_time', 'template_time', 'template_depth',
+                 'cache_hits', 'cache_misses', 'thumbnails')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.template_depth = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.thumbnails = 0
+
+
+def current():
+    """Показатели текущего запроса или None вне выборки."""
+    return getattr(_local, 'request', None)
+
+
+def record_cache(hit):
+    metrics = current()
+    if metrics is not None:
+        if hit:
+            metrics.cache_hits += 1
+        else:
+            metrics.cache_misses += 1
+
+
+def record_thumbnail():
+    metrics = current()
+    if metrics is not None:
+        metrics.thumbnails += 1
+    else:
+        inc('yatube_thumbnail_calls_total', view='background')
+
+
+def _time_query(execute, sql, params, many, context):
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics = current()
+        if metrics is not None:
+            metrics.queries += 1
+            metrics.db_time += time.perf_counter() - started
+
+
+def instrument_templates():
+    """Оборачивает отрисовку шаблонов Django замером времени.
+
+    Вложенные шаблоны (include, карточки) входят во время внешнего.
+    """
+    from django.template.backends.django import Template
+
+    render = Template.render
+    if getattr(render, 'instrumented', False):
+        return
+
+    def timed_render(self, context=None, request=None):
+        metrics = current()
+        if metrics is None:
+            return render(self, context, request)
+        metrics.template_depth += 1
+        started = time.perf_counter()
+        try:
+            return render(self, context, request)
+        finally:
+            metrics.template_depth -= 1
+            if not metrics.template_depth:
+                metrics.template_time += time.perf_counter() - started
+
+    timed_render.instrumented = True
+    Template.render = timed_render
+
+
+class PerformanceMiddleware:
+    """Замеряет запросы из выборки и пишет их в гистограммы по view."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        rate = settings.PERF_SAMPLE_RATE
+        if rate <= 0 or (rate < 1 and random.random() >= rate):
+            response = self.get_response(request)
+            inc('yatube_requests_total', view=self.view_name(request))
+            return response
+        metrics = _local.request = RequestMetrics()
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(_time_query))
+                response = self.get_response(request)
+        finally:
+            _local.request = None
+        elapsed = time.perf_counter() - started
+        view = self.view_name(request)
+        inc('yatube_requests_total', view=view)
+        inc('yatube_sampled_requests_total', view=view)
+        observe('yatube_request_duration_seconds', elapsed, view=view)
+        observe('yatube_db_queries', metrics.queries, COUNT_BUCKETS,
+                view=view)
+        observe('yatube_db_duration_seconds', metrics.db_time, view=view)
+        observe('yatube_template_duration_seconds', metrics.template_time,
+                view=view)
+        if metrics.cache_hits:
+            inc('yatube_cache_total', metrics.cache_hits, view=view,
+                result='hit')
+        if metrics.cache_misses:
+            inc('yatube_cache_total', metrics.cache_misses, view=view,
+                result='miss')
+        if metrics.thumbnails:
+            inc('yatube_thumbnail_calls_total', metrics.thumbnails,
+                view=view)
+        return response
+
+    @staticmethod
+    def view_name(request):
+        match = getattr(request, 'resolver_match', None)
+        return match.view_name if match else 'unresolved'
+
+
+def _labels(labels, **extra):
+    pairs = [*labels, *extra.items()]
+    if not pairs:
+        return ''
+    escaped = (
+        (key, str(value).replace('\\', r'\\').replace('"', r'\"'))
+        for key, value in pairs)
+    return '{' + ','.join(f'{key}="{value}"' for key, value in escaped) + '}'
+
+
+def render():
+    """Все метрики процесса в текстовом формате Prometheus."""
+    with _lock:
+        counters = sorted(_counters.items())
+        histograms = sorted(
+            (key, (histogram.bounds, list(histogram.buckets),
+                   histogram.sum, histogram.count))
+            for key, histogram in _histograms.items())
+    lines = []
+    described = set()
+
+    def describe(name, kind):
+        if name not in described:
+            described.add(name)
+            lines.append(f'# HELP {name} {HELP.get(name, name)}')
+            lines.append(f'# TYPE {name} {kind}')
+
+    for (name, labels), value in counters:
+        describe(name, 'counter')
+        lines.append(f'{name}{_labels(labels)} {value}')
+    for (name, labels), (bounds, buckets, total, count) in histograms:
+        describe(name, 'histogram')
+        cumulative = 0
+        for bound, observed in zip((*bounds, '+Inf'), buckets):
+            cumulative += observed
+            lines.append(
+                f'{name}_bucket{_labels(labels, le=bound)} {cumulative}')
+        lines.append(f'{name}_sum{_labels(labels)} {total}')
+        lines.append(f'{name}_count{_labels(labels)} {count}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,71 @@
+"""Маршрутизация запросов между основной базой и репликами.
+
+Запись всегда идёт в ``default``. С реплик читают только безопасные
+(GET, HEAD) запросы к представлениям из ``READ_REPLICA_VIEWS``; всё
+остальное — формы, админка, команды, фоновые потоки — читает с основной
+базы. После записи ``ReplicaRoutingMiddleware`` ставит пользователю cookie
+на ``PRIMARY_STICKINESS_SECONDS``: пока она жива, его чтения тоже идут на
+основную базу, и после редиректа из ``post_create`` он видит свой пост.
+Записью считается небезопасный метод или любой запрос, для которого
+роутер выбирал базу записи: подписка пишет и на GET.
+"""
+import random
+import threading
+
+from django.conf import settings
+
+STICKY_COOKIE = 'use_primary'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_local = threading.local()
+
+
+def replicas_allowed():
+    return getattr(_local, 'replicas_allowed', False)
+
+
+def request_wrote():
+    return getattr(_local, 'wrote', False)
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if settings.DATABASE_REPLICAS and replicas_allowed():
+            return random.choice(settings.DATABASE_REPLICAS)
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        _local.wrote = True
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
+
+
+class ReplicaRoutingMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        _local.wrote = False
+        try:
+            response = self.get_response(request)
+        finally:
+            _local.replicas_allowed = False
+        if settings.DATABASE_REPLICAS and (
+                request.method not in SAFE_METHODS or request_wrote()):
+            response.set_cookie(
+                STICKY_COOKIE, '1',
+                max_age=settings.PRIMARY_STICKINESS_SECONDS, httponly=True)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        _local.replicas_allowed = (
+            request.method in SAFE_METHODS
+            and STICKY_COOKIE not in request.COOKIES
+            and request.resolver_match.view_name
+            in settings.READ_REPLICA_VIEWS
+        )
@@ -0,0 +1,102 @@
+"""Режим повышенной конкурентности для SQLite на одном узле.
+
+Включается ``SQLITE_CONCURRENCY``. Каждое новое соединение получает
+``SQLITE_PRAGMAS``: WAL-журнал (читатели не ждут писателя), ``synchronous
+= NORMAL`` (fsync только при checkpoint), ``mmap_size`` и
+``busy_timeout``.
+
+WAL допускает одного писателя. Запись, начатая в транзакции после
+чтения, не ждёт ``busy_timeout``, а сразу падает с ``database is
+locked``. Поэтому ``WriteQueueMiddleware`` пропускает небезопасные
+запросы (POST и т. п.) по одному через блокировку файла ``flock``. Она
+общая для потоков и процессов gunicorn, и запросы ждут своей очереди
+вместо ошибки. Представления, которые пишут и на GET, отмечаются
+декоратором ``queued_write``.
+"""
+import threading
+from contextlib import contextmanager
+from functools import wraps
+from urllib.parse import unquote, urlsplit
+
+from django.conf import settings
+from django.db import connections
+
+try:
+    import fcntl
+except ImportError:  # Windows: очередь только внутри процесса.
+    fcntl = None
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_thread_lock = threading.Lock()
+
+
+def enabled(using='default'):
+    return (settings.SQLITE_CONCURRENCY
+            and connections[using].vendor == 'sqlite')
+
+
+def configure_connection(sender, connection, **kwargs):
+    """Обработчик connection_created: выставляет PRAGMA соединения."""
+    if connection.vendor != 'sqlite' or not settings.SQLITE_CONCURRENCY:
+        return
+    pragmas = dict(settings.SQLITE_PRAGMAS)
+    if connection.is_in_memory_db():
+        pragmas.pop('journal_mode', None)
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+
+
+def database_path(name):
+    """Путь к файлу базы: NAME бывает URI ``file:…?cache=shared``."""
+    if name.startswith('file:'):
+        return unquote(urlsplit(name).path)
+    return name
+
+
+def lock_path(using='default'):
+    return settings.SQLITE_WRITE_LOCK or '{}.write-lock'.format(
+        database_path(connections[using].settings_dict['NAME']))
+
+
+@contextmanager
+def write_lock(using='default'):
+    """Эксклюзивная очередь на запись в базу для потоков и процессов."""
+    if fcntl is None:
+        with _thread_lock:
+            yield
+        return
+    with open(lock_path(using), 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def queued_write(view):
+    """Ставит в очередь записи и безопасные запросы к представлению,
+    которое пишет в базу: middleware пропускает GET без очереди.
+    Применяется снаружи ``transaction.atomic``.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.method not in SAFE_METHODS or not enabled():
+            return view(request, *args, **kwargs)
+        with write_lock():
+            return view(request, *args, **kwargs)
+    return wrapper
+
+
+class WriteQueueMiddleware:
+    """Выполняет небезопасные запросы по одному, если включён режим."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if request.method in SAFE_METHODS or not enabled():
+            return self.get_response(request)
+        with write_lock():
+            return self.get_response(request)
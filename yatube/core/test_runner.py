@@ -0,0 +1,26 @@
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class TestRunner(DiscoverRunner):
+    """Тесты выполняют фоновые задачи сразу, как Django подменяет
+    почтовый бэкенд на locmem, а общий кэш держат в памяти процесса:
+    ``cache.clear()`` тестов не должен сбрасывать кэш запущенного
+    сервера.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._test_settings = override_settings(
+            JOBS_BACKEND='jobs.backends.ImmediateBackend',
+            CACHES={**settings.CACHES, 'shared': {
+                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                'LOCATION': 'yatube-tests',
+            }},
+        )
+        self._test_settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._test_settings.disable()
+        super().teardown_test_environment(**kwargs)
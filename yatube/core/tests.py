@@ -0,0 +1,386 @@
+import os
+import socketserver
+import tempfile
+import threading
+import time
+from http import HTTPStatus
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache, caches
+from django.core.cache.backends.memcached import MemcachedCache
+from django.db import connection
+from django.db.backends.sqlite3.base import DatabaseWrapper
+from django.http import HttpResponse
+from django.test import (override_settings, RequestFactory, SimpleTestCase,
+                         TestCase)
+from django.urls import resolve, reverse
+
+from posts.models import Post
+
+from . import cache_backends, metrics, routers, sqlite
+
+User = get_user_model()
+
+
+class PerformanceMetricsTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        Post.objects.create(author=cls.user, text='Тестовая публикация')
+
+    def setUp(self):
+        metrics.reset()
+        cache.clear()
+
+    def export(self):
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, HTTPStatus.OK.value)
+        return response.content.decode()
+
+    @override_settings(PERF_SAMPLE_RATE=1)
+    def test_sampled_request_recorded_per_view(self):
+        """Запрос из выборки пишет время, SQL, шаблоны и кэш по имени
+        view.
+        """
+        self.client.get(reverse('posts:index'))
+        self.client.get(reverse('posts:index'))
+        text = self.export()
+        for line in (
+            'yatube_requests_total{view="posts:index"} 2',
+            'yatube_sampled_requests_total{view="posts:index"} 2',
+            'yatube_request_duration_seconds_count{view="posts:index"} 2',
+            'yatube_db_queries_bucket{view="posts:index",le="+Inf"} 2',
+            'yatube_template_duration_seconds_count{view="posts:index"} 2',
+            'yatube_cache_total{result="hit",view="posts:index"}',
+            'yatube_cache_total{result="miss",view="posts:index"}',
+        ):
+            with self.subTest(line=line):
+                self.assertIn(line, text)
+
+    @override_settings(PERF_SAMPLE_RATE=0)
+    def test_unsampled_request_only_counted(self):
+        """Запрос вне выборки только увеличивает счётчик."""
+        self.client.get(reverse('posts:index'))
+        text = self.export()
+        self.assertIn('yatube_requests_total{view="posts:index"} 1', text)
+        self.assertNotIn('yatube_request_duration_seconds', text)
+
+    def test_histogram_buckets_are_cumulative(self):
+        """Корзины гистограммы накопительные, сумма и число верны."""
+        for value in (0.002, 0.02, 20):
+            metrics.observe('yatube_request_duration_seconds', value,
+                            view='test')
+        text = metrics.render()
+        for line in (
+            'yatube_request_duration_seconds_bucket'
+            '{view="test",le="0.001"} 0',
+            'yatube_request_duration_seconds_bucket'
+            '{view="test",le="0.005"} 1',
+            'yatube_request_duration_seconds_bucket'
+            '{view="test",le="0.025"} 2',
+            'yatube_request_duration_seconds_bucket'
+            '{view="test",le="+Inf"} 3',
+            'yatube_request_duration_seconds_count{view="test"} 3',
+        ):
+            with self.subTest(line=line):
+                self.assertIn(line, text)
+
+    @override_settings(INTERNAL_IPS=[])
+    def test_metrics_hidden_from_external_addresses(self):
+        """Метрики недоступны с адресов не из INTERNAL_IPS."""
+        self.assertEqual(self.client.get(reverse('metrics')).status_code,
+                         HTTPStatus.FORBIDDEN.value)
+
+    def test_metrics_hidden_behind_proxy(self):
+        """Без токена запрос через прокси не получает метрики, даже
+        если адрес прокси — из INTERNAL_IPS.
+        """
+        response = self.client.get(reverse('metrics'),
+                                   HTTP_X_FORWARDED_FOR='203.0.113.7')
+        self.assertEqual(response.status_code, HTTPStatus.FORBIDDEN.value)
+
+    @override_settings(METRICS_TOKEN='секрет', INTERNAL_IPS=[])
+    def test_metrics_token_required_when_set(self):
+        """С METRICS_TOKEN метрики отдаются только по токену."""
+        cases = {
+            '': HTTPStatus.FORBIDDEN,
+            'Bearer чужой': HTTPStatus.FORBIDDEN,
+            'Bearer секрет': HTTPStatus.OK,
+        }
+        for header, status in cases.items():
+            with self.subTest(header=header):
+                response = self.client.get(
+                    reverse('metrics'), HTTP_AUTHORIZATION=header,
+                    HTTP_X_FORWARDED_FOR='203.0.113.7')
+                self.assertEqual(response.status_code, status.value)
+
+
+@override_settings(DATABASE_REPLICAS=['replica1', 'replica2'])
+class ReplicaRoutingTests(TestCase):
+    def route(self, method, url, cookies=None):
+        """Какую базу роутер выберет для чтения внутри представления."""
+        request = getattr(RequestFactory(), method)(url)
+        request.COOKIES.update(cookies or {})
+        request.resolver_match = resolve(url)
+        chosen = []
+
+        def view(request):
+            chosen.append(routers.PrimaryReplicaRouter().db_for_read(Post))
+            return HttpResponse()
+
+        middleware = routers.ReplicaRoutingMiddleware(view)
+        middleware.process_view(request, view, (), {})
+        response = middleware(request)
+        return chosen[0], response
+
+    def test_read_views_use_replicas(self):
+        """Чтения представлений из READ_REPLICA_VIEWS идут на реплики."""
+        user = User.objects.create_user(username='auth')
+        for url in (reverse('posts:index'),
+                    reverse('posts:profile', args=(user.username,))):
+            with self.subTest(url=url):
+                self.assertIn(self.route('get', url)[0],
+                              ('replica1', 'replica2'))
+
+    def test_writes_and_other_views_use_primary(self):
+        """Запись, POST и прочие представления читают с основной базы."""
+        self.assertEqual(
+            routers.PrimaryReplicaRouter().db_for_write(Post), 'default')
+        self.assertEqual(
+            self.route('get', reverse('posts:post_create'))[0], 'default')
+        self.assertEqual(
+            self.route('post', reverse('posts:post_create'))[0], 'default')
+        self.assertEqual(routers.PrimaryReplicaRouter().db_for_read(Post),
+                         'default')
+
+    def test_write_pins_user_to_primary(self):
+        """После записи чтения пользователя идут на основную базу."""
+        _, response = self.route('post', reverse('posts:post_create'))
+        cookie = response.cookies[routers.STICKY_COOKIE]
+        self.assertEqual(cookie['max-age'],
+                         settings.PRIMARY_STICKINESS_SECONDS)
+        self.assertEqual(
+            self.route('get', reverse('posts:index'),
+                       {routers.STICKY_COOKIE: cookie.value})[0],
+            'default')
+
+    def test_get_write_pins_user_to_primary(self):
+        """Подписка по GET тоже закрепляет пользователя за основной
+        базой, а чтение без записи — нет.
+        """
+        author = User.objects.create_user(username='auth')
+        self.client.force_login(User.objects.create_user(username='reader'))
+        response = self.client.get(
+            reverse('posts:profile_follow', args=(author.username,)))
+        self.assertIn(routers.STICKY_COOKIE, response.cookies)
+        response = self.client.get(reverse('posts:follow_index'))
+        self.assertNotIn(routers.STICKY_COOKIE, response.cookies)
+
+
+class SQLiteConcurrencyTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    @override_settings(SQLITE_CONCURRENCY=True)
+    def test_new_connections_use_wal_pragmas(self):
+        """Новое соединение с файлом базы получает WAL и PRAGMA."""
+        wrapper = DatabaseWrapper({
+            **connection.settings_dict,
+            'NAME': os.path.join(self.directory.name, 'db.sqlite3'),
+        }, alias='wal_test')
+        self.addCleanup(wrapper.close)
+        with wrapper.cursor() as cursor:
+            pragmas = {}
+            for name in ('journal_mode', 'synchronous', 'busy_timeout',
+                         'mmap_size'):
+                cursor.execute(f'PRAGMA {name}')
+                pragmas[name] = cursor.fetchone()[0]
+        self.assertEqual(pragmas, {
+            'journal_mode': 'wal',
+            'synchronous': 1,
+            'busy_timeout': settings.SQLITE_PRAGMAS['busy_timeout'],
+            'mmap_size': settings.SQLITE_PRAGMAS['mmap_size'],
+        })
+
+    def test_write_lock_serializes_writers(self):
+        """Очередь записи не пускает два запроса одновременно."""
+        events = []
+
+        def write():
+            with sqlite.write_lock():
+                events.append('enter')
+                time.sleep(0.02)
+                events.append('exit')
+
+        with override_settings(SQLITE_WRITE_LOCK=os.path.join(
+                self.directory.name, 'write-lock')):
+            threads = [threading.Thread(target=write) for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(events, ['enter', 'exit'] * 4)
+
+    @override_settings(SQLITE_CONCURRENCY=True, SQLITE_WRITE_LOCK='')
+    def test_write_lock_next_to_shared_cache_database(self):
+        """С SQLITE_SHARED_CACHE блокировка лежит рядом с файлом базы,
+        а не по пути из URI, и POST проходит очередь записи.
+        """
+        path = os.path.join(self.directory.name, 'db.sqlite3')
+        settings_dict = connection.settings_dict
+        name = settings_dict['NAME']
+        settings_dict['NAME'] = f'file:{path}?cache=shared'
+        self.addCleanup(settings_dict.__setitem__, 'NAME', name)
+        self.assertEqual(sqlite.lock_path(), f'{path}.write-lock')
+        response = self.client.post(reverse('users:login'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(os.path.exists(f'{path}.write-lock'))
+
+    def test_get_follow_waits_in_write_queue(self):
+        """Подписка по GET пишет в базу и проходит очередь записи."""
+        lock = os.path.join(self.directory.name, 'write-lock')
+        author = User.objects.create_user(username='auth')
+        reader = User.objects.create_user(username='reader')
+        self.client.force_login(reader)
+        with override_settings(SQLITE_CONCURRENCY=True,
+                               SQLITE_WRITE_LOCK=lock):
+            self.client.get(reverse('posts:profile_follow',
+                                    args=[author.username]))
+        self.assertTrue(os.path.exists(lock))
+        self.assertTrue(author.following.filter(user=reader).exists())
+
+
+class MemcachedStandIn(socketserver.ThreadingTCPServer):
+    """Заменитель memcached для тестов: команды клиента над словарём."""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), MemcachedHandler)
+        self.data = {}
+
+
+class MemcachedHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        data = self.server.data
+        for line in self.rfile:
+            command, *args = line.split()
+            if command in (b'set', b'add'):
+                key, flags, exptime, size = args[:4]
+                value = self.rfile.read(int(size) + 2)[:-2]
+                if command == b'add' and key in data:
+                    self.wfile.write(b'NOT_STORED\r\n')
+                    continue
+                if int(exptime) < 0:
+                    data.pop(key, None)
+                else:
+                    data[key] = (flags, value)
+                self.wfile.write(b'STORED\r\n')
+            elif command == b'get':
+                for key in args:
+                    if key in data:
+                        flags, value = data[key]
+                        self.wfile.write(b'VALUE %s %s %d\r\n%s\r\n' % (
+                            key, flags, len(value), value))
+                self.wfile.write(b'END\r\n')
+            elif command == b'delete':
+                found = data.pop(args[0], None) is not None
+                self.wfile.write(
+                    b'DELETED\r\n' if found else b'NOT_FOUND\r\n')
+            elif command in (b'incr', b'decr'):
+                if args[0] not in data:
+                    self.wfile.write(b'NOT_FOUND\r\n')
+                    continue
+                flags, value = data[args[0]]
+                sign = 1 if command == b'incr' else -1
+                value = b'%d' % max(int(value) + sign * int(args[1]), 0)
+                data[args[0]] = (flags, value)
+                self.wfile.write(value + b'\r\n')
+            elif command == b'touch':
+                self.wfile.write(
+                    b'TOUCHED\r\n' if args[0] in data else b'NOT_FOUND\r\n')
+            elif command == b'flush_all':
+                data.clear()
+                self.wfile.write(b'OK\r\n')
+
+
+class SharedCacheTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'cache.sqlite3')
+        server = MemcachedStandIn()
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        self.location = '127.0.0.1:{}'.format(server.server_address[1])
+
+    def sqlite_cache(self, **options):
+        return cache_backends.SQLiteCache(self.path, {'OPTIONS': options})
+
+    def memcached_cache(self):
+        return MemcachedCache(self.location, {})
+
+    def test_shared_backends_are_shared_between_clients(self):
+        """Значения, add и счётчики видны всем клиентам общего кэша."""
+        for make_cache in (self.sqlite_cache, self.memcached_cache):
+            first, second = make_cache(), make_cache()
+            with self.subTest(backend=type(first).__name__):
+                first.clear()
+                first.set('card:1', {'html': '<p>'})
+                first.set_many({'ver:posts': 1, 'ver:groups': 2})
+                self.assertEqual(second.get('card:1'), {'html': '<p>'})
+                self.assertEqual(
+                    second.get_many(['ver:posts', 'ver:groups', 'missing']),
+                    {'ver:posts': 1, 'ver:groups': 2})
+                self.assertTrue(first.add('lock:page', 1, 30))
+                self.assertFalse(second.add('lock:page', 1, 30))
+                self.assertEqual(second.incr('ver:posts'), 2)
+                first.delete('lock:page')
+                self.assertTrue(second.add('lock:page', 1, 30))
+                first.set('expired', 1, 0)
+                self.assertIsNone(second.get('expired'))
+                second.clear()
+                self.assertIsNone(first.get('card:1'))
+
+    def test_sqlite_cache_replaces_expired_entries_on_add(self):
+        """add в SQLiteCache занимает ключ, срок которого истёк."""
+        shared = self.sqlite_cache()
+        shared.set('lock:page', 'old', 0.01)
+        time.sleep(0.02)
+        self.assertTrue(shared.add('lock:page', 'new', 30))
+        self.assertEqual(shared.get('lock:page'), 'new')
+
+    def test_sqlite_cache_culls_soonest_expiring(self):
+        """При переполнении удаляются записи с ближайшим сроком."""
+        shared = self.sqlite_cache(MAX_ENTRIES=10, CULL_FREQUENCY=2)
+        for number in range(cache_backends.SQLITE_CULL_EVERY):
+            shared.set(f'key:{number}', number, 60 + number)
+        self.assertIsNone(shared.get('key:0'))
+        self.assertEqual(shared.get('key:99'), 99)
+
+    def test_unreachable_memcached_is_a_miss(self):
+        """Недоступный memcached даёт промахи, а не ошибки."""
+        unreachable = MemcachedCache('127.0.0.1:1', {})
+        unreachable.set('key', 1)
+        self.assertEqual(unreachable.get('key', 'default'), 'default')
+        self.assertFalse(unreachable.add('key', 1))
+
+    def test_two_level_cache_keeps_only_immutable_keys_local(self):
+        """L1 хранит ключи LOCAL_PREFIXES, остальные читаются из L2."""
+        two_level = cache_backends.TwoLevelCache('two-level-test', {
+            'OPTIONS': {'SHARED': 'shared', 'LOCAL_PREFIXES': ('card:',)},
+        })
+        self.addCleanup(two_level.clear)
+        two_level.set_many({'card:1': 'карточка', 'ver:posts': 1})
+        # Другой процесс меняет общий кэш.
+        caches['shared'].set_many({'card:1': 'чужая', 'ver:posts': 2})
+        self.assertEqual(two_level.get_many(['card:1', 'ver:posts']),
+                         {'card:1': 'карточка', 'ver:posts': 2})
+        caches['shared'].set('card:2', 'из L2')
+        self.assertEqual(two_level.get('card:2'), 'из L2')
+        caches['shared'].delete('card:2')
+        self.assertEqual(two_level.get('card:2'), 'из L2')
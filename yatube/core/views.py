@@ -1,4 +1,13 @@
+from django.conf import settings
+from django.core.exceptions import PermissionDenied
+from django.http import HttpResponse
 from django.shortcuts import render
+from django.utils.crypto import constant_time_compare
+from django.views.static import serve
+
+from posts.storage import is_immutable
+
+from . import metrics
 
 
 def page_not_found(request, exception):
@@ -15,3 +24,37 @@ def server_error(request):
 
 def permission_denied(request, exception):
     return render(request, 'core/403.html', status=403)
+
+
+def media(request, path):
+    """Раздача MEDIA_ROOT в режиме разработки.
+
+    Файлы, адресованные по содержимому, отдаются с неограниченным
+    кэшированием — так же их следует отдавать веб-серверу в продакшене.
+    """
+    response = serve(request, path, document_root=settings.MEDIA_ROOT)
+    if is_immutable(path):
+        response['Cache-Control'] = (
+            f'public, max-age={settings.MEDIA_IMMUTABLE_MAX_AGE}, immutable')
+    return response
+
+
+def metrics_allowed(request):
+    """С METRICS_TOKEN — только по заголовку ``Authorization: Bearer``.
+    Без него — с адресов INTERNAL_IPS и не через прокси: за прокси
+    REMOTE_ADDR — адрес самого прокси, то есть любого клиента.
+    """
+    if settings.METRICS_TOKEN:
+        return constant_time_compare(
+            request.META.get('HTTP_AUTHORIZATION', ''),
+            f'Bearer {settings.METRICS_TOKEN}')
+    return ('HTTP_X_FORWARDED_FOR' not in request.META
+            and request.META.get('REMOTE_ADDR') in settings.INTERNAL_IPS)
+
+
+def metrics_export(request):
+    """Метрики процесса для Prometheus."""
+    if not metrics_allowed(request):
+        raise PermissionDenied
+    return HttpResponse(
+        metrics.render(), content_type='text/plain; version=0.0.4')
@@ -0,0 +1,24 @@
+from django.contrib import admin
+from django.utils import timezone
+
+from .models import Job
+
+
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('pk', 'task', 'key', 'status', 'attempts', 'run_at',
+                    'created')
+    search_fields = ('task', 'key')
+    list_filter = ('status', 'task')
+    actions = ('requeue',)
+
+    def requeue(self, request, queryset):
+        # Ключ, с которым в очереди уже ждёт задача, повторять незачем.
+        queued_keys = Job.objects.filter(
+            status=Job.QUEUED, key__isnull=False).values('key')
+        queryset.filter(status=Job.FAILED).exclude(
+            key__in=queued_keys).update(
+            status=Job.QUEUED, attempts=0, run_at=timezone.now())
+    requeue.short_description = 'Повторить упавшие задачи'
+
+
+admin.site.register(Job, JobAdmin)
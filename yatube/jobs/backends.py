@@ -0,0 +1,42 @@
+"""Бэкенды очереди задач, выбираются настройкой ``JOBS_BACKEND``.
+
+``DatabaseBackend`` записывает задачу в таблицу ``Job`` той же базы и в
+той же транзакции, что и изменение, которое её породило: задача
+появляется в очереди, только если транзакция зафиксирована, и не
+теряется между фиксацией и постановкой. Выполняет её
+``manage.py run_jobs``.
+
+``ImmediateBackend`` выполняет задачу сразу при постановке, в текущем
+процессе и транзакции, а ошибки не перехватывает. Его включает
+тестовый раннер проекта; подходит и для разработки без воркера.
+"""
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Job
+
+
+def get_backend():
+    return import_string(settings.JOBS_BACKEND)()
+
+
+class DatabaseBackend:
+    def enqueue(self, task, args, key=None, delay=0):
+        job = Job(task=task.name, args=json.dumps(args), key=key,
+                  run_at=timezone.now() + timedelta(seconds=delay))
+        # Задача с занятым ключом молча пропускается уникальным индексом,
+        # а ждущая с тем же ключом выполнится не позже новой.
+        Job.objects.bulk_create([job], ignore_conflicts=key is not None)
+        if key is not None:
+            Job.objects.filter(
+                key=key, status=Job.QUEUED, run_at__gt=job.run_at,
+            ).update(run_at=job.run_at)
+
+
+class ImmediateBackend:
+    def enqueue(self, task, args, key=None, delay=0):
+        task(*json.loads(json.dumps(args)))
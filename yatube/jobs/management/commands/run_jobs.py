@@ -0,0 +1,33 @@
+import signal
+
+from django.core.management.base import BaseCommand
+
+from jobs import worker
+
+
+class Command(BaseCommand):
+    help = ('Выполняет задачи очереди jobs. Для нескольких воркеров '
+            'запустите несколько процессов команды.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--burst', action='store_true',
+            help='Выйти, когда в очереди не останется готовых задач.')
+        parser.add_argument(
+            '--max-jobs', type=int,
+            help='Выйти после стольких задач.')
+        parser.add_argument(
+            '--poll-interval', type=float,
+            help='Пауза между опросами пустой очереди, секунды.')
+        parser.add_argument('--name', help='Имя воркера в записях задач.')
+
+    def handle(self, *args, **options):
+        job_worker = worker.Worker(
+            options['name'], options['poll_interval'])
+        # SIGTERM и Ctrl+C дают доделать текущую задачу.
+        signal.signal(signal.SIGTERM, job_worker.stop)
+        signal.signal(signal.SIGINT, job_worker.stop)
+        stats = job_worker.run(options['burst'], options['max_jobs'])
+        self.stdout.write(
+            f'Выполнено задач: {stats["done"]}, с ошибкой: '
+            f'{stats["failed"]}')
@@ -0,0 +1,60 @@
+from django.db import models
+from django.db.models import Q
+from django.utils import timezone
+
+
+class Job(models.Model):
+    """Задача очереди. Выполненные задачи удаляются, упавшие остаются с
+    последней ошибкой.
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (QUEUED, 'В очереди'),
+        (RUNNING, 'Выполняется'),
+        (FAILED, 'Ошибка'),
+    )
+
+    task = models.CharField('Задача', max_length=200)
+    args = models.TextField('Аргументы (JSON)', default='[]')
+    key = models.CharField(
+        'Ключ идемпотентности',
+        max_length=200,
+        blank=True,
+        null=True,
+        help_text='В очереди не бывает двух задач с одним ключом',
+    )
+    status = models.CharField(
+        'Состояние',
+        max_length=10,
+        choices=STATUS_CHOICES,
+        default=QUEUED,
+    )
+    attempts = models.PositiveIntegerField('Попыток', default=0)
+    run_at = models.DateTimeField('Выполнить не раньше', default=timezone.now)
+    locked_until = models.DateTimeField(
+        'Занята воркером до', blank=True, null=True)
+    worker = models.CharField('Воркер', max_length=100, blank=True)
+    last_error = models.TextField('Последняя ошибка', blank=True)
+    created = models.DateTimeField('Поставлена', auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Задача'
+        verbose_name_plural = 'Задачи'
+        # Частичный уникальный индекс: повторная постановка задачи с тем
+        # же ключом, пока прежняя ждёт в очереди, ничего не добавляет.
+        # Выполняемая задача ключ не держит — изменения, пришедшие во
+        # время её работы, обработает следующая.
+        constraints = [
+            models.UniqueConstraint(fields=['key'],
+                                    condition=Q(status='queued'),
+                                    name='unique_queued_job_key'),
+        ]
+        indexes = [
+            models.Index(fields=['status', 'run_at'],
+                         name='job_status_run_at_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.task} #{self.pk}'
@@ -0,0 +1,57 @@
+"""Реестр задач очереди.
+
+Задача — функция модуля ``tasks`` приложения, объявленная декоратором
+``task``; модули ``tasks`` импортирует ``JobsConfig.ready()``. Аргументы
+задачи сохраняются в JSON, поэтому передаются id, а не объекты моделей.
+Задача может выполниться повторно (после ошибки или падения воркера),
+так что должна быть идемпотентной.
+"""
+from . import backends
+
+tasks = {}
+
+
+class Task:
+    def __init__(self, func, name, max_attempts, retry_delay, atomic):
+        self.func = func
+        self.name = name
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.atomic = atomic
+
+    def __call__(self, *args):
+        return self.func(*args)
+
+    def __repr__(self):
+        return f'<Task {self.name}>'
+
+    def enqueue(self, *args, key=None, delay=0):
+        """Ставит задачу в очередь текущего бэкенда.
+
+        ``key`` — ключ идемпотентности: пока в очереди ждёт задача с
+        тем же ключом, новая не добавляется, а ждущая переносится на
+        срок новой, если он раньше. ``delay`` — через сколько секунд
+        задачу можно выполнять.
+        """
+        backends.get_backend().enqueue(self, args, key=key, delay=delay)
+
+    def retry_in(self, attempts):
+        """Пауза перед следующей попыткой: экспоненциально от
+        ``retry_delay``.
+        """
+        return self.retry_delay * 2 ** (attempts - 1)
+
+
+def task(name=None, max_attempts=5, retry_delay=10, atomic=True):
+    """Декоратор: регистрирует функцию как задачу очереди.
+
+    ``atomic=False`` — задача сама фиксирует свои записи, а не выполняется
+    в одной транзакции: для долгого сетевого ввода-вывода, во время
+    которого нельзя держать блокировку записи.
+    """
+    def decorator(func):
+        task_name = name or f'{func.__module__}.{func.__name__}'
+        tasks[task_name] = Task(
+            func, task_name, max_attempts, retry_delay, atomic)
+        return tasks[task_name]
+    return decorator
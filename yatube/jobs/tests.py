@@ -0,0 +1,155 @@
+import fcntl
+import os
+import tempfile
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import override_settings, TestCase
+from django.utils import timezone
+
+from posts import search
+from posts.models import FeedItem, Follow, Group, Post
+
+from . import registry, worker
+from .models import Job
+
+User = get_user_model()
+calls = []
+lock_states = []
+
+
+@registry.task(name='jobs.tests.record')
+def record(value):
+    calls.append(value)
+
+
+@registry.task(name='jobs.tests.broken', max_attempts=2, retry_delay=10)
+def broken(slug):
+    Group.objects.create(title=slug, slug=slug, description='')
+    raise RuntimeError('сломалось')
+
+
+@registry.task(name='jobs.tests.check_lock')
+def check_lock(path):
+    with open(path, 'a') as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_states.append('занята')
+        else:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+            lock_states.append('свободна')
+
+
+@override_settings(JOBS_BACKEND='jobs.backends.DatabaseBackend')
+class DatabaseQueueTests(TestCase):
+    def setUp(self):
+        calls.clear()
+        self.worker = worker.Worker('test', poll_interval=0)
+
+    def test_key_deduplicates_queued_jobs(self):
+        """С ключом в очереди одна задача; после выполнения — снова можно."""
+        record.enqueue(1, key='record')
+        record.enqueue(2, key='record')
+        record.enqueue(3)
+        self.assertEqual(Job.objects.count(), 2)
+        self.assertEqual(self.worker.run(burst=True), {'done': 2, 'failed': 0})
+        self.assertEqual(calls, [1, 3])
+        self.assertFalse(Job.objects.exists())
+        record.enqueue(4, key='record')
+        self.assertEqual(Job.objects.get().key, 'record')
+
+    def test_key_moves_delayed_job_earlier(self):
+        """Ждущая задача с ключом переносится на более ранний срок."""
+        record.enqueue(1, key='record', delay=600)
+        record.enqueue(2, key='record', delay=60)
+        record.enqueue(3, key='record', delay=300)
+        job = Job.objects.get()
+        self.assertEqual(job.args, '[1]')
+        self.assertLess(job.run_at, timezone.now() + timedelta(seconds=61))
+
+    def test_delayed_job_waits(self):
+        """Задача с delay не выполняется раньше срока."""
+        record.enqueue(1, delay=60)
+        self.assertFalse(self.worker.run_once())
+        Job.objects.update(run_at=timezone.now())
+        self.assertTrue(self.worker.run_once())
+        self.assertEqual(calls, [1])
+
+    def test_failed_job_rolls_back_and_retries_then_fails(self):
+        """Ошибка откатывает записи задачи, повтор — с паузой, затем
+        задача остаётся с ошибкой.
+        """
+        broken.enqueue('broken')
+        self.worker.run_once()
+        job = Job.objects.get()
+        self.assertEqual((job.status, job.attempts), (Job.QUEUED, 1))
+        self.assertIn('сломалось', job.last_error)
+        self.assertGreater(job.run_at, timezone.now() + timedelta(seconds=5))
+        self.assertFalse(Group.objects.exists())
+        self.assertFalse(self.worker.run_once())
+        Job.objects.update(run_at=timezone.now())
+        self.worker.run_once()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.FAILED, 2))
+        self.assertEqual(self.worker.stats, {'done': 0, 'failed': 2})
+
+    def test_retry_yields_to_newer_job_with_same_key(self):
+        """Упавшая задача уступает ждущей задаче с тем же ключом."""
+        broken.enqueue('first', key='broken')
+        job = worker.claim('test')
+        broken.enqueue('second', key='broken')
+        worker.execute(job)
+        self.assertEqual(
+            list(Job.objects.values_list('status', 'args')),
+            [(Job.QUEUED, '["second"]')])
+
+    def test_expired_lease_is_reclaimed(self):
+        """Задачу упавшего воркера забирает другой после срока аренды."""
+        record.enqueue(1)
+        self.assertIsNotNone(worker.claim('dead', lease=60))
+        self.assertIsNone(worker.claim('test'))
+        Job.objects.update(locked_until=timezone.now() - timedelta(1))
+        self.assertTrue(self.worker.run_once())
+        self.assertEqual(calls, [1])
+
+    def test_unknown_task_fails(self):
+        """Незарегистрированная задача не повторяется."""
+        Job.objects.create(task='jobs.tests.missing')
+        self.worker.run_once()
+        self.assertEqual(Job.objects.get().status, Job.FAILED)
+
+    def test_post_side_effects_run_in_worker(self):
+        """Раскладка по лентам и индекс поиска выполняются воркером."""
+        author = User.objects.create_user(username='auth')
+        reader = User.objects.create_user(username='reader')
+        Follow.objects.create(user=reader, author=author)
+        post = Post.objects.create(author=author, text='Борщ со сметаной')
+        self.assertEqual(
+            sorted(Job.objects.values_list('task', flat=True)),
+            ['posts.tasks.fan_out_post', 'posts.tasks.index_post'])
+        self.assertFalse(FeedItem.objects.filter(user=reader).exists())
+        out = StringIO()
+        call_command('run_jobs', burst=True, stdout=out)
+        self.assertIn('Выполнено задач: 2', out.getvalue())
+        self.assertTrue(
+            FeedItem.objects.filter(user=reader, post=post).exists())
+        self.assertEqual(list(search.SearchResults('борщ')[:10]), [post])
+
+    def test_atomic_task_waits_in_sqlite_write_queue(self):
+        """В режиме SQLITE_CONCURRENCY задача пишет, заняв очередь
+        записи, как и запросы.
+        """
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, 'write-lock')
+        lock_states.clear()
+        with override_settings(SQLITE_CONCURRENCY=True,
+                               SQLITE_WRITE_LOCK=path):
+            check_lock.enqueue(path)
+            self.worker.run_once()
+        check_lock.enqueue(path)
+        self.worker.run_once()
+        self.assertEqual(lock_states, ['занята', 'свободна'])
@@ -0,0 +1,160 @@
+"""Выполнение задач из таблицы ``Job``.
+
+Воркер забирает задачу условным UPDATE (состояние не изменилось с
+момента выборки), поэтому несколько процессов ``run_jobs`` не получат
+одну задачу дважды ни на SQLite, ни на PostgreSQL. Задача выдаётся на
+``JOBS_LEASE_TIMEOUT`` секунд: если воркер упал, после этого её заберёт
+другой.
+
+Задача выполняется в транзакции вместе с удалением своей записи: записи
+в базу и завершение задачи фиксируются вместе (кроме задач с
+``atomic=False``, которые фиксируют записи сами). В режиме
+``SQLITE_CONCURRENCY`` транзакция ждёт общую с запросами очередь записи
+``core.sqlite.write_lock``. После ошибки задача возвращается в очередь
+с экспоненциальной паузой, после ``max_attempts`` попыток остаётся в
+состоянии «Ошибка».
+"""
+import json
+import logging
+import os
+import socket
+import time
+import traceback
+from contextlib import contextmanager, nullcontext
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from core import sqlite
+
+from . import registry
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+CLAIM_CANDIDATES = 10
+
+
+def default_name():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def ready_jobs(now):
+    return Job.objects.filter(
+        Q(status=Job.QUEUED, run_at__lte=now)
+        | Q(status=Job.RUNNING, locked_until__lt=now))
+
+
+def claim(worker, lease=None):
+    """Забирает одну готовую задачу или возвращает None."""
+    now = timezone.now()
+    lease = settings.JOBS_LEASE_TIMEOUT if lease is None else lease
+    candidates = ready_jobs(now).order_by('run_at', 'pk').values_list(
+        'pk', flat=True)[:CLAIM_CANDIDATES]
+    for pk in candidates:
+        claimed = ready_jobs(now).filter(pk=pk).update(
+            status=Job.RUNNING, worker=worker,
+            locked_until=now + timedelta(seconds=lease),
+            attempts=F('attempts') + 1)
+        if claimed:
+            return Job.objects.get(pk=pk)
+    return None
+
+
+@contextmanager
+def task_transaction(task):
+    """Транзакция задачи, на SQLite — в очереди записи."""
+    if not task.atomic:
+        yield
+        return
+    with sqlite.write_lock() if sqlite.enabled() else nullcontext():
+        with transaction.atomic():
+            yield
+
+
+def execute(job):
+    """Выполняет забранную задачу; True, если она завершилась успешно."""
+    task = registry.tasks.get(job.task)
+    if task is None:
+        fail(job, f'Задача {job.task} не зарегистрирована.')
+        return False
+    if job.attempts > task.max_attempts:
+        # Воркеры падали на ней, не успев записать ошибку.
+        fail(job, job.last_error or 'Истёк срок аренды задачи.')
+        return False
+    try:
+        with task_transaction(task):
+            task(*json.loads(job.args))
+            Job.objects.filter(pk=job.pk, worker=job.worker).delete()
+    except Exception:
+        logger.exception('Задача %s завершилась ошибкой', job)
+        retry(job, task, traceback.format_exc())
+        return False
+    return True
+
+
+def retry(job, task, error):
+    if job.attempts >= task.max_attempts:
+        fail(job, error)
+        return
+    run_at = timezone.now() + timedelta(seconds=task.retry_in(job.attempts))
+    try:
+        with transaction.atomic():
+            Job.objects.filter(pk=job.pk, worker=job.worker).update(
+                status=Job.QUEUED, run_at=run_at, locked_until=None,
+                last_error=error)
+    except IntegrityError:
+        # Пока задача выполнялась, в очередь встала новая с тем же
+        # ключом — она и повторит работу.
+        Job.objects.filter(pk=job.pk, worker=job.worker).delete()
+
+
+def fail(job, error):
+    Job.objects.filter(pk=job.pk, worker=job.worker).update(
+        status=Job.FAILED, locked_until=None, last_error=error)
+
+
+class Worker:
+    """Цикл выборки и выполнения задач одного процесса."""
+
+    def __init__(self, name=None, poll_interval=None):
+        self.name = name or default_name()
+        self.poll_interval = (settings.JOBS_POLL_INTERVAL
+                              if poll_interval is None else poll_interval)
+        self.stopping = False
+        self.stats = {'done': 0, 'failed': 0}
+
+    def stop(self, *args):
+        """Завершение после текущей задачи (обработчик сигнала)."""
+        self.stopping = True
+
+    def run_once(self):
+        """Выполняет одну задачу; False, если готовых задач нет."""
+        close_old_connections()
+        job = claim(self.name)
+        if job is None:
+            return False
+        self.stats['done' if execute(job) else 'failed'] += 1
+        return True
+
+    def run(self, burst=False, max_jobs=None):
+        """Выполняет задачи, пока не остановят.
+
+        ``burst`` — выйти, когда очередь опустеет; ``max_jobs`` — выйти
+        после стольких задач.
+        """
+        processed = 0
+        while not self.stopping:
+            if max_jobs is not None and processed >= max_jobs:
+                break
+            if self.run_once():
+                processed += 1
+            elif burst:
+                break
+            else:
+                time.sleep(self.poll_interval)
+        close_old_connections()
+        return self.stats
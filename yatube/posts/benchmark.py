@@ -0,0 +1,263 @@
+"""Нагрузочные замеры представлений posts.
+
+``seed()`` наполняет базу синтетическими данными: пользователи и
+сообщества создаются через ``mixer``, публикации, комментарии и подписки
+— пачками ``bulk_create`` из заранее сгенерированных Faker текстов,
+иначе десятки миллионов строк не создать за разумное время. После
+заливки пересчитываются денормализованные данные, которые обычно ведут
+сигналы: ленты подписок, счётчики и поисковый индекс.
+
+``measure()`` прогоняет URL через тестовый клиент и для каждого запроса
+снимает время ответа и число SQL-запросов. ``QUERY_BUDGETS`` — верхняя
+граница запросов на страницу при холодном кэше для пользователя,
+``ANONYMOUS_QUERY_BUDGETS`` — для анонима; они не должны зависеть от
+объёма данных, поэтому превышение означает N+1 или лишний запрос.
+
+Холодный замер сбрасывает кэш перед каждым запросом, поэтому идёт только
+внутри ``private_cache()``: общий кэш на это время — память процесса, и
+кэш запущенного сайта не трогается.
+"""
+import random
+import time
+import tracemalloc
+from io import StringIO
+from itertools import islice
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from faker import Faker
+from mixer.backend.django import mixer
+
+from . import cache as posts_cache
+from . import feed, search
+from .models import Comment, Follow, Group, Post, User
+
+BATCH_SIZE = 5000
+TEXT_POOL_SIZE = 1000
+
+# Сессия и пользователь — два запроса на любой странице; ещё один
+# оставлен на prefetch вариантов изображений. Сообщество, профиль и пост
+# тратят один запрос на ETag (см. posts.conditional).
+QUERY_BUDGETS = {
+    'index': 4,
+    'group_posts': 6,
+    'profile': 7,
+    'post_detail': 8,
+    'follow_index': 5,
+}
+# Без сессии и пользователя — на два запроса меньше.
+ANONYMOUS_QUERY_BUDGETS = {
+    view: QUERY_BUDGETS[view] - 2
+    for view in ('index', 'group_posts', 'profile', 'post_detail')
+}
+
+
+def batches(rows, size=BATCH_SIZE):
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+
+def seed(posts, users=100, groups=10, follows=1000, comments=10000,
+         locale='ru_RU', random_seed=None, log=None):
+    """Наполняет базу синтетическими данными, возвращает созданных
+    пользователей.
+    """
+    rng = random.Random(random_seed)
+    fake = Faker(locale)
+    fake.seed_instance(random_seed)
+    texts = [fake.paragraph(nb_sentences=rng.randint(1, 6))
+             for _ in range(TEXT_POOL_SIZE)]
+    prefix = fake.unique.lexify('bench-????????').lower()
+    log = log or (lambda message: None)
+
+    authors = mixer.cycle(users).blend(
+        User, username=mixer.sequence(f'{prefix}-{{0}}'))
+    author_ids = [author.pk for author in authors]
+    group_ids = [group.pk for group in mixer.cycle(groups).blend(
+        Group, slug=mixer.sequence(f'{prefix}-{{0}}'),
+        title=mixer.faker.sentence, description=mixer.faker.text)]
+    log(f'Пользователей: {users}, сообществ: {groups}')
+
+    created = _bulk(Post, posts, lambda: Post(
+        text=rng.choice(texts),
+        author_id=rng.choice(author_ids),
+        group_id=rng.choice(group_ids + [None]),
+    ))
+    log(f'Публикаций: {created}')
+    first_post, last_post = _pk_range(Post, author_ids, 'author_id')
+    if first_post is not None:
+        _bulk(Comment, comments, lambda: Comment(
+            post_id=rng.randint(first_post, last_post),
+            author_id=rng.choice(author_ids),
+            text=rng.choice(texts),
+        ))
+    log(f'Комментариев: {comments}')
+
+    pairs = set()
+    follows = min(follows, users * (users - 1))
+    while len(pairs) < follows:
+        user_id, author_id = rng.sample(author_ids, 2)
+        pairs.add((user_id, author_id))
+    for batch in batches(pairs):
+        with transaction.atomic():
+            Follow.objects.bulk_create(
+                [Follow(user_id=user_id, author_id=author_id)
+                 for user_id, author_id in batch],
+                ignore_conflicts=True)
+    log(f'Подписок: {len(pairs)}')
+
+    call_command('reconcile_counters', stdout=StringIO())
+    for user_id, author_id in pairs:
+        feed.backfill(user_id, author_id)
+    search.rebuild()
+    # Версии, а не cache.clear(): общий кэш может быть кэшем сайта.
+    posts_cache.bump(
+        'posts', 'groups', *(f'author:{pk}' for pk in author_ids),
+        *(f'group:{pk}' for pk in group_ids))
+    log('Счётчики, ленты и поисковый индекс пересчитаны')
+    return authors
+
+
+def _bulk(model, total, factory):
+    created = 0
+    for batch in batches((factory() for _ in range(total))):
+        with transaction.atomic():
+            model.objects.bulk_create(batch)
+        created += len(batch)
+    return created
+
+
+def _pk_range(model, values, field):
+    queryset = model.objects.filter(**{f'{field}__in': values})
+    first = queryset.order_by('pk').values_list('pk', flat=True).first()
+    last = queryset.order_by('-pk').values_list('pk', flat=True).first()
+    return first, last
+
+
+def percentile(values, percent):
+    """Процентиль по ближайшему рангу."""
+    if not values:
+        return 0
+    ordered = sorted(values)
+    rank = max(0, -(-len(ordered) * percent // 100) - 1)
+    return ordered[int(rank)]
+
+
+def cache_is_private():
+    """Общий кэш — память этого процесса: сброс не задевает сайт."""
+    return settings.CACHES['shared']['BACKEND'].endswith('.LocMemCache')
+
+
+def private_cache():
+    """Настройки, при которых общий кэш — память процесса."""
+    return override_settings(CACHES={**settings.CACHES, 'shared': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'yatube-benchmark',
+    }})
+
+
+def measure(client, urls, cold=False):
+    """Запрашивает URL по очереди, возвращает [(мс, запросов, статус)].
+
+    При ``cold=True`` кэш сбрасывается перед каждым запросом, и
+    замеряется худший случай — отрисовка без кэша фрагментов.
+    """
+    if cold and not cache_is_private():
+        raise ValueError(
+            'Холодный замер сбрасывает кэш: выполняйте его внутри '
+            'private_cache().')
+    results = []
+    for url in urls:
+        if cold:
+            cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = client.get(url)
+            elapsed = (time.perf_counter() - started) * 1000
+        results.append((elapsed, len(queries), response.status_code))
+    return results
+
+
+def summary(results):
+    timings = [elapsed for elapsed, _, _ in results]
+    return {
+        'requests': len(results),
+        'p50': percentile(timings, 50),
+        'p99': percentile(timings, 99),
+        'queries': max((count for _, count, _ in results), default=0),
+        'errors': sum(status >= 400 for _, _, status in results),
+    }
+
+
+def _value_size(value):
+    if value is None:
+        return 0
+    if isinstance(value, (bytes, memoryview)):
+        return len(value)
+    return len(str(value).encode())
+
+
+def footprint(queryset, limit):
+    """Объём страницы queryset: байт значений, полученных из базы, и
+    памяти Python (удерживаемой и пиковой) на построение объектов.
+    """
+    sql, params = queryset[:limit].query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        transferred = sum(
+            _value_size(value)
+            for row in cursor.fetchall() for value in row)
+    tracemalloc.start()
+    try:
+        objects = list(queryset[:limit])
+        retained, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del objects
+    return {'bytes': transferred, 'retained': retained, 'peak': peak}
+
+
+def _throughput_worker(args):
+    urls, duration, user_id, comment_url = args
+    from django.test import Client
+
+    connection.close()
+    client = Client(REMOTE_ADDR='192.0.2.1')
+    if user_id:
+        client.force_login(User.objects.get(pk=user_id))
+    done = errors = 0
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        try:
+            if comment_url:
+                response = client.post(comment_url, {'text': 'Бенчмарк'})
+            else:
+                response = client.get(urls[done % len(urls)])
+            errors += response.status_code >= 400
+        except Exception:
+            errors += 1
+        done += 1
+    connection.close()
+    return done, errors
+
+
+def throughput(urls, workers, duration, user_id=None, comment_url=None):
+    """Запросов в секунду у ``workers`` процессов, как у воркеров
+    gunicorn. Возвращает (запросов в секунду, ошибок).
+    """
+    import multiprocessing
+
+    connection.close()
+    with multiprocessing.get_context('fork').Pool(workers) as pool:
+        results = pool.map(
+            _throughput_worker,
+            [(urls, duration, user_id, comment_url)] * workers)
+    done = sum(count for count, _ in results)
+    return done / duration, sum(errors for _, errors in results)
@@ -0,0 +1,92 @@
+"""Версии кэша фрагментов, сбрасываемые событиями записи.
+
+Каждой области (``posts``, ``groups``, ``group:<id>``, ``author:<id>``,
+``post:<id>``) соответствует версия в кэше. Версия входит в ключ
+фрагмента, поэтому при изменении данных сигналы меняют версию, а старые
+фрагменты просто перестают запрашиваться и вытесняются по времени.
+Значение версии — момент последнего изменения в микросекундах.
+
+Ключи кэша проекта: ``ver:<область>`` — версии, ``lock:<ключ>`` —
+блокировки, ``page:<хэш адреса>`` — страницы; эти значения меняются и
+живут только в общем кэше. Ключи ``card:`` и ``template.cache.``
+содержат версии и не меняются, поэтому кэшируются и в памяти процесса
+(``core.cache_backends.TwoLevelCache``). Префикс и версию формата всех
+ключей задаёт общий кэш (``KEY_PREFIX``, ``CACHE_KEY_VERSION``).
+"""
+import threading
+import time
+from collections import Counter
+from functools import partial
+
+from django.core.cache import cache
+from django.db import transaction
+
+from core import metrics
+
+VERSION_PREFIX = 'ver:'
+
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+
+def _now():
+    return time.time_ns() // 1000
+
+
+def get_versions(*scopes):
+    """Возвращает версии областей одним запросом к кэшу."""
+    keys = {VERSION_PREFIX + scope: scope for scope in scopes}
+    found = cache.get_many(keys)
+    for key in keys.keys() - found.keys():
+        version = _now()
+        if not cache.add(key, version, timeout=None):
+            version = cache.get(key, version)
+        found[key] = version
+    return {scope: found[key] for key, scope in keys.items()}
+
+
+def version(*scopes):
+    """Строка версии для ключа фрагмента, зависящего от ``scopes``."""
+    versions = get_versions(*scopes)
+    return '.'.join(str(versions[scope]) for scope in scopes)
+
+
+def bump(*scopes):
+    """Меняет версии областей сейчас и ещё раз после фиксации транзакции.
+
+    Пока транзакция не зафиксирована, другой запрос прочтёт старые
+    данные и закэширует их под новой версией; повторная смена версии
+    после фиксации отбрасывает такие фрагменты и страницы. Первая смена
+    нужна коду той же транзакции, который читает кэш после записи.
+    """
+    _set_versions(scopes)
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(partial(_set_versions, scopes))
+
+
+def _set_versions(scopes):
+    now = _now()
+    cache.set_many(
+        {VERSION_PREFIX + scope: now for scope in scopes}, timeout=None)
+
+
+def post_scopes(post, group_ids=()):
+    """Области, которые затрагивает изменение публикации."""
+    scopes = {'posts', f'post:{post.pk}', f'author:{post.author_id}'}
+    scopes.update(
+        f'group:{group_id}'
+        for group_id in (post.group_id, *group_ids) if group_id)
+    return scopes
+
+
+def record(fragment, hit):
+    metrics.record_cache(hit)
+    with _stats_lock:
+        _stats['hits' if hit else 'misses'] += 1
+        _stats[f'{fragment}:{"hits" if hit else "misses"}'] += 1
+
+
+def stats():
+    """Счётчики попаданий и промахов кэша фрагментов в этом процессе."""
+    with _stats_lock:
+        return dict(_stats)
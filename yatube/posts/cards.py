@@ -0,0 +1,77 @@
+"""Кэш отрисованных карточек публикаций.
+
+Карточка не зависит от пользователя, поэтому одна и та же отрисовка
+переиспользуется на главной, в сообществах, профилях и ленте подписок.
+Ключ карточки включает версии ``post:<id>``, ``author:<id>`` и
+``groups`` из ``posts.cache``, так что правка публикации, новый
+комментарий или переименование сообщества сразу дают новую карточку.
+"""
+from django.conf import settings
+from django.core.cache import cache as django_cache
+from django.db.models import prefetch_related_objects
+from django.db.models.functions import Substr
+from django.template.loader import render_to_string
+from django.utils.html import mark_safe
+
+from . import cache
+
+CARD_TEMPLATE = 'posts/includes/post_card.html'
+SEPARATOR = '\n<hr>\n'
+
+# Поля, которые выводит карточка; остальное (полный текст, пароль
+# автора, описание сообщества) в списки не загружается.
+CARD_FIELDS = (
+    'pub_date', 'image', 'comments_count',
+    'author__username', 'author__first_name', 'author__last_name',
+    'group__slug', 'group__title',
+)
+
+
+def for_cards(queryset):
+    """Queryset публикаций для карточек списка.
+
+    Текст обрезается в базе: ``text_preview`` на символ длиннее
+    ``POST_PREVIEW_LENGTH``, чтобы ``Post.preview`` знал, что текст
+    обрезан.
+    """
+    return queryset.select_related('author', 'group').only(
+        'author', 'group', *CARD_FIELDS,
+    ).annotate(text_preview=Substr(
+        'text', 1, settings.POST_PREVIEW_LENGTH + 1))
+
+
+def render_cards(posts, author=None, group=None):
+    """Возвращает HTML карточек, собранный из кэша одним get_many.
+
+    ``author`` и ``group`` — те же переменные, что видит шаблон карточки
+    на странице профиля и сообщества: они скрывают лишние ссылки.
+    """
+    posts = list(posts)
+    if not posts:
+        return ''
+    variant = 'a' if author else 'g' if group else 'i'
+    scopes = {'groups'}
+    for post in posts:
+        scopes.update((f'post:{post.pk}', f'author:{post.author_id}'))
+    versions = cache.get_versions(*scopes)
+    keys = {
+        post.pk: 'card:{}:{}:{}.{}.{}'.format(
+            variant, post.pk, versions[f'post:{post.pk}'],
+            versions[f'author:{post.author_id}'], versions['groups'])
+        for post in posts
+    }
+    cards = django_cache.get_many(list(keys.values()))
+    missing = [post for post in posts if keys[post.pk] not in cards]
+    prefetch_related_objects(
+        [post for post in missing if post.image], 'images')
+    rendered = {}
+    for post in posts:
+        key = keys[post.pk]
+        cache.record('post_card', key in cards)
+        if key not in cards:
+            cards[key] = rendered[key] = render_to_string(
+                CARD_TEMPLATE, {'post': post, 'author': author,
+                                'group': group})
+    if rendered:
+        django_cache.set_many(rendered, settings.FRAGMENT_CACHE_TIMEOUT)
+    return mark_safe(SEPARATOR.join(cards[keys[post.pk]] for post in posts))
@@ -0,0 +1,128 @@
+"""Условные GET-запросы (ETag/Last-Modified) для страниц публикаций.
+
+Валидаторы строятся из тех же версий ``posts.cache``, что и ключи
+фрагментов, поэтому страница не отрисовывается: ответ ``304 Not
+Modified`` стоит чтения версий из кэша и, для некоторых страниц, одного
+запроса по первичному ключу или slug.
+
+ETag учитывает адрес страницы с параметрами, пользователя и CSRF-cookie,
+так что персональные части (кнопка подписки, форма комментария) не
+попадают к другому пользователю. Last-Modified персональное состояние
+не выражает, поэтому отдаётся только анонимным посетителям.
+"""
+import hashlib
+from datetime import datetime, timezone
+from functools import wraps
+
+from django.conf import settings
+from django.http import Http404
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.views.decorators.http import condition
+
+from . import cache
+from .models import Group, Post, User
+
+
+def page_versions(request, scopes_func, args, kwargs):
+    """Версии областей страницы, один раз на запрос.
+
+    None, если объекта страницы нет (``scopes_func`` вернула Http404).
+    """
+    if not hasattr(request, '_page_versions'):
+        try:
+            scopes = scopes_func(*args, **kwargs)
+        except Http404:
+            scopes = None
+        request._page_versions = (
+            cache.get_versions(*scopes) if scopes else None)
+    return request._page_versions
+
+
+def versions_time(versions):
+    """Момент последнего изменения областей с версиями ``versions``."""
+    return datetime.fromtimestamp(
+        max(versions.values()) / 1_000_000, timezone.utc)
+
+
+def page_condition(scopes_func):
+    """Декоратор представления: 304 по версиям кэша ``scopes_func``.
+
+    ``scopes_func`` получает аргументы представления и возвращает
+    области ``posts.cache``, от которых зависит страница, или
+    возбуждает Http404 — тогда валидаторы не отдаются.
+    """
+    def etag(request, *args, **kwargs):
+        versions = page_versions(request, scopes_func, args, kwargs)
+        if versions is None:
+            return None
+        user = request.user
+        parts = [
+            request.get_full_path(),
+            str(user.pk) if user.is_authenticated else 'anonymous',
+            request.COOKIES.get(settings.CSRF_COOKIE_NAME, ''),
+            *(f'{scope}={versions[scope]}' for scope in sorted(versions)),
+        ]
+        return hashlib.md5('|'.join(parts).encode()).hexdigest()
+
+    def last_modified(request, *args, **kwargs):
+        if request.user.is_authenticated:
+            return None
+        versions = page_versions(request, scopes_func, args, kwargs)
+        if versions is None:
+            return None
+        return versions_time(versions)
+
+    def decorator(view):
+        conditional_view = condition(etag, last_modified)(view)
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            response = conditional_view(request, *args, **kwargs)
+            if request.method in ('GET', 'HEAD'):
+                patch_vary_headers(response, ('Cookie',))
+                patch_cache_control(
+                    response, no_cache=True,
+                    private=request.user.is_authenticated)
+            return response
+        return wrapper
+    return decorator
+
+
+def index_scopes():
+    return ['posts']
+
+
+def group_scopes(slug):
+    group_id = Group.objects.filter(slug=slug).values_list(
+        'pk', flat=True).first()
+    if group_id is None:
+        raise Http404
+    return [f'group:{group_id}']
+
+
+def profile_scopes(author):
+    author_id = User.objects.filter(username=author).values_list(
+        'pk', flat=True).first()
+    if author_id is None:
+        raise Http404
+    return [f'author:{author_id}', 'groups']
+
+
+def post_scopes(post_id):
+    author_id = Post.objects.filter(pk=post_id).values_list(
+        'author_id', flat=True).first()
+    if author_id is None:
+        raise Http404
+    return [f'post:{post_id}', f'author:{author_id}', 'groups']
+
+
+def group_feed_scopes(slug, feed_format):
+    return group_scopes(slug)
+
+
+def author_feed_scopes(author, feed_format):
+    return profile_scopes(author)
+
+
+def sitemap_scopes(**kwargs):
+    return ['posts', 'groups']
@@ -0,0 +1,68 @@
+"""Денормализованные счётчики публикаций, подписок и комментариев."""
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import AuthorStats, Comment, Follow, Post, User
+
+
+def _subquery_count(queryset, field):
+    return Coalesce(Subquery(
+        queryset.filter(**{field: OuterRef('pk')})
+        .order_by()
+        .values(field)
+        .annotate(total=Count('pk'))
+        .values('total')[:1]
+    ), 0)
+
+
+def actual_counts():
+    """Выражения для пересчёта счётчиков AuthorStats с нуля."""
+    return {
+        'posts_count': _subquery_count(Post.objects.all(), 'author'),
+        'followers_count': _subquery_count(Follow.objects.all(), 'author'),
+        'following_count': _subquery_count(Follow.objects.all(), 'user'),
+    }
+
+
+def actual_comments_count():
+    return _subquery_count(Comment.objects.all(), 'post')
+
+
+def create_stats(user_id):
+    """Создаёт счётчики пользователя, посчитав их по данным в базе."""
+    values = User.objects.filter(pk=user_id).annotate(
+        **actual_counts()).values(*actual_counts()).first()
+    if values is None:
+        return None
+    stats, _ = AuthorStats.objects.get_or_create(
+        user_id=user_id, defaults=values)
+    return stats
+
+
+def stats_for(user):
+    try:
+        return user.stats
+    except AuthorStats.DoesNotExist:
+        return create_stats(user.pk)
+
+
+def change(user_id, field, delta):
+    """Атомарно изменяет счётчик пользователя на ``delta``.
+
+    Если строки счётчиков ещё нет, при увеличении она создаётся
+    пересчётом. При уменьшении отсутствующая строка не создаётся: это
+    может быть каскадное удаление самого пользователя.
+    """
+    stats = AuthorStats.objects.filter(user_id=user_id)
+    if delta < 0:
+        stats.filter(**{f'{field}__gte': -delta}).update(
+            **{field: F(field) + delta})
+    elif not stats.update(**{field: F(field) + delta}):
+        create_stats(user_id)
+
+
+def change_comments(post_id, delta):
+    posts = Post.objects.filter(pk=post_id)
+    if delta < 0:
+        posts = posts.filter(comments_count__gte=-delta)
+    posts.update(comments_count=F('comments_count') + delta)
@@ -0,0 +1,114 @@
+"""Материализованная лента подписок.
+
+Новая публикация раскладывается по лентам подписчиков при записи
+(fan-out on write). Для авторов, у которых подписчиков больше
+``FEED_FANOUT_LIMIT``, раскладка не выполняется: их публикации
+подмешиваются в ленту при чтении (fan-out on read), чтобы один пост не
+порождал миллионы вставок.
+"""
+from django.conf import settings
+from django.db.models import F, Q
+
+from .models import AuthorStats, FeedItem, Follow, Post
+
+BATCH_SIZE = 1000
+
+
+def is_celebrity(author_id):
+    return AuthorStats.objects.filter(
+        user_id=author_id,
+        followers_count__gt=settings.FEED_FANOUT_LIMIT,
+    ).exists()
+
+
+def followed_celebrities(user):
+    """id авторов из подписок пользователя, которые читаются при чтении."""
+    return list(AuthorStats.objects.filter(
+        user__in=Follow.objects.filter(user=user).values('author'),
+        followers_count__gt=settings.FEED_FANOUT_LIMIT,
+    ).values_list('user_id', flat=True))
+
+
+def fan_out(post):
+    """Добавляет публикацию в ленты подписчиков автора."""
+    if is_celebrity(post.author_id):
+        return
+    followers = Follow.objects.filter(
+        author_id=post.author_id).values_list('user_id', flat=True)
+    batch = []
+    for user_id in followers.iterator(chunk_size=BATCH_SIZE):
+        batch.append(FeedItem(user_id=user_id, post_id=post.pk,
+                              author_id=post.author_id,
+                              pub_date=post.pub_date))
+        if len(batch) >= BATCH_SIZE:
+            FeedItem.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    if batch:
+        FeedItem.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def backfill(user_id, author_id):
+    """Дополняет ленту последними публикациями нового автора."""
+    if is_celebrity(author_id):
+        return
+    recent = Post.objects.filter(author_id=author_id).order_by(
+        '-pub_date').values_list('pk', 'pub_date')[
+            :settings.FEED_BACKFILL_LIMIT]
+    FeedItem.objects.bulk_create(
+        [FeedItem(user_id=user_id, post_id=post_id, author_id=author_id,
+                  pub_date=pub_date)
+         for post_id, pub_date in recent],
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def backfill_followers(author_id):
+    """Дополняет ленты всех подписчиков автора его последними
+    публикациями — после загрузки в обход сигналов.
+    """
+    if is_celebrity(author_id):
+        return
+    recent = list(Post.objects.filter(author_id=author_id).order_by(
+        '-pub_date').values_list('pk', 'pub_date')[
+            :settings.FEED_BACKFILL_LIMIT])
+    if not recent:
+        return
+    followers = Follow.objects.filter(
+        author_id=author_id).values_list('user_id', flat=True)
+    batch = []
+    for user_id in followers.iterator(chunk_size=BATCH_SIZE):
+        batch.extend(
+            FeedItem(user_id=user_id, post_id=post_id, author_id=author_id,
+                     pub_date=pub_date)
+            for post_id, pub_date in recent)
+        if len(batch) >= BATCH_SIZE:
+            FeedItem.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    if batch:
+        FeedItem.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def trim(user_id, author_id):
+    """Убирает из ленты публикации автора после отписки."""
+    FeedItem.objects.filter(user_id=user_id, author_id=author_id).delete()
+
+
+def feed_posts(user):
+    """Публикации ленты подписок и ключи для KeysetPaginator.
+
+    Если пользователь не подписан на «знаменитостей», лента читается
+    одним диапазоном по индексу ``(user, pub_date)`` таблицы FeedItem.
+    """
+    celebrities = followed_celebrities(user)
+    if not celebrities:
+        posts = Post.objects.filter(feed_items__user=user).annotate(
+            feed_pub_date=F('feed_items__pub_date'),
+            feed_post_id=F('feed_items__post_id'),
+        )
+        return posts, ('feed_pub_date', 'feed_post_id')
+    posts = Post.objects.filter(
+        Q(pk__in=FeedItem.objects.filter(user=user).values('post_id'))
+        | Q(author_id__in=celebrities)
+    )
+    return posts, ('pub_date', 'pk')
@@ -1,12 +1,54 @@
 from django import forms
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.template.defaultfilters import filesizeformat
 
+from . import uploads
 from .models import Comment, Post
 
 
+class PostImageField(forms.ImageField):
+    """Поле изображения с ранними проверками размера файла и кадра.
+
+    Размер файла и число пикселей проверяются до полной проверки
+    изображения Pillow, по счётчику загрузки и заголовку файла.
+    """
+    default_error_messages = {
+        'file_too_large': 'Размер файла не должен превышать %(limit)s.',
+        'too_many_pixels': ('Изображение не должно быть больше '
+                            '%(limit)s мегапикселей.'),
+    }
+
+    def to_python(self, data):
+        if data in self.empty_values:
+            return None
+        if data.size > settings.POST_IMAGE_MAX_UPLOAD_SIZE:
+            raise forms.ValidationError(
+                self.error_messages['file_too_large'],
+                code='file_too_large',
+                params={'limit': filesizeformat(
+                    settings.POST_IMAGE_MAX_UPLOAD_SIZE)},
+            )
+        try:
+            _, (width, height), _, _ = uploads.read_header(data)
+        except Exception:
+            return super().to_python(data)
+        if width * height > settings.POST_IMAGE_MAX_PIXELS:
+            raise forms.ValidationError(
+                self.error_messages['too_many_pixels'],
+                code='too_many_pixels',
+                params={'limit': settings.POST_IMAGE_MAX_PIXELS // 10 ** 6},
+            )
+        return super().to_python(data)
+
+
 class PostForm(forms.ModelForm):
     class Meta:
         model = Post
         fields = ('text', 'group', 'image')
+        field_classes = {
+            'image': PostImageField,
+        }
         labels = {
             'text': 'Текст публикации',
             'group': 'Сообщество',
@@ -18,6 +60,17 @@ class PostForm(forms.ModelForm):
             'image': 'Добавьте изображение'
         }
 
+    def clean_image(self):
+        image = self.cleaned_data.get('image')
+        if isinstance(image, UploadedFile):
+            normalized = uploads.normalize(image)
+            if normalized is not image and self.files is not None:
+                # Запрос закрывает файлы из request.FILES после ответа,
+                # так закроется и перекодированная копия.
+                self.files[self.add_prefix('image')] = normalized
+            image = normalized
+        return image
+
 
 class CommentForm(forms.ModelForm):
     class Meta:
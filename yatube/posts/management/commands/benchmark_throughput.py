@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from posts import benchmark
+from posts.models import Group, Post, User
+
+
+class Command(BaseCommand):
+    help = ('Пропускная способность чтения (и записи комментариев) при '
+            'разном числе процессов-воркеров на текущей базе.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', default='1,2,4',
+            help='Числа воркеров через запятую.')
+        parser.add_argument(
+            '--duration', type=float, default=5,
+            help='Секунд на каждый замер.')
+        parser.add_argument(
+            '--writers', type=int, default=0,
+            help='Сколько воркеров одновременно пишут комментарии.')
+
+    def handle(self, *args, **options):
+        post = Post.objects.order_by('-pk').first()
+        group = Group.objects.filter(posts__isnull=False).first()
+        if post is None:
+            raise CommandError(
+                'Нет данных: наполните базу командой benchmark_views.')
+        urls = [
+            reverse('posts:index'),
+            reverse('posts:profile', args=(post.author.username,)),
+            reverse('posts:post_detail', args=(post.pk,)),
+        ]
+        if group is not None:
+            urls.append(reverse('posts:group_list', args=(group.slug,)))
+        duration = options['duration']
+        with override_settings(ALLOWED_HOSTS=['testserver']):
+            single = None
+            for workers in map(int, options['workers'].split(',')):
+                rate, errors = benchmark.throughput(urls, workers, duration)
+                single = single or rate
+                self.stdout.write(
+                    f'Воркеров: {workers:>3}  запросов/с: {rate:>8.1f}  '
+                    f'ускорение: {rate / single:>5.2f}  ошибок: {errors}')
+            if options['writers']:
+                writer = User.objects.first()
+                rate, errors = benchmark.throughput(
+                    urls, options['writers'], duration, writer.pk,
+                    reverse('posts:add_comment', args=(post.pk,)))
+                self.stdout.write(
+                    f'Писателей: {options["writers"]:>3}  '
+                    f'записей/с: {rate:>8.1f}  ошибок: {errors}')
@@ -0,0 +1,138 @@
+import random
+from contextlib import nullcontext
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from posts import benchmark, cards
+from posts.models import Group, Post, User
+
+
+class Command(BaseCommand):
+    help = ('Замеряет p50/p99 времени ответа и число SQL-запросов '
+            'представлений posts и проверяет бюджеты запросов. '
+            'С --posts сначала наполняет текущую базу данными.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--posts', type=int, default=0,
+            help='Сколько публикаций создать перед замером.')
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--groups', type=int, default=10)
+        parser.add_argument('--follows', type=int, default=1000)
+        parser.add_argument('--comments', type=int, default=10000)
+        parser.add_argument(
+            '--requests', type=int, default=100,
+            help='Запросов на каждое представление.')
+        parser.add_argument(
+            '--cold', action='store_true',
+            help='Сбрасывать кэш перед каждым запросом. Общий кэш на '
+                 'время замера заменяется памятью процесса.')
+        parser.add_argument('--random-seed', type=int, default=None)
+        parser.add_argument(
+            '--footprint', action='store_true',
+            help='Сравнить объём страницы списка до и после обрезки '
+                 'колонок (байты из базы и память Python).')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['random_seed'])
+        if options['posts']:
+            benchmark.seed(
+                options['posts'], users=options['users'],
+                groups=options['groups'], follows=options['follows'],
+                comments=options['comments'],
+                random_seed=options['random_seed'], log=self.stdout.write)
+        reader = User.objects.filter(stats__isnull=False).order_by(
+            '-stats__following_count').first()
+        if reader is None or not Post.objects.exists():
+            raise CommandError('Нет данных: запустите команду с --posts.')
+        # Адрес не из INTERNAL_IPS: debug toolbar не должен попасть в замер.
+        if options['footprint']:
+            self.footprint(reader)
+        client = Client(REMOTE_ADDR='192.0.2.1')
+        client.force_login(reader)
+        anonymous = Client(REMOTE_ADDR='192.0.2.1')
+
+        count = options['requests']
+        urls = {
+            'index': [reverse('posts:index')] * count,
+            'group_posts': [
+                reverse('posts:group_list', args=(slug,))
+                for slug in self._sample(Group, 'slug', count, rng)],
+            'profile': [
+                reverse('posts:profile', args=(username,))
+                for username in self._sample(User, 'username', count, rng)],
+            'post_detail': [
+                reverse('posts:post_detail', args=(pk,))
+                for pk in self._sample(Post, 'pk', count, rng)],
+            'follow_index': [reverse('posts:follow_index')] * count,
+        }
+        # Аноним идёт мимо сессии — через кэш страниц и Last-Modified.
+        passes = (
+            ('', client, benchmark.QUERY_BUDGETS),
+            ('anon:', anonymous, benchmark.ANONYMOUS_QUERY_BUDGETS),
+        )
+        self.stdout.write(
+            f'{"view":<18}{"p50, мс":>10}{"p99, мс":>10}'
+            f'{"запросов":>10}{"бюджет":>8}{"ошибок":>8}')
+        failures = []
+        with override_settings(ALLOWED_HOSTS=['testserver']), (
+                benchmark.private_cache() if options['cold']
+                else nullcontext()):
+            for prefix, pass_client, budgets in passes:
+                for view, budget in budgets.items():
+                    if not urls[view]:
+                        continue
+                    result = benchmark.summary(benchmark.measure(
+                        pass_client, urls[view], cold=options['cold']))
+                    name = prefix + view
+                    self.stdout.write(
+                        f'{name:<18}{result["p50"]:>10.1f}'
+                        f'{result["p99"]:>10.1f}{result["queries"]:>10}'
+                        f'{budget:>8}{result["errors"]:>8}')
+                    if result['queries'] > budget or result['errors']:
+                        failures.append(name)
+        if failures:
+            raise CommandError(
+                'Превышен бюджет запросов или есть ошибки: '
+                + ', '.join(failures))
+
+    def footprint(self, reader):
+        group = Group.objects.filter(posts__isnull=False).first()
+        querysets = {
+            'index': Post.objects.all(),
+            'group_posts': Post.objects.filter(group=group),
+            'profile': Post.objects.filter(author=reader),
+        }
+        self.stdout.write(
+            f'{"view":<14}{"байт до":>10}{"после":>10}'
+            f'{"память до":>12}{"после":>10}{"пик до":>10}{"после":>10}')
+        for view, queryset in querysets.items():
+            queryset = queryset.order_by('-pub_date', '-pk')
+            before = benchmark.footprint(
+                queryset.select_related('author', 'group'),
+                settings.NUMBER_OF_POSTS)
+            after = benchmark.footprint(
+                cards.for_cards(queryset), settings.NUMBER_OF_POSTS)
+            self.stdout.write(
+                f'{view:<14}{before["bytes"]:>10}{after["bytes"]:>10}'
+                f'{before["retained"]:>12}{after["retained"]:>10}'
+                f'{before["peak"]:>10}{after["peak"]:>10}')
+
+    def _sample(self, model, field, count, rng):
+        """Случайные значения поля без ORDER BY RANDOM() по всей таблице."""
+        last = model.objects.aggregate(last=Max('pk'))['last']
+        if last is None:
+            return []
+        values = []
+        for _ in range(count):
+            value = model.objects.filter(
+                pk__gte=rng.randint(1, last)).order_by('pk').values_list(
+                    field, flat=True).first()
+            if value is not None:
+                values.append(value)
+        return values
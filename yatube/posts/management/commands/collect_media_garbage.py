@@ -0,0 +1,65 @@
+import time
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from posts.models import Post
+
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = ('Удаляет изображения публикаций, на которые не ссылается ни '
+            'одна публикация, вместе с их вариантами.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--min-age', type=int, default=60 * 60,
+            help='Не трогать файлы моложе стольких секунд (загрузки, '
+                 'ещё не сохранённые в публикации).')
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать, что будет удалено.')
+
+    def handle(self, *args, **options):
+        storage = Post._meta.get_field('image').storage
+        directory = Post._meta.get_field('image').upload_to.strip('/')
+        self.dry_run = options['dry_run']
+        self.deadline = time.time() - options['min_age']
+        removed = 0
+        batch = []
+        for name in self.walk(storage, directory):
+            batch.append(name)
+            if len(batch) >= BATCH_SIZE:
+                removed += self.collect(storage, batch)
+                batch = []
+        removed += self.collect(storage, batch)
+        self.stdout.write(f'Удалено неиспользуемых изображений: {removed}')
+
+    def walk(self, storage, directory):
+        if not storage.exists(directory):
+            return
+        directories, files = storage.listdir(directory)
+        for name in files:
+            yield f'{directory}/{name}'
+        for subdirectory in directories:
+            yield from self.walk(storage, f'{directory}/{subdirectory}')
+
+    def collect(self, storage, names):
+        used = set(Post.objects.filter(image__in=names).values_list(
+            'image', flat=True))
+        removed = 0
+        for name in names:
+            if name in used or storage.get_modified_time(
+                    name).timestamp() > self.deadline:
+                continue
+            removed += 1
+            self.stdout.write(name)
+            if self.dry_run:
+                continue
+            storage.delete(name)
+            thumbs = f'thumbs/{name}'
+            if default_storage.exists(thumbs):
+                for variant in default_storage.listdir(thumbs)[1]:
+                    default_storage.delete(f'{thumbs}/{variant}')
+        return removed
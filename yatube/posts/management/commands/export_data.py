@@ -0,0 +1,52 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import transfer
+
+
+class Command(BaseCommand):
+    help = ('Выгружает сообщества, публикации, комментарии и подписки '
+            'в NDJSON или CSV, читая базу порциями.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--output', default='-',
+            help='Файл выгрузки, по умолчанию стандартный вывод.')
+        parser.add_argument(
+            '--format', choices=('ndjson', 'csv'), default='ndjson')
+        parser.add_argument(
+            '--kinds', default=','.join(transfer.KINDS),
+            help='Виды записей через запятую: {}. Для CSV — один '
+                 'вид.'.format(', '.join(transfer.KINDS)))
+
+    def handle(self, *args, **options):
+        kinds = [kind for kind in options['kinds'].split(',') if kind]
+        unknown = set(kinds) - set(transfer.KINDS)
+        if unknown or not kinds:
+            raise CommandError(
+                'Неизвестные виды записей: {}'.format(', '.join(unknown)))
+        if options['format'] == 'csv' and len(kinds) != 1:
+            raise CommandError('CSV-файл содержит записи одного вида.')
+        to_stdout = options['output'] == '-'
+        stream = sys.stdout if to_stdout else open(
+            options['output'], 'w', encoding='utf-8', newline='')
+        started = time.perf_counter()
+        try:
+            if options['format'] == 'csv':
+                written = transfer.write_csv(stream, kinds[0])
+            else:
+                written = transfer.write_ndjson(stream, kinds)
+        finally:
+            if not to_stdout:
+                stream.close()
+        elapsed = time.perf_counter() - started
+        total = sum(written.values())
+        # Отчёт не должен смешиваться с выгрузкой в стандартном выводе.
+        report = self.stderr if to_stdout else self.stdout
+        for kind, count in written.items():
+            report.write(f'{kind}: {count}')
+        report.write(
+            f'Выгружено записей: {total} за {elapsed:.1f} с, '
+            f'{total / max(elapsed, 1e-9):.0f} записей/с')
@@ -0,0 +1,54 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Count, F, Q
+
+from posts import thumbnails
+from posts.models import Post
+
+CHUNK_SIZE = 500
+
+
+class Command(BaseCommand):
+    help = ('Готовит адаптивные варианты для уже загруженных '
+            'изображений публикаций.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Перестроить варианты и для публикаций, где они есть.')
+        parser.add_argument(
+            '--workers', type=int, default=settings.THUMBNAIL_WORKERS,
+            help='Количество потоков подготовки вариантов, '
+                 '1 — без пула, в текущем потоке.')
+
+    def handle(self, *args, **options):
+        posts = Post.objects.exclude(image='')
+        if not options['all']:
+            expected = len(thumbnails.variant_sizes()) * len(
+                thumbnails.output_formats())
+            posts = posts.annotate(ready=Count('images', filter=Q(
+                images__source=F('image'),
+            ))).filter(ready__lt=expected)
+        post_ids = posts.order_by('pk').values_list('pk', flat=True)
+        done = last_id = 0
+        executor = None
+        if options['workers'] > 1:
+            executor = ThreadPoolExecutor(options['workers'])
+        try:
+            while True:
+                chunk = list(post_ids.filter(pk__gt=last_id)[:CHUNK_SIZE])
+                if not chunk:
+                    break
+                if executor is None:
+                    for post_id in chunk:
+                        thumbnails.generate(post_id)
+                else:
+                    list(executor.map(thumbnails.generate_safely, chunk))
+                done += len(chunk)
+                last_id = chunk[-1]
+        finally:
+            if executor is not None:
+                executor.shutdown()
+        self.stdout.write(f'Подготовлены варианты изображений: {done}')
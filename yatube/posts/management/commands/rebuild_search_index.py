@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from posts import search
+
+
+class Command(BaseCommand):
+    help = 'Перестраивает полнотекстовый индекс публикаций.'
+
+    def handle(self, *args, **options):
+        if not search.available():
+            raise CommandError(
+                'Индекс FTS5 недоступен: поиск работает без индекса.')
+        with transaction.atomic():
+            indexed = search.rebuild()
+        self.stdout.write(f'Проиндексировано публикаций: {indexed}')
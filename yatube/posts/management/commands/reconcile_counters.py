@@ -0,0 +1,66 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F, Q
+
+from posts import counters
+from posts.models import AuthorStats, Post, User
+
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает денормализованные счётчики публикаций, '
+            'подписок и комментариев и исправляет расхождения.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать расхождения, ничего не изменяя.')
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        missing = User.objects.filter(stats__isnull=True)
+        created = missing.count()
+        if not dry_run:
+            for user_id in missing.values_list('pk', flat=True).iterator():
+                counters.create_stats(user_id)
+        self.stdout.write(f'Создано строк счётчиков: {created}')
+
+        fields = counters.actual_counts()
+        drift = Q()
+        for field in fields:
+            drift |= ~Q(**{field: F(f'actual_{field}')})
+        drifted = User.objects.filter(stats__isnull=False).annotate(
+            **{f'actual_{field}': value for field, value in fields.items()},
+            **{field: F(f'stats__{field}') for field in fields},
+        ).filter(drift).values('pk', *(f'actual_{field}' for field in fields))
+        fixed = self._fix(
+            AuthorStats, 'user_id', drifted, list(fields), dry_run)
+        self.stdout.write(f'Исправлено счётчиков пользователей: {fixed}')
+
+        drifted = Post.objects.annotate(
+            actual_comments_count=counters.actual_comments_count(),
+        ).exclude(
+            comments_count=F('actual_comments_count'),
+        ).values('pk', 'actual_comments_count')
+        fixed = self._fix(
+            Post, 'pk', drifted, ['comments_count'], dry_run)
+        self.stdout.write(f'Исправлено счётчиков комментариев: {fixed}')
+
+    def _fix(self, model, key, drifted, fields, dry_run):
+        fixed = 0
+        batch = []
+        for row in drifted.iterator(chunk_size=BATCH_SIZE):
+            fixed += 1
+            batch.append(model(**{key: row['pk']}, **{
+                field: row[f'actual_{field}'] for field in fields}))
+            if len(batch) >= BATCH_SIZE:
+                self._save(model, batch, fields, dry_run)
+                batch = []
+        self._save(model, batch, fields, dry_run)
+        return fixed
+
+    def _save(self, model, batch, fields, dry_run):
+        if batch and not dry_run:
+            with transaction.atomic():
+                model.objects.bulk_update(batch, fields)
@@ -0,0 +1,37 @@
+# Generated by Django 2.2.19 on 2026-10-18 20:30
+
+from django.db import migrations, models
+import django.db.models.expressions
+
+
+def drop_invalid_follows(apps, schema_editor):
+    Follow = apps.get_model('posts', 'Follow')
+    Follow.objects.filter(
+        user=django.db.models.expressions.F('author')).delete()
+    seen = set()
+    duplicates = []
+    for follow in Follow.objects.order_by('pk').iterator():
+        pair = (follow.user_id, follow.author_id)
+        if pair in seen:
+            duplicates.append(follow.pk)
+        seen.add(pair)
+    Follow.objects.filter(pk__in=duplicates).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0007_auto_20220829_1714'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_invalid_follows, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='follow',
+            constraint=models.UniqueConstraint(fields=('user', 'author'), name='unique_follow'),
+        ),
+        migrations.AddConstraint(
+            model_name='follow',
+            constraint=models.CheckConstraint(check=models.Q(_negated=True, user=django.db.models.expressions.F('author')), name='prevent_self_follow'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 2.2.19 on 2026-10-18 20:35
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0009_author_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostImage',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, verbose_name='Вариант')),
+                ('source', models.CharField(max_length=255, verbose_name='Исходное изображение')),
+                ('url', models.CharField(max_length=255, verbose_name='Адрес')),
+                ('width', models.PositiveIntegerField(verbose_name='Ширина')),
+                ('height', models.PositiveIntegerField(verbose_name='Высота')),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='images', to='posts.Post', verbose_name='Публикация')),
+            ],
+            options={
+                'verbose_name': 'Миниатюра публикации',
+                'verbose_name_plural': 'Миниатюры публикаций',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='postimage',
+            constraint=models.UniqueConstraint(fields=('post', 'name'), name='unique_post_image'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 2.2.19 on 2026-10-18 20:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0010_postimage'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='postimage',
+            options={'verbose_name': 'Вариант изображения публикации', 'verbose_name_plural': 'Варианты изображений публикаций'},
+        ),
+        migrations.RemoveConstraint(
+            model_name='postimage',
+            name='unique_post_image',
+        ),
+        migrations.AddField(
+            model_name='postimage',
+            name='format',
+            field=models.CharField(default='JPEG', max_length=10, verbose_name='Формат'),
+        ),
+        migrations.AddConstraint(
+            model_name='postimage',
+            constraint=models.UniqueConstraint(fields=('post', 'name', 'format', 'width'), name='unique_post_image_variant'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+from django.db import migrations
+from django.db.utils import OperationalError
+
+CREATE_INDEX = (
+    'CREATE VIRTUAL TABLE posts_search USING fts5('
+    "text, comments, tokenize='unicode61 remove_diacritics 2', "
+    "prefix='2 3')"
+)
+RANK = "INSERT INTO posts_search (posts_search, rank) VALUES ('rank', %s)"
+FILL_INDEX = (
+    'INSERT INTO posts_search (rowid, text, comments) '
+    'SELECT id, text, (SELECT group_concat(text, %s) '
+    'FROM posts_comment WHERE post_id = posts_post.id) '
+    'FROM posts_post'
+)
+
+
+def create_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        try:
+            cursor.execute(CREATE_INDEX)
+        except OperationalError:
+            # SQLite собран без FTS5: поиск работает через icontains.
+            return
+        cursor.execute(RANK, ['bm25(10.0, 1.0)'])
+        cursor.execute(FILL_INDEX, ['\n'])
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS posts_search')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0012_content_addressed_image'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
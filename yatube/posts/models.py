@@ -1,6 +1,9 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.db import models
 
+from .storage import ContentAddressedStorage
+
 User = get_user_model()
 
 
@@ -12,13 +15,13 @@ class Post(models.Model):
     pub_date = models.DateTimeField(
         'Дата публикации',
         auto_now_add=True,
-        db_index=True,
     )
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
         related_name='posts',
         verbose_name='Автор публикации',
+        db_index=False,
     )
     group = models.ForeignKey(
         'Group',
@@ -27,23 +30,72 @@ class Post(models.Model):
         on_delete=models.SET_NULL,
         related_name='posts',
         verbose_name='Сообщество',
+        db_index=False,
         help_text='Сообщество, к которому будет относиться публикация'
     )
     image = models.ImageField(
         'Изображение',
         upload_to='posts/',
+        storage=ContentAddressedStorage(),
         blank=True,
         help_text='Добавьте изображение'
     )
+    comments_count = models.PositiveIntegerField(
+        'Количество комментариев',
+        default=0,
+        editable=False,
+    )
 
     class Meta:
         ordering = ('-pub_date',)
         verbose_name = 'Публикация'
         verbose_name_plural = 'Публикации'
+        # Индексы повторяют порядок KeysetPaginator (pub_date, id): лента,
+        # сообщество и профиль читаются диапазоном без сортировки. Они же
+        # заменяют одиночные индексы внешних ключей.
+        indexes = [
+            models.Index(fields=['-pub_date', '-id'],
+                         name='post_pub_date_idx'),
+            models.Index(fields=['group', '-pub_date', '-id'],
+                         name='post_group_pub_date_idx'),
+            models.Index(fields=['author', '-pub_date', '-id'],
+                         name='post_author_pub_date_idx'),
+        ]
 
     def __str__(self):
         return self.text[:15]
 
+    @property
+    def preview(self):
+        """Начало текста для карточки списка.
+
+        Берётся из аннотации ``text_preview`` (см. ``cards.for_cards``),
+        а без неё — из полного текста.
+        """
+        text = getattr(self, 'text_preview', None)
+        if text is None:
+            text = self.text
+        if len(text) > settings.POST_PREVIEW_LENGTH:
+            return text[:settings.POST_PREVIEW_LENGTH].rstrip() + '…'
+        return text
+
+    def image_variants(self):
+        """Готовые варианты текущего изображения публикации.
+
+        Использует ``prefetch_related('images')``, если он был сделан.
+        """
+        if not self.image:
+            return []
+        return [image for image in self.images.all()
+                if image.source == self.image.name]
+
+    @property
+    def card_image(self):
+        """Самый широкий JPEG-вариант или None, если вариантов ещё нет."""
+        jpegs = [image for image in self.image_variants()
+                 if image.format == 'JPEG']
+        return max(jpegs, key=lambda image: image.width, default=None)
+
 
 class Group(models.Model):
     title = models.CharField('Название сообщества', max_length=200)
@@ -66,7 +118,8 @@ class Comment(models.Model):
         on_delete=models.CASCADE,
         related_name='comments',
         verbose_name='Публикация',
-        help_text='Ссылка на публикацию, к которой оставлен комментарий'
+        help_text='Ссылка на публикацию, к которой оставлен комментарий',
+        db_index=False,
     )
     author = models.ForeignKey(
         User,
@@ -84,6 +137,10 @@ class Comment(models.Model):
         ordering = ('-created',)
         verbose_name = 'Комментарий'
         verbose_name_plural = 'Комментарии'
+        indexes = [
+            models.Index(fields=['post', '-created', '-id'],
+                         name='comment_post_created_idx'),
+        ]
 
     def __str__(self):
         return self.text[:30]
@@ -95,6 +152,7 @@ class Follow(models.Model):
         on_delete=models.CASCADE,
         related_name='follower',
         verbose_name='Подписчик',
+        db_index=False,
     )
     author = models.ForeignKey(
         User,
@@ -110,8 +168,113 @@ class Follow(models.Model):
             models.UniqueConstraint(fields=['user', 'author'],
                                     name='unique_follow'),
             models.CheckConstraint(name="prevent_self_follow",
-                                   check=~models.Q(user=models.F("user")),)
+                                   check=~models.Q(user=models.F("author")),)
         ]
 
     def __str__(self):
         return f'{self.user} подписан на {self.author}'
+
+
+class PostImage(models.Model):
+    """Заранее подготовленный вариант изображения публикации.
+
+    Создаётся задачей ``posts.tasks.generate_thumbnails`` после
+    сохранения изображения, поэтому шаблоны берут готовый URL и не
+    обращаются к движку sorl-thumbnail.
+    """
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='images',
+        verbose_name='Публикация',
+    )
+    name = models.CharField('Вариант', max_length=50)
+    format = models.CharField('Формат', max_length=10, default='JPEG')
+    source = models.CharField('Исходное изображение', max_length=255)
+    url = models.CharField('Адрес', max_length=255)
+    width = models.PositiveIntegerField('Ширина')
+    height = models.PositiveIntegerField('Высота')
+
+    class Meta:
+        verbose_name = 'Вариант изображения публикации'
+        verbose_name_plural = 'Варианты изображений публикаций'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['post', 'name', 'format', 'width'],
+                name='unique_post_image_variant'),
+        ]
+
+    def __str__(self):
+        return f'{self.name} {self.format} {self.width}w'
+
+
+class AuthorStats(models.Model):
+    """Счётчики пользователя, обновляемые при записи.
+
+    Избавляют страницы профиля и публикации от отдельных ``COUNT(*)``.
+    Поддерживаются сигналами ``Post``/``Follow``, расхождения исправляет
+    команда ``reconcile_counters``.
+    """
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats',
+        verbose_name='Пользователь',
+    )
+    posts_count = models.PositiveIntegerField('Публикаций', default=0)
+    followers_count = models.PositiveIntegerField('Подписчиков', default=0)
+    following_count = models.PositiveIntegerField('Подписок', default=0)
+
+    class Meta:
+        verbose_name = 'Счётчики пользователя'
+        verbose_name_plural = 'Счётчики пользователей'
+
+    def __str__(self):
+        return f'Счётчики {self.user_id}'
+
+
+class FeedItem(models.Model):
+    """Запись материализованной ленты подписок пользователя.
+
+    Заполняется при публикации поста (fan-out on write), дополняется при
+    подписке и очищается при отписке. ``pub_date`` и ``author``
+    продублированы из публикации, чтобы лента читалась одним диапазоном
+    по индексу ``(user, pub_date)`` без сортировки по ``posts_post``.
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feed_items',
+        verbose_name='Подписчик',
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='feed_items',
+        verbose_name='Публикация',
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор публикации',
+    )
+    pub_date = models.DateTimeField('Дата публикации')
+
+    class Meta:
+        verbose_name = 'Запись ленты подписок'
+        verbose_name_plural = 'Записи ленты подписок'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'post'],
+                                    name='unique_feed_item'),
+        ]
+        indexes = [
+            models.Index(fields=['user', '-pub_date', '-post'],
+                         name='feed_user_pub_date_idx'),
+            models.Index(fields=['user', 'author'],
+                         name='feed_user_author_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.post_id} в ленте {self.user_id}'
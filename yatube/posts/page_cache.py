@@ -0,0 +1,126 @@
+"""Кэш целых страниц для анонимных посетителей.
+
+Запись кэша хранит ответ и версии областей ``posts.cache`` (``post:<id>``,
+``group:<id>``, ``author:<id>``, ``groups``, ``posts``), с которыми он
+был отрисован, — это теги записи. Запись в ``post_create``,
+``post_edit`` и ``add_comment`` меняет версии только затронутых областей
+через сигналы, так что устаревают ровно зависящие от них страницы.
+
+Устаревшая запись не удаляется: первый запрос берёт блокировку
+``lock:<ключ>`` и перерисовывает страницу, а остальные, пока блокировка
+жива, получают прежний ответ (stale-while-revalidate). Так популярная
+страница после правки не перерисовывается всеми воркерами сразу.
+
+Ключ записи — путь и только те параметры запроса, которые читает
+представление (``params``): иначе адреса со случайным ``?x=…`` заполнили
+бы общий кэш и вытеснили настоящие страницы.
+"""
+import hashlib
+from functools import wraps
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache as django_cache
+from django.http import HttpResponse
+
+from . import cache, utils
+from .conditional import page_versions
+
+PREFIX = 'page:'
+LOCK_PREFIX = 'lock:'
+STATUS_HEADER = 'X-Page-Cache'
+# Параметры постраничного вывода списков (posts.utils.paginator).
+LIST_PARAMS = ('page', 'cursor')
+
+
+def is_anonymous(request):
+    """Аноним без сессии: проверка без обращения к базе сессий."""
+    return (request.method in ('GET', 'HEAD')
+            and settings.SESSION_COOKIE_NAME not in request.COOKIES)
+
+
+def _param(name, value):
+    """Значение параметра для ключа; None — представление его не
+    примет, и страница будет той же, что без него.
+    """
+    if name == 'page':
+        return value if value.isdigit() else None
+    if name == 'cursor':
+        return value if utils.decode_cursor(value) else None
+    return value
+
+
+def page_key(request, params=()):
+    query = []
+    for name in params:
+        value = _param(name, request.GET.get(name, ''))
+        if value:
+            query.append((name, value))
+    path = request.path
+    if query:
+        path += '?' + urlencode(query)
+    return PREFIX + hashlib.sha1(path.encode()).hexdigest()
+
+
+def _store(key, versions, response):
+    django_cache.set(key, {
+        'versions': versions,
+        'status': response.status_code,
+        'headers': [
+            (name, value) for name, value in response.items()
+            if name.lower() != 'set-cookie'
+        ],
+        'content': response.content,
+    }, settings.PAGE_CACHE_TIMEOUT)
+
+
+def _restore(entry, status):
+    response = HttpResponse(entry['content'], status=entry['status'])
+    for name, value in entry['headers']:
+        response[name] = value
+    response[STATUS_HEADER] = status
+    return response
+
+
+def _cacheable(request, response):
+    """Только общие для всех анонимов ответы: без cookie и CSRF-токена."""
+    return (response.status_code == 200 and not response.cookies
+            and not response.streaming
+            and not request.META.get('CSRF_COOKIE_USED'))
+
+
+def anonymous_page_cache(scopes_func, params=()):
+    """Декоратор представления: кэш страницы для анонимов по тегам
+    ``scopes_func`` (тем же, что у ``conditional.page_condition``).
+    ``params`` — параметры запроса, от которых зависит страница.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if not is_anonymous(request):
+                return view(request, *args, **kwargs)
+            versions = page_versions(request, scopes_func, args, kwargs)
+            if versions is None:
+                return view(request, *args, **kwargs)
+            key = page_key(request, params)
+            entry = django_cache.get(key)
+            if entry is not None and entry['versions'] == versions:
+                cache.record('page', True)
+                return _restore(entry, 'HIT')
+            cache.record('page', False)
+            lock = LOCK_PREFIX + key
+            locked = django_cache.add(
+                lock, 1, settings.PAGE_CACHE_LOCK_TIMEOUT)
+            if not locked and entry is not None:
+                return _restore(entry, 'STALE')
+            try:
+                response = view(request, *args, **kwargs)
+                if _cacheable(request, response):
+                    _store(key, versions, response)
+            finally:
+                if locked:
+                    django_cache.delete(lock)
+            response[STATUS_HEADER] = 'MISS'
+            return response
+        return wrapper
+    return decorator
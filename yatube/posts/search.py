@@ -0,0 +1,161 @@
+"""Полнотекстовый поиск по публикациям.
+
+Индекс — виртуальная таблица SQLite FTS5 ``posts_search``: строка на
+публикацию с ``rowid`` = ``id`` поста, колонки ``text`` (текст поста) и
+``comments`` (тексты комментариев). Таблицу создаёт миграция, а в
+актуальном состоянии её держит задача ``posts.tasks.index_post``,
+которую ставят сигналы ``Post`` и ``Comment``.
+Результаты упорядочены по bm25, совпадение в тексте поста весит больше
+совпадения в комментариях. Если FTS5 нет (другая СУБД или сборка
+SQLite), поиск откатывается к ``icontains`` по тексту.
+"""
+import re
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils.functional import cached_property
+
+from . import cards
+from .models import Post
+
+TABLE = 'posts_search'
+WORD = re.compile(r'\w+')
+MAX_TERMS = 8
+
+_available = {}
+
+
+def available(using=DEFAULT_DB_ALIAS):
+    """Есть ли в базе индекс FTS5 (проверяется один раз на базу)."""
+    connection = connections[using]
+    key = (using, connection.settings_dict['NAME'])
+    if key not in _available:
+        _available[key] = (
+            connection.vendor == 'sqlite'
+            and TABLE in connection.introspection.table_names())
+    return _available[key]
+
+
+def to_match(query):
+    """Запрос пользователя в выражение MATCH: все слова, последнее — по
+    префиксу, как при наборе.
+
+    Операторы FTS5 из запроса не пропускаются — каждое слово берётся в
+    кавычки, поэтому кавычки и скобки пользователя не ломают запрос.
+    Префикс только у одного слова: раскрытие префикса в список терминов
+    — самая дорогая часть запроса на большом индексе.
+    """
+    terms = [f'"{term}"' for term in WORD.findall(query)[:MAX_TERMS]]
+    if terms:
+        terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def index_post(post_id):
+    index_posts([post_id])
+
+
+def index_posts(post_ids):
+    """Индексирует публикации вместе с их комментариями."""
+    if not available() or not post_ids:
+        return
+    with connections[DEFAULT_DB_ALIAS].cursor() as cursor:
+        cursor.execute(
+            f'INSERT OR REPLACE INTO {TABLE} (rowid, text, comments) '
+            'SELECT id, text, (SELECT group_concat(text, %s) '
+            'FROM posts_comment WHERE post_id = posts_post.id) '
+            'FROM posts_post WHERE id IN ({})'.format(
+                ', '.join(['%s'] * len(post_ids))),
+            ['\n', *post_ids])
+
+
+def remove_post(post_id):
+    if not available():
+        return
+    with connections[DEFAULT_DB_ALIAS].cursor() as cursor:
+        cursor.execute(f'DELETE FROM {TABLE} WHERE rowid = %s', [post_id])
+
+
+def rebuild():
+    """Перестраивает индекс целиком. Возвращает число публикаций."""
+    if not available():
+        return 0
+    with connections[DEFAULT_DB_ALIAS].cursor() as cursor:
+        cursor.execute(f'DELETE FROM {TABLE}')
+        cursor.execute(
+            f'INSERT INTO {TABLE} (rowid, text, comments) '
+            'SELECT id, text, (SELECT group_concat(text, %s) '
+            'FROM posts_comment WHERE post_id = posts_post.id) '
+            'FROM posts_post',
+            ['\n'])
+        indexed = cursor.rowcount
+        cursor.execute(f"INSERT INTO {TABLE} ({TABLE}) VALUES ('optimize')")
+    return indexed
+
+
+def filter_posts(queryset, query):
+    """Ограничивает queryset публикациями, подходящими под запрос.
+
+    Порядок queryset не меняется — так поиск работает в админке.
+    """
+    match = to_match(query)
+    if not match:
+        return queryset.none()
+    if not available():
+        return queryset.filter(text__icontains=query)
+    return queryset.extra(
+        where=[f'{Post._meta.db_table}.id IN (SELECT rowid FROM {TABLE} '
+               f'WHERE {TABLE} MATCH %s)'],
+        params=[match])
+
+
+class SearchResults:
+    """Ленивый результат поиска для ``Paginator``.
+
+    ``count()`` и срез выполняются по индексу; публикации страницы
+    подгружаются одним запросом по списку id с сохранением порядка bm25.
+    """
+
+    def __init__(self, query, queryset=None):
+        self.query = query
+        self.match = to_match(query)
+        if queryset is None:
+            queryset = cards.for_cards(Post.objects.all())
+        self.queryset = queryset
+
+    def _execute(self, sql, params):
+        with connections[DEFAULT_DB_ALIAS].cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+
+    @cached_property
+    def _fallback(self):
+        return self.queryset.filter(
+            text__icontains=self.query).order_by('-pub_date', '-pk')
+
+    def count(self):
+        if not self.match:
+            return 0
+        if not available():
+            return self._fallback.count()
+        return self._execute(
+            f'SELECT count(*) FROM {TABLE} WHERE {TABLE} MATCH %s',
+            [self.match])[0][0]
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        if not self.match:
+            return []
+        if not available():
+            return list(self._fallback[index])
+        start = index.start or 0
+        limit = -1 if index.stop is None else max(0, index.stop - start)
+        ids = [row[0] for row in self._execute(
+            f'SELECT rowid FROM {TABLE} WHERE {TABLE} MATCH %s '
+            'ORDER BY rank LIMIT %s OFFSET %s',
+            [self.match, limit, start])]
+        posts = self.queryset.in_bulk(ids)
+        return [posts[pk] for pk in ids if pk in posts]
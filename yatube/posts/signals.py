@@ -0,0 +1,131 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import cache, counters, feed, search, tasks
+from .models import AuthorStats, Comment, Follow, Group, Post, User
+
+
+@receiver(post_save, sender=User)
+def create_author_stats(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        AuthorStats.objects.get_or_create(user=instance)
+
+
+@receiver(post_save, sender=Post)
+def fan_out_post(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        counters.change(instance.author_id, 'posts_count', 1)
+        tasks.fan_out_post.enqueue(
+            instance.pk, key=f'fan_out_post:{instance.pk}')
+
+
+@receiver(post_delete, sender=Post)
+def count_deleted_post(sender, instance, **kwargs):
+    counters.change(instance.author_id, 'posts_count', -1)
+
+
+@receiver(post_save, sender=Comment)
+def count_comment(sender, instance, created, raw=False, **kwargs):
+    if created and not raw and instance.post_id:
+        counters.change_comments(instance.post_id, 1)
+
+
+@receiver(post_delete, sender=Comment)
+def count_deleted_comment(sender, instance, **kwargs):
+    if instance.post_id:
+        counters.change_comments(instance.post_id, -1)
+
+
+@receiver(post_save, sender=Follow)
+def backfill_feed(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        counters.change(instance.author_id, 'followers_count', 1)
+        counters.change(instance.user_id, 'following_count', 1)
+        feed.backfill(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def trim_feed(sender, instance, **kwargs):
+    counters.change(instance.author_id, 'followers_count', -1)
+    counters.change(instance.user_id, 'following_count', -1)
+    feed.trim(instance.user_id, instance.author_id)
+
+
+@receiver(post_save, sender=User)
+def invalidate_author(sender, instance, created, update_fields=None,
+                      **kwargs):
+    if not created and update_fields != frozenset(('last_login',)):
+        # Имя автора выводится и на страницах групп его публикаций.
+        group_ids = Post.objects.filter(
+            author=instance, group__isnull=False,
+        ).values_list('group_id', flat=True).distinct()
+        cache.bump('posts', f'author:{instance.pk}',
+                   *(f'group:{group_id}' for group_id in group_ids))
+
+
+@receiver(pre_save, sender=Post)
+def remember_previous_state(sender, instance, raw=False, **kwargs):
+    instance._previous_group_ids = ()
+    instance._image_changed = bool(instance.image)
+    if instance.pk and not raw:
+        previous = Post.objects.filter(pk=instance.pk).values(
+            'group_id', 'image').first()
+        if previous is not None:
+            if previous['group_id'] != instance.group_id:
+                instance._previous_group_ids = (previous['group_id'],)
+            instance._image_changed = (
+                previous['image'] != instance.image.name)
+
+
+@receiver(post_save, sender=Post)
+def schedule_thumbnails(sender, instance, raw=False, **kwargs):
+    if not raw and getattr(instance, '_image_changed', False):
+        tasks.generate_thumbnails.enqueue(
+            instance.pk, key=f'thumbnails:{instance.pk}')
+
+
+@receiver(post_save, sender=Post)
+def index_post(sender, instance, raw=False, **kwargs):
+    if not raw:
+        tasks.index_post.enqueue(instance.pk, key=f'search:{instance.pk}')
+
+
+@receiver(post_delete, sender=Post)
+def unindex_post(sender, instance, **kwargs):
+    search.remove_post(instance.pk)
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def index_comments(sender, instance, raw=False, **kwargs):
+    if not raw and instance.post_id:
+        tasks.index_post.enqueue(
+            instance.post_id, key=f'search:{instance.post_id}')
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def invalidate_post(sender, instance, **kwargs):
+    cache.bump(*cache.post_scopes(
+        instance, getattr(instance, '_previous_group_ids', ())))
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_comment(sender, instance, **kwargs):
+    post = Post.objects.filter(pk=instance.post_id).only(
+        'author_id', 'group_id').first()
+    if post is not None:
+        cache.bump(*cache.post_scopes(post))
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def invalidate_group(sender, instance, **kwargs):
+    cache.bump('posts', 'groups', f'group:{instance.pk}')
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def invalidate_follow(sender, instance, **kwargs):
+    cache.bump(f'author:{instance.author_id}', f'author:{instance.user_id}')
@@ -0,0 +1,50 @@
+"""Хранилище изображений публикаций с адресацией по содержимому.
+
+Файл сохраняется под именем из SHA-256 его содержимого, поэтому
+повторно загруженное изображение не копируется: все публикации
+ссылаются на один файл и один набор вариантов (``thumbs/<имя>/``).
+Содержимое по такому адресу никогда не меняется, и его можно отдавать
+с неограниченным кэшированием.
+"""
+import hashlib
+import os
+import re
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+
+HASHED_NAME = re.compile(
+    r'^(thumbs/)?[\w-]+/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.\w+(/|$)')
+
+
+def is_immutable(name):
+    """Имя файла (или его варианта), выданное по содержимому."""
+    return bool(HASHED_NAME.match(name))
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    def hashed_name(self, name, content):
+        digest = hashlib.sha256()
+        content.seek(0)
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        digest = digest.hexdigest()
+        directory = os.path.dirname(name)
+        extension = os.path.splitext(name)[1].lower()
+        return '/'.join(filter(None, (
+            directory, digest[:2], digest[2:4], digest + extension)))
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.hashed_name(name, content)
+        # Повторная загрузка обновляет время файла: collect_media_garbage
+        # не удаляет файлы моложе --min-age, пока ссылку не сохранили.
+        try:
+            os.utime(self.path(name))
+        except FileNotFoundError:
+            return self._save(name, content)
+        return name
@@ -0,0 +1,147 @@
+"""Потоковые RSS/Atom-ленты и карта сайта.
+
+Документы собираются генераторами строк для ``StreamingHttpResponse``:
+записи читаются из базы ``values_list().iterator()`` порциями, так что
+ни лента, ни раздел карты сайта не держат в памяти все публикации.
+
+Карта сайта — индекс ``sitemap.xml`` и разделы по диапазонам id
+публикаций по ``SITEMAP_SIZE`` адресов. Индексу нужен только
+наибольший id, без ``COUNT(*)``, а раздел читается диапазоном по
+первичному ключу. Разделы могут быть неполными, если публикации
+удалялись.
+"""
+import re
+from xml.sax.saxutils import escape, quoteattr
+
+from django.conf import settings
+from django.db.models import Max
+from django.db.models.functions import Substr
+from django.urls import reverse
+from django.utils.feedgenerator import rfc2822_date, rfc3339_date
+
+from .models import Group, Post
+
+# Символы, недопустимые в XML 1.0, из пользовательского текста.
+INVALID_XML = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]')
+CHUNK_SIZE = 2000
+XML_DECLARATION = '<?xml version="1.0" encoding="utf-8"?>\n'
+SITEMAP_NS = 'http://www.sitemaps.org/schemas/sitemap/0.9'
+# Подставляется в reverse() вместо id, чтобы не разбирать URLconf для
+# каждой из десятков тысяч строк карты сайта.
+ID_PLACEHOLDER = 2 ** 31 - 1
+
+
+def text(value):
+    return escape(INVALID_XML.sub('', value or ''))
+
+
+def url_pattern(name):
+    """Шаблон адреса с одним числовым аргументом для str.format."""
+    return reverse(name, args=(ID_PLACEHOLDER,)).replace(
+        str(ID_PLACEHOLDER), '{}')
+
+
+def feed_items(posts):
+    """Последние публикации ленты: (id, заголовок, анонс, дата, автор,
+    сообщество).
+    """
+    length = settings.POST_PREVIEW_LENGTH
+    rows = posts.order_by('-pub_date', '-pk').annotate(
+        text_preview=Substr('text', 1, length + 1),
+    ).values_list('pk', 'text_preview', 'pub_date', 'author__username',
+                  'group__title')[:settings.FEED_ITEMS]
+    for pk, preview, pub_date, author, group in rows.iterator(
+            chunk_size=CHUNK_SIZE):
+        if len(preview) > length:
+            preview = preview[:length].rstrip() + '…'
+        title = preview.split('\n', 1)[0][:settings.FEED_TITLE_LENGTH]
+        yield pk, title, preview, pub_date, author, group
+
+
+def rss(base_url, title, link, description, posts):
+    post_url = base_url + url_pattern('posts:post_detail')
+    yield XML_DECLARATION
+    yield ('<rss version="2.0" xmlns:dc="http://purl.org/dc/elements/1.1/">'
+           '<channel>'
+           f'<title>{text(title)}</title><link>{text(link)}</link>'
+           f'<description>{text(description)}</description>'
+           '<language>ru</language>')
+    for pk, item_title, preview, pub_date, author, group in feed_items(
+            posts):
+        url = text(post_url.format(pk))
+        category = f'<category>{text(group)}</category>' if group else ''
+        yield (f'<item><title>{text(item_title)}</title>'
+               f'<link>{url}</link><guid>{url}</guid>'
+               f'<description>{text(preview)}</description>'
+               f'<pubDate>{rfc2822_date(pub_date)}</pubDate>'
+               f'<dc:creator>{text(author)}</dc:creator>{category}</item>')
+    yield '</channel></rss>\n'
+
+
+def atom(base_url, title, link, description, posts, updated):
+    post_url = base_url + url_pattern('posts:post_detail')
+    yield XML_DECLARATION
+    yield ('<feed xmlns="http://www.w3.org/2005/Atom" xml:lang="ru">'
+           f'<title>{text(title)}</title>'
+           f'<link href={quoteattr(link)} rel="alternate"/>'
+           f'<id>{text(link)}</id>'
+           f'<subtitle>{text(description)}</subtitle>'
+           f'<updated>{rfc3339_date(updated)}</updated>')
+    for pk, item_title, preview, pub_date, author, group in feed_items(
+            posts):
+        url = post_url.format(pk)
+        term = quoteattr(INVALID_XML.sub('', group or ''))
+        category = f'<category term={term}/>' if group else ''
+        yield (f'<entry><title>{text(item_title)}</title>'
+               f'<link href={quoteattr(url)} rel="alternate"/>'
+               f'<id>{text(url)}</id>'
+               f'<updated>{rfc3339_date(pub_date)}</updated>'
+               f'<author><name>{text(author)}</name></author>'
+               f'<summary>{text(preview)}</summary>{category}</entry>')
+    yield '</feed>\n'
+
+
+def sitemap_sections():
+    """Номера разделов карты сайта с публикациями (с нуля)."""
+    last_id = Post.objects.aggregate(last_id=Max('pk'))['last_id'] or 0
+    return range(-(-last_id // settings.SITEMAP_SIZE))
+
+
+def sitemap_index(base_url):
+    section_url = base_url + url_pattern('posts:sitemap_posts')
+    groups_url = base_url + reverse('posts:sitemap_groups')
+    yield XML_DECLARATION
+    yield f'<sitemapindex xmlns="{SITEMAP_NS}">'
+    yield f'<sitemap><loc>{text(groups_url)}</loc></sitemap>'
+    for section in sitemap_sections():
+        url = text(section_url.format(section))
+        yield f'<sitemap><loc>{url}</loc></sitemap>'
+    yield '</sitemapindex>\n'
+
+
+def _urlset(rows):
+    yield XML_DECLARATION
+    yield f'<urlset xmlns="{SITEMAP_NS}">'
+    for loc, lastmod in rows:
+        lastmod = (f'<lastmod>{lastmod.date().isoformat()}</lastmod>'
+                   if lastmod else '')
+        yield f'<url><loc>{text(loc)}</loc>{lastmod}</url>'
+    yield '</urlset>\n'
+
+
+def sitemap_posts(base_url, section):
+    post_url = base_url + url_pattern('posts:post_detail')
+    first = section * settings.SITEMAP_SIZE + 1
+    rows = Post.objects.filter(
+        pk__range=(first, first + settings.SITEMAP_SIZE - 1),
+    ).order_by('pk').values_list('pk', 'pub_date')
+    return _urlset(
+        (post_url.format(pk), pub_date)
+        for pk, pub_date in rows.iterator(chunk_size=CHUNK_SIZE))
+
+
+def sitemap_groups(base_url):
+    slugs = Group.objects.order_by('pk').values_list('slug', flat=True)
+    return _urlset(
+        (base_url + reverse('posts:group_list', args=(slug,)), None)
+        for slug in slugs.iterator(chunk_size=CHUNK_SIZE))
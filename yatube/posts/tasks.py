@@ -0,0 +1,26 @@
+"""Фоновые задачи публикаций: работа после записи, которой не место в
+запросе. Все задачи идемпотентны и переживают удаление публикации.
+"""
+from jobs.registry import task
+
+from . import feed, search, thumbnails
+from .models import Post
+
+
+@task()
+def fan_out_post(post_id):
+    post = Post.objects.filter(pk=post_id).only(
+        'author_id', 'pub_date').first()
+    if post is not None:
+        feed.fan_out(post)
+
+
+@task()
+def index_post(post_id):
+    """Индексирует публикацию вместе с комментариями."""
+    search.index_post(post_id)
+
+
+@task(max_attempts=3, retry_delay=60)
+def generate_thumbnails(post_id):
+    thumbnails.generate(post_id)
@@ -0,0 +1,39 @@
+from itertools import groupby
+
+from django import template
+
+from posts import thumbnails
+
+register = template.Library()
+
+SIZES = '(max-width: 960px) 100vw, 960px'
+
+
+def srcset(images):
+    return ', '.join(f'{image.url} {image.width}w' for image in images)
+
+
+@register.inclusion_tag('posts/includes/post_image.html')
+def post_picture(post):
+    """Разметка <picture> с вариантами изображения публикации."""
+    variants = sorted(
+        post.image_variants(),
+        key=lambda image: (image.format, image.width))
+    by_format = {
+        image_format: list(images)
+        for image_format, images in groupby(
+            variants, key=lambda image: image.format)
+    }
+    jpegs = by_format.pop(thumbnails.FALLBACK_FORMAT, [])
+    return {
+        'post': post,
+        'image': jpegs[-1] if jpegs else None,
+        'srcset': srcset(jpegs),
+        'sizes': SIZES,
+        'sources': [
+            {'type': thumbnails.MIME_TYPES[image_format],
+             'srcset': srcset(by_format[image_format])}
+            for image_format in thumbnails.EXTENSIONS
+            if image_format in by_format
+        ],
+    }
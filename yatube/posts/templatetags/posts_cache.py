@@ -0,0 +1,58 @@
+from django import template
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+
+from posts import cache as posts_cache
+from posts import cards
+
+register = template.Library()
+
+
+class VersionedCacheNode(template.Node):
+    def __init__(self, nodelist, fragment_name, vary_on):
+        self.nodelist = nodelist
+        self.fragment_name = fragment_name
+        self.vary_on = vary_on
+
+    def render(self, context):
+        vary_on = [var.resolve(context) for var in self.vary_on]
+        key = make_template_fragment_key(self.fragment_name, vary_on)
+        value = cache.get(key)
+        posts_cache.record(self.fragment_name, value is not None)
+        if value is None:
+            value = self.nodelist.render(context)
+            cache.set(key, value, settings.FRAGMENT_CACHE_TIMEOUT)
+        return value
+
+
+@register.tag('versioned_cache')
+def do_versioned_cache(parser, token):
+    """Кэширует фрагмент на FRAGMENT_CACHE_TIMEOUT секунд.
+
+    Первым аргументом после имени передаётся версия из
+    ``posts.cache.version()``, поэтому фрагмент обновляется сразу после
+    изменения данных::
+
+        {% versioned_cache index_page cache_version page_obj.number %}
+            ...
+        {% endversioned_cache %}
+    """
+    nodelist = parser.parse(('endversioned_cache',))
+    parser.delete_first_token()
+    tokens = token.split_contents()
+    if len(tokens) < 3:
+        raise template.TemplateSyntaxError(
+            f"'{tokens[0]}' tag requires fragment name and version.")
+    return VersionedCacheNode(
+        nodelist,
+        tokens[1],
+        [parser.compile_filter(token) for token in tokens[2:]],
+    )
+
+
+@register.simple_tag(takes_context=True)
+def post_cards(context, posts):
+    """Карточки публикаций страницы из кэша posts.cards."""
+    return cards.render_cards(
+        posts, author=context.get('author'), group=context.get('group'))
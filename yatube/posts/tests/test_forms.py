@@ -1,15 +1,21 @@
+import hashlib
+import os
 import shutil
 import tempfile
+from io import BytesIO, StringIO
 
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
 from django.test import Client, override_settings, TestCase
 from django.urls import reverse
 from http import HTTPStatus
+from PIL import Image
 
 from ..models import Comment, Group, Post
 from ..forms import PostForm
+from ..uploads import OversizedUploadedFile
 
 User = get_user_model()
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
@@ -78,7 +84,9 @@ class PostCreateFormTests(TestCase):
                          'Сообщество редактируемой публикации не совпадает')
         self.assertEqual(post.text, form_data['text'],
                          'Текст редактируемой публикации не совпадает')
-        self.assertEqual(post.image.name, f'posts/{form_data["image"].name}',
+        digest = hashlib.sha256(test_gif).hexdigest()
+        self.assertEqual(post.image.name,
+                         f'posts/{digest[:2]}/{digest[2:4]}/{digest}.gif',
                          'Изображение редактируемой публикации не совпадает')
 
     def test_create_post_form_fields_label(self):
@@ -144,16 +152,15 @@ class PostCreateFormTests(TestCase):
                          'Сообщество редактируемой публикации не совпадает')
         self.assertEqual(post.text, form_data['text'],
                          'Текст редактируемой публикации не совпадает')
-        self.assertEqual(post.image.name, f'posts/{form_data["image"].name}',
+        digest = hashlib.sha256(test_gif).hexdigest()
+        self.assertEqual(post.image.name,
+                         f'posts/{digest[:2]}/{digest[2:4]}/{digest}.gif',
                          'Изображение редактируемой публикации не совпадает')
         # Проверка доступности старой группы после редактирования публикации
-        self.assertEqual(self.client.get(
-            reverse('posts:group_list', args=(self.group.slug,))).status_code,
-            HTTPStatus.OK.value
-        )
-        # Проверка на пустоту paginator старой группы
         response = self.client.get(
             reverse('posts:group_list', args=(self.group.slug,)))
+        self.assertEqual(response.status_code, HTTPStatus.OK.value)
+        # Проверка на пустоту paginator старой группы
         self.assertEqual(len(response.context['page_obj']), 0)
 
     def test_post_create_unavailable_anonymous(self):
@@ -205,3 +212,92 @@ class PostCreateFormTests(TestCase):
         self.assertEqual(comment.post.id, self.post.id)
         self.assertEqual(comment.author, self.user)
         self.assertEqual(comment.text, form_data['text'])
+
+    @override_settings(POST_IMAGE_MAX_UPLOAD_SIZE=1024)
+    def test_oversized_image_rejected_without_saving(self):
+        """Приём слишком большого файла прекращается, публикация
+        не создаётся.
+        """
+        uploaded = SimpleUploadedFile(
+            name='big.gif',
+            content=b'GIF89a' + b'\x00' * 4096,
+            content_type='image/gif'
+        )
+        response = self.authorized_client.post(
+            reverse('posts:post_create'),
+            data={'text': 'Большое изображение', 'image': uploaded},
+        )
+        self.assertEqual(Post.objects.count(), 1)
+        self.assertIsInstance(
+            response.context['form'].files['image'], OversizedUploadedFile)
+        self.assertFormError(
+            response, 'form', 'image',
+            'Размер файла не должен превышать 1,0\xa0КБ.')
+
+    @override_settings(POST_IMAGE_MAX_PIXELS=100)
+    def test_image_pixels_checked_by_header(self):
+        """Изображение с числом пикселей больше лимита отклоняется."""
+        response = self.authorized_client.post(
+            reverse('posts:post_create'),
+            data={'text': 'Большое изображение',
+                  'image': self.make_jpeg('wide.jpg', (20, 10))},
+        )
+        self.assertEqual(Post.objects.count(), 1)
+        self.assertEqual(
+            response.context['form'].errors['image'][0],
+            'Изображение не должно быть больше 0 мегапикселей.')
+
+    @override_settings(POST_IMAGE_MAX_DIMENSION=40)
+    def test_image_downscaled_and_exif_stripped(self):
+        """Большое изображение уменьшается, EXIF удаляется."""
+        self.authorized_client.post(
+            reverse('posts:post_create'),
+            data={'text': 'Изображение с EXIF',
+                  'image': self.make_jpeg('photo.jpg', (100, 50))},
+        )
+        post = Post.objects.exclude(pk=self.post.pk).get()
+        with Image.open(post.image.path) as image:
+            self.assertEqual(image.size, (40, 20))
+            self.assertNotIn('exif', image.info)
+
+    def make_jpeg(self, name, size):
+        exif = Image.Exif()
+        exif[0x0110] = 'Тестовая камера'
+        buffer = BytesIO()
+        Image.new('RGB', size, 'red').save(
+            buffer, 'JPEG', exif=exif.tobytes())
+        return SimpleUploadedFile(name, buffer.getvalue(), 'image/jpeg')
+
+    def test_same_image_stored_once(self):
+        """Одинаковые изображения разных публикаций хранятся одним
+        файлом, неиспользуемый файл удаляется сборщиком мусора.
+        """
+        for number in range(2):
+            self.authorized_client.post(
+                reverse('posts:post_create'),
+                data={'text': f'Публикация {number}',
+                      'image': self.make_jpeg(f'photo{number}.jpg', (8, 8))},
+            )
+        first, second = Post.objects.exclude(pk=self.post.pk)
+        self.assertEqual(first.image.name, second.image.name)
+        storage = first.image.storage
+        self.assertTrue(storage.exists(first.image.name))
+        call_command('collect_media_garbage', min_age=0, stdout=StringIO())
+        self.assertTrue(storage.exists(first.image.name))
+        first.delete()
+        second.delete()
+        call_command('collect_media_garbage', min_age=0, stdout=StringIO())
+        self.assertFalse(storage.exists(first.image.name))
+
+    def test_reupload_refreshes_unreferenced_image(self):
+        """Повторная загрузка старого неиспользуемого файла обновляет
+        его время, и сборщик мусора его не удаляет.
+        """
+        storage = Post._meta.get_field('image').storage
+        name = storage.save('posts/photo.jpg', self.make_jpeg('a.jpg', (8, 8)))
+        os.utime(storage.path(name), (0, 0))
+        self.assertEqual(
+            storage.save('posts/again.jpg', self.make_jpeg('b.jpg', (8, 8))),
+            name)
+        call_command('collect_media_garbage', stdout=StringIO())
+        self.assertTrue(storage.exists(name))
@@ -1,9 +1,32 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from datetime import datetime, timezone
+from io import BytesIO, StringIO
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command, CommandError
+from django.template import Context, Template
+from django.test import override_settings, TestCase
+from PIL import Image
 
-from ..models import Group, Post
+from .. import search, thumbnails
+from ..models import (AuthorStats, Comment, FeedItem, Follow, Group, Post,
+                      PostImage)
 
 User = get_user_model()
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x01\x00'
+    b'\x01\x00\x00\x00\x00\x21\xf9\x04'
+    b'\x01\x0a\x00\x01\x00\x2c\x00\x00'
+    b'\x00\x00\x01\x00\x01\x00\x00\x02'
+    b'\x02\x4c\x01\x00\x3b'
+)
 
 
 class PostModelTest(TestCase):
@@ -58,3 +81,260 @@ class PostModelTest(TestCase):
                 self.assertEqual(
                     PostModelTest.post._meta.get_field(field).help_text,
                     expected_value)
+
+
+class CountersTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.user2 = User.objects.create_user(username='test')
+
+    def stats(self, user):
+        return AuthorStats.objects.get(user=user)
+
+    def test_counters_follow_writes(self):
+        """Счётчики публикаций, подписок и комментариев обновляются
+        при создании и удалении объектов.
+        """
+        post = Post.objects.create(author=self.user, text='Тестовый пост')
+        self.assertEqual(self.stats(self.user).posts_count, 1)
+        follow = Follow.objects.create(user=self.user2, author=self.user)
+        self.assertEqual(self.stats(self.user).followers_count, 1)
+        self.assertEqual(self.stats(self.user2).following_count, 1)
+        comment = Comment.objects.create(
+            post=post, author=self.user2, text='Комментарий')
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+        comment.delete()
+        follow.delete()
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 0)
+        self.assertEqual(self.stats(self.user).followers_count, 0)
+        self.assertEqual(self.stats(self.user2).following_count, 0)
+        post.delete()
+        self.assertEqual(self.stats(self.user).posts_count, 0)
+
+    def test_reconcile_counters_fixes_drift(self):
+        """Команда reconcile_counters исправляет расхождения счётчиков."""
+        post = Post.objects.create(author=self.user, text='Тестовый пост')
+        Follow.objects.create(user=self.user2, author=self.user)
+        AuthorStats.objects.filter(user=self.user).update(
+            posts_count=10, followers_count=0)
+        AuthorStats.objects.filter(user=self.user2).delete()
+        Post.objects.update(comments_count=3)
+        call_command('reconcile_counters', stdout=StringIO())
+        self.assertEqual(self.stats(self.user).posts_count, 1)
+        self.assertEqual(self.stats(self.user).followers_count, 1)
+        self.assertEqual(self.stats(self.user2).following_count, 1)
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 0)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class PostImageTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    @override_settings(JOBS_BACKEND='jobs.backends.DatabaseBackend')
+    def test_thumbnails_generated_for_post_image(self):
+        """Варианты изображения готовятся вне запроса и заменяются при
+        смене изображения публикации.
+        """
+        post = Post.objects.create(
+            author=self.user,
+            text='Тестовый пост',
+            image=SimpleUploadedFile('small.gif', SMALL_GIF, 'image/gif'),
+        )
+        self.assertIsNone(post.card_image)
+        call_command(
+            'generate_thumbnails', workers=1, stdout=StringIO())
+        post = Post.objects.prefetch_related('images').get(pk=post.pk)
+        self.assertEqual(
+            (post.card_image.width, post.card_image.height), (960, 339))
+        buffer = BytesIO()
+        Image.new('RGB', (2, 2), 'blue').save(buffer, 'GIF')
+        post.image = SimpleUploadedFile(
+            'other.gif', buffer.getvalue(), 'image/gif')
+        post.save()
+        post = Post.objects.prefetch_related('images').get(pk=post.pk)
+        self.assertIsNone(post.card_image)
+        thumbnails.generate(post.pk)
+        self.assertEqual(
+            PostImage.objects.filter(post=post).count(),
+            len(settings.POST_IMAGE_WIDTHS) * len(
+                thumbnails.output_formats()))
+        self.assertFalse(PostImage.objects.filter(post=post).exclude(
+            source=post.image.name).exists())
+
+    def test_rotated_photo_decoded_at_full_card_size(self):
+        """Повёрнутый по EXIF снимок не уменьшается при декодировании
+        меньше размера карточки.
+        """
+        exif = Image.Exif()
+        exif[thumbnails.EXIF_ORIENTATION] = 6
+        buffer = BytesIO()
+        Image.new('RGB', (4000, 1400), 'red').save(
+            buffer, 'JPEG', exif=exif.tobytes())
+        width, height = settings.POST_IMAGE_SIZE
+        with Image.open(buffer) as image:
+            frame = thumbnails.decode(image, width, height)
+        self.assertEqual(frame.size, (1400, 4000))
+
+    def test_transparency_flattened_onto_white(self):
+        """Прозрачные области изображения в вариантах белые."""
+        for mode in ('RGBA', 'LA', 'P'):
+            with self.subTest(mode=mode):
+                image = Image.new('RGBA', (20, 20), (0, 0, 0, 0))
+                if mode != 'RGBA':
+                    image = image.convert(mode)
+                buffer = BytesIO()
+                image.save(buffer, 'PNG')
+                variants = thumbnails.render_variants(buffer)
+                with Image.open(BytesIO(variants[-1][3])) as variant:
+                    self.assertEqual(
+                        variant.convert('RGB').getpixel((10, 10)),
+                        (255, 255, 255))
+
+    def test_post_picture_lists_all_widths(self):
+        """Разметка <picture> содержит srcset со всеми ширинами."""
+        post = Post.objects.create(
+            author=self.user,
+            text='Тестовый пост',
+            image=SimpleUploadedFile('small.gif', SMALL_GIF, 'image/gif'),
+        )
+        thumbnails.generate(post.pk)
+        post = Post.objects.prefetch_related('images').get(pk=post.pk)
+        html = Template(
+            '{% load post_images %}{% post_picture post %}'
+        ).render(Context({'post': post}))
+        self.assertIn('<picture>', html)
+        for width in settings.POST_IMAGE_WIDTHS:
+            with self.subTest(width=width):
+                self.assertIn(f' {width}w', html)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class DataTransferTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.author = User.objects.create_user(username='auth')
+        self.reader = User.objects.create_user(username='reader')
+        self.group = Group.objects.create(
+            title='Тестовая группа', slug='test_slug', description='Про')
+        self.post = Post.objects.create(
+            author=self.author, group=self.group, text='Старый борщ')
+        self.pub_date = datetime(2020, 1, 2, 3, 4, 5, tzinfo=timezone.utc)
+        Post.objects.filter(pk=self.post.pk).update(pub_date=self.pub_date)
+        Comment.objects.create(
+            post=self.post, author=self.reader, text='Комментарий')
+        Follow.objects.create(user=self.reader, author=self.author)
+
+    def path(self, name):
+        return os.path.join(self.directory.name, name)
+
+    def export(self, name, **options):
+        call_command('export_data', output=self.path(name),
+                     stdout=StringIO(), **options)
+        return self.path(name)
+
+    def load(self, path, **options):
+        output = StringIO()
+        call_command('import_data', path, stdout=output, **options)
+        return output.getvalue()
+
+    def test_ndjson_round_trip_restores_data_and_derived_state(self):
+        """Выгрузка и загрузка в пустую базу восстанавливают записи,
+        даты, счётчики, ленту и поисковый индекс; повтор ничего не
+        дублирует.
+        """
+        path = self.export('dump.ndjson')
+        with open(path, encoding='utf-8') as dump:
+            kinds = [json.loads(line)['kind'] for line in dump]
+        self.assertEqual(kinds, ['group', 'post', 'comment', 'follow'])
+        Group.objects.all().delete()
+        User.objects.all().delete()
+        report = self.load(path)
+        self.assertIn('строк/с', report)
+        post = Post.objects.get(pk=self.post.pk)
+        self.assertEqual(
+            (post.text, post.author.username, post.group.description,
+             post.pub_date, post.comments_count),
+            ('Старый борщ', 'auth', 'Про', self.pub_date, 1))
+        self.assertEqual(post.comments.get().author.username, 'reader')
+        reader = User.objects.get(username='reader')
+        self.assertFalse(reader.has_usable_password())
+        self.assertEqual(reader.stats.following_count, 1)
+        self.assertTrue(FeedItem.objects.filter(
+            user=reader, post=post).exists())
+        self.assertEqual(
+            list(search.SearchResults('борщ')[:10]), [post])
+        self.load(path)
+        self.assertEqual(
+            (Post.objects.count(), Comment.objects.count(),
+             Follow.objects.count()), (1, 1, 1))
+
+    def test_repeated_import_counts_skipped_rows(self):
+        """Записи, которые уже есть в базе, считаются отброшенными."""
+        report = self.load(self.export('dump.ndjson'))
+        for kind in ('group', 'post', 'comment', 'follow'):
+            with self.subTest(kind=kind):
+                self.assertIn(f'{kind}: 1, отброшено 1', report)
+
+    def test_conflicting_id_is_refused(self):
+        """Публикация с id, занятым другой публикацией, останавливает
+        загрузку, и её комментарии не достаются чужой записи.
+        """
+        path = self.export('dump.ndjson')
+        Comment.objects.all().delete()
+        Post.objects.filter(pk=self.post.pk).update(text='Другой текст')
+        with self.assertRaisesMessage(CommandError, f'id={self.post.pk}'):
+            self.load(path)
+        self.assertEqual(
+            Post.objects.get(pk=self.post.pk).text, 'Другой текст')
+        self.assertFalse(Comment.objects.exists())
+
+    def test_broken_record_still_reconciles_loaded_batches(self):
+        """После ошибки в файле записанные пачки получают счётчики."""
+        path = self.export('dump.ndjson')
+        with open(path, 'a', encoding='utf-8') as dump:
+            dump.write(json.dumps({'kind': 'follow', 'user': 'reader'}))
+        Group.objects.all().delete()
+        User.objects.all().delete()
+        with self.assertRaisesMessage(CommandError, 'нет полей author'):
+            self.load(path, batch_size=1)
+        self.assertEqual(Post.objects.get().comments_count, 1)
+        self.assertEqual(
+            User.objects.get(username='reader').stats.following_count, 1)
+
+    def test_csv_import_copies_missing_images_by_hash(self):
+        """CSV одного вида; отсутствующий файл копируется из источника под
+        имя по содержимому, существующий берётся по ссылке.
+        """
+        source = self.path('media')
+        os.makedirs(os.path.join(source, 'posts'))
+        with open(os.path.join(source, 'posts', 'old.gif'), 'wb') as image:
+            image.write(SMALL_GIF)
+        Post.objects.filter(pk=self.post.pk).update(image='posts/old.gif')
+        path = self.export('posts.csv', format='csv', kinds='post')
+        Post.objects.all().delete()
+        self.load(path, kind='post', media_root=source)
+        digest = hashlib.sha256(SMALL_GIF).hexdigest()
+        name = f'posts/{digest[:2]}/{digest[2:4]}/{digest}.gif'
+        post = Post.objects.get(pk=self.post.pk)
+        self.assertEqual(post.image.name, name)
+        self.assertEqual(post.pub_date, self.pub_date)
+        Post.objects.filter(pk=self.post.pk).update(image=name)
+        path = self.export('hashed.csv', format='csv', kinds='post')
+        Post.objects.all().delete()
+        report = self.load(path, kind='post')
+        self.assertEqual(Post.objects.get().image.name, name)
+        self.assertNotIn('Изображений не найдено', report)
@@ -36,10 +36,12 @@ class PostsURLTests(TestCase):
             ('posts:group_list', (self.group.slug,)),
             ('posts:profile', (self.user.username,)),
             ('posts:post_detail', (self.post.id,)),
+            ('posts:post_comments', (self.post.id,)),
             ('posts:post_create', None),
             ('posts:post_edit', (self.post.id,)),
             ('posts:add_comment', (self.post.id,)),
             ('posts:follow_index', None),
+            ('posts:post_search', None),
             ('posts:profile_follow', (self.user.username,)),
             ('posts:profile_unfollow', (self.user.username,)),
         )
@@ -54,6 +56,7 @@ class PostsURLTests(TestCase):
             ('posts:post_create', None, 'posts/create_post.html'),
             ('posts:post_edit', (self.post.id,), 'posts/create_post.html'),
             ('posts:follow_index', None, 'posts/follow.html'),
+            ('posts:post_search', None, 'posts/search.html'),
         )
         for reverse_name, args, template in reverse_names_templates:
             with self.subTest(reverse_name=reverse_name):
@@ -82,16 +85,25 @@ class PostsURLTests(TestCase):
             ('posts:profile', (self.user.username,),
                 f'/profile/{self.user.username}/'),
             ('posts:post_detail', (self.post.id,), f'/posts/{self.post.id}/'),
+            ('posts:post_comments', (self.post.id,),
+                f'/posts/{self.post.id}/comments/'),
             ('posts:post_create', None, '/create/'),
             ('posts:post_edit', (self.post.id,),
                 f'/posts/{self.post.id}/edit/'),
             ('posts:add_comment', (self.post.id,),
                 f'/posts/{self.post.id}/comment/'),
             ('posts:follow_index', None, '/follow/'),
+            ('posts:post_search', None, '/search/'),
             ('posts:profile_follow', (self.user.username,),
                 f'/profile/{self.user.username}/follow/'),
             ('posts:profile_unfollow', (self.user.username,),
                 f'/profile/{self.user.username}/unfollow/'),
+            ('posts:group_rss', (self.group.slug,),
+                f'/group/{self.group.slug}/rss/'),
+            ('posts:author_atom', (self.user.username,),
+                f'/profile/{self.user.username}/atom/'),
+            ('posts:sitemap', None, '/sitemap.xml'),
+            ('posts:sitemap_posts', (0,), '/sitemap-posts-0.xml'),
         )
         for reverse_name, args, url in reverse_names_urls:
             with self.subTest(reverse_name=reverse_name):
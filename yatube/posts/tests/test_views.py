@@ -1,16 +1,24 @@
+import hashlib
+import re
 import shutil
 import tempfile
+from xml.etree import ElementTree
 
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import Client, override_settings, TestCase
+from django.db import connection, transaction
+from django.test import (Client, override_settings, TestCase,
+                         TransactionTestCase)
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django import forms
 
+from .. import cache as posts_cache
+from .. import benchmark, page_cache, search, utils
 from ..forms import PostForm
-from ..models import Follow, Group, Post
+from ..models import Comment, FeedItem, Follow, Group, Post
 
 User = get_user_model()
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
@@ -120,6 +128,87 @@ class PostsViewTests(TestCase):
         # Проверка контекста шаблона post_detail
         self.post_view_test(response, True)
 
+    def test_post_detail_comments_paginated_by_cursor(self):
+        """Комментарии поста выводятся страницами: первая на странице
+        поста, следующие — фрагментом по курсору.
+        """
+        Comment.objects.bulk_create([
+            Comment(post=self.post, author=self.user, text=f'Коммент №{n}')
+            for n in range(settings.NUMBER_OF_COMMENTS + 3)
+        ])
+        newest_first = list(Comment.objects.filter(post=self.post).order_by(
+            '-created', '-pk').values_list('text', flat=True))
+        first, rest = (newest_first[:settings.NUMBER_OF_COMMENTS],
+                       newest_first[settings.NUMBER_OF_COMMENTS:])
+        response = self.authorized_client.get(
+            reverse('posts:post_detail', args=(self.post.pk,)))
+        content = response.content.decode()
+        for text in first:
+            self.assertIn(f'<p>{text}</p>', content)
+        for text in rest:
+            self.assertNotIn(f'<p>{text}</p>', content)
+        fragment_url = reverse('posts:post_comments', args=(self.post.pk,))
+        cursor = re.search(
+            rf'{fragment_url}\?cursor=([\w-]+)', content).group(1)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(fragment_url, {'cursor': cursor})
+        content = response.content.decode()
+        self.assertEqual(re.findall(r'<p>(Коммент №\d+)</p>', content),
+                         rest)
+        self.assertNotContains(response, 'Показать ещё')
+        self.assertEqual(len(queries), 2)
+        self.assertNotIn('"auth_user"."password"', queries[-1]['sql'])
+
+    def test_post_comments_fragment_checks_post_and_cursor(self):
+        """Фрагмент комментариев несуществующего поста — 404, испорченный
+        курсор даёт первую страницу.
+        """
+        response = self.client.get(
+            reverse('posts:post_comments', args=(self.post.pk + 100,)))
+        self.assertEqual(response.status_code, 404)
+        Comment.objects.create(post=self.post, author=self.user,
+                               text='Единственный')
+        fragment_url = reverse('posts:post_comments', args=(self.post.pk,))
+        for cursor in ('мусор', utils.encode_cursor(['вчера', 1], 'n'),
+                       utils.encode_cursor([{'a': 1}], 'n')):
+            with self.subTest(cursor=cursor):
+                response = self.client.get(fragment_url, {'cursor': cursor})
+                self.assertContains(response, '<p>Единственный</p>')
+                self.assertIsNone(response.context['cursor'])
+
+    def test_list_pages_load_only_card_fields(self):
+        """Списки не загружают пароль, описание сообщества и полный
+        текст: превью обрезается в базе, полный текст — на странице поста.
+        """
+        limit = settings.POST_PREVIEW_LENGTH
+        post = Post.objects.create(
+            author=self.user, group=self.group,
+            text='а' * limit + 'хвост публикации')
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list', args=(self.group.slug,)),
+            reverse('posts:profile', args=(self.user.username,)),
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                cache.clear()
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.get(url)
+                sql = next(
+                    query['sql'] for query in queries
+                    if query['sql'].startswith('SELECT "posts_post"'))
+                preview = f'SUBSTR("posts_post"."text", 1, {limit + 1})'
+                self.assertIn(preview, sql)
+                for column in ('"auth_user"."password"',
+                               '"posts_group"."description"',
+                               '"posts_post"."text"'):
+                    self.assertNotIn(column, sql.replace(preview, ''))
+                self.assertContains(response, 'а' * limit + '…')
+                self.assertNotContains(response, 'хвост публикации')
+        self.assertContains(
+            self.client.get(reverse('posts:post_detail', args=(post.pk,))),
+            'хвост публикации')
+
     def test_post_create_and_post_edit_page_show_correct_context(self):
         """Шаблон post_create и post_edit
         сформирован с правильным контекстом.
@@ -173,7 +262,9 @@ class PostsViewTests(TestCase):
         self.assertEqual(len(response.context['page_obj']), 1)
 
     def test_index_cache_works_correctly(self):
-        """Проверка cache страницы index."""
+        """Проверка cache страницы index: фрагмент берётся из кэша,
+        пока данные не менялись, и сбрасывается сразу после записи.
+        """
         Post.objects.all().delete()
         self.assertEqual(Post.objects.count(), 0)
         Post.objects.create(
@@ -184,17 +275,76 @@ class PostsViewTests(TestCase):
         self.assertEqual(Post.objects.count(), 1)
         cached_response_content_1 = self.authorized_client.get(
             reverse('posts:index'))
-        Post.objects.all().delete()
-        self.assertEqual(Post.objects.count(), 0)
+        # Изменение в обход сигналов не сбрасывает версию кэша
+        Post.objects.update(text='Изменено без сигналов')
         cached_response_content_2 = self.authorized_client.get(
             reverse('posts:index'))
         self.assertEqual(cached_response_content_1.content,
                          cached_response_content_2.content)
-        cache.clear()
+        Post.objects.create(
+            author=self.user,
+            text='Тестовая публикация 3',
+        )
         cached_response_content_3 = self.authorized_client.get(
             reverse('posts:index'))
         self.assertNotEqual(cached_response_content_1.content,
                             cached_response_content_3.content)
+        self.assertContains(cached_response_content_3,
+                            'Тестовая публикация 3')
+
+    def test_fragment_versions_bumped_by_writes(self):
+        """Изменения Post, Comment, Group и Follow меняют версии
+        затронутых фрагментов и не трогают остальные.
+        """
+        user2 = User.objects.create_user(username='test')
+        scopes = ('posts', 'groups', f'group:{self.group.pk}',
+                  f'author:{self.user.pk}', f'author:{user2.pk}',
+                  f'post:{self.post.pk}')
+        writes = (
+            (lambda: Comment.objects.create(
+                post=self.post, author=user2, text='Комментарий'),
+             {'posts', f'group:{self.group.pk}', f'author:{self.user.pk}',
+              f'post:{self.post.pk}'}),
+            (lambda: Follow.objects.create(user=user2, author=self.user),
+             {f'author:{self.user.pk}', f'author:{user2.pk}'}),
+            (lambda: self.group.save(),
+             {'posts', 'groups', f'group:{self.group.pk}'}),
+        )
+        for write, changed in writes:
+            with self.subTest(changed=changed):
+                before = posts_cache.get_versions(*scopes)
+                write()
+                after = posts_cache.get_versions(*scopes)
+                self.assertEqual(
+                    {scope for scope in scopes
+                     if before[scope] != after[scope]},
+                    changed)
+        hits = posts_cache.stats().get('index_page:hits', 0)
+        self.authorized_client.get(reverse('posts:index'))
+        self.authorized_client.get(reverse('posts:index'))
+        self.assertEqual(
+            posts_cache.stats().get('index_page:hits', 0), hits + 1)
+
+    def test_post_card_cache_shared_between_pages(self):
+        """Отрисованная карточка публикации переиспользуется другими
+        страницами и обновляется после изменения публикации.
+        """
+        user2 = User.objects.create_user(username='test')
+        Follow.objects.create(user=user2, author=self.user)
+        self.authorized_client.force_login(user2)
+        self.authorized_client.get(reverse('posts:index'))
+        hits = posts_cache.stats().get('post_card:hits', 0)
+        response = self.authorized_client.get(reverse('posts:follow_index'))
+        self.assertEqual(
+            posts_cache.stats().get('post_card:hits', 0), hits + 1)
+        self.assertContains(response, self.post.text)
+        post = Post.objects.get(pk=self.post.pk)
+        post.text = 'Отредактированная публикация'
+        post.save()
+        response = self.authorized_client.get(reverse('posts:follow_index'))
+        self.assertEqual(
+            posts_cache.stats().get('post_card:hits', 0), hits + 1)
+        self.assertContains(response, 'Отредактированная публикация')
 
     def test_authorized_can_follow_authors(self):
         """Авторизованный пользователь может подписываться на
@@ -267,6 +417,538 @@ class PostsViewTests(TestCase):
         response = self.authorized_client.get(reverse('posts:follow_index'))
         self.assertEqual(len(response.context['page_obj']), 0)
 
+    def test_follow_index_uses_materialized_feed(self):
+        """Новая публикация раскладывается по лентам подписчиков,
+        при отписке записи автора удаляются из ленты.
+        """
+        user2 = User.objects.create_user(username='test')
+        Follow.objects.create(user=user2, author=self.user)
+        self.assertEqual(FeedItem.objects.filter(user=user2).count(), 1)
+        post = Post.objects.create(author=self.user, text='Новая публикация')
+        self.assertTrue(
+            FeedItem.objects.filter(user=user2, post=post).exists())
+        self.authorized_client.force_login(user2)
+        response = self.authorized_client.get(reverse('posts:follow_index'))
+        self.assertEqual(response.context['page_obj'][0], post)
+        self.authorized_client.get(
+            reverse('posts:profile_unfollow', args=(self.user.username,)))
+        self.assertFalse(FeedItem.objects.filter(user=user2).exists())
+        response = self.authorized_client.get(reverse('posts:follow_index'))
+        self.assertEqual(len(response.context['page_obj']), 0)
+
+    @override_settings(FEED_FANOUT_LIMIT=0)
+    def test_follow_index_reads_celebrity_posts_on_read(self):
+        """Публикации авторов с числом подписчиков больше
+        FEED_FANOUT_LIMIT не раскладываются, а читаются при показе ленты.
+        """
+        user2 = User.objects.create_user(username='test')
+        Follow.objects.create(user=user2, author=self.user)
+        post = Post.objects.create(author=self.user, text='Новая публикация')
+        self.assertFalse(FeedItem.objects.filter(user=user2).exists())
+        self.authorized_client.force_login(user2)
+        response = self.authorized_client.get(reverse('posts:follow_index'))
+        self.assertEqual(len(response.context['page_obj']), 2)
+        self.assertEqual(response.context['page_obj'][0], post)
+
+
+class CacheVersionCommitTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='auth')
+        self.post = Post.objects.create(author=self.user, text='Публикация')
+
+    def test_versions_bumped_again_after_commit(self):
+        """Версии меняются и после фиксации: фрагмент, закэшированный
+        читателем до фиксации под новой версией, не используется.
+        """
+        scope = f'post:{self.post.pk}'
+        with transaction.atomic():
+            Comment.objects.create(
+                post=self.post, author=self.user, text='Комментарий')
+            during = posts_cache.get_versions(scope)
+        self.assertNotEqual(posts_cache.get_versions(scope), during)
+
+    def test_rolled_back_write_keeps_committed_version(self):
+        """Откат не меняет версию повторно."""
+        scope = f'post:{self.post.pk}'
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                Comment.objects.create(
+                    post=self.post, author=self.user, text='Комментарий')
+                during = posts_cache.get_versions(scope)
+                raise RuntimeError
+        self.assertEqual(posts_cache.get_versions(scope), during)
+
+
+class ConditionalGetTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Тестовая группа', slug='test_slug', description='')
+        cls.post = Post.objects.create(
+            author=cls.user, group=cls.group, text='Тестовая публикация')
+
+    def setUp(self):
+        cache.clear()
+        self.urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list', args=(self.group.slug,)),
+            reverse('posts:profile', args=(self.user.username,)),
+            reverse('posts:post_detail', args=(self.post.pk,)),
+        )
+
+    def revalidate(self, client, url):
+        """Повторный запрос страницы с валидаторами первого ответа."""
+        response = client.get(url)
+        headers = {'HTTP_IF_NONE_MATCH': response['ETag']}
+        if response.has_header('Last-Modified'):
+            headers['HTTP_IF_MODIFIED_SINCE'] = response['Last-Modified']
+        return response, headers
+
+    def test_unchanged_pages_answer_not_modified(self):
+        """Неизменённая страница отдаёт 304 без тела, изменённая — 200."""
+        for url in self.urls:
+            with self.subTest(url=url):
+                response, headers = self.revalidate(self.client, url)
+                self.assertIn('Cookie', response['Vary'])
+                self.assertTrue(response.has_header('Last-Modified'))
+                not_modified = self.client.get(url, **headers)
+                self.assertEqual(not_modified.status_code, 304)
+                self.assertEqual(not_modified.content, b'')
+        headers = [self.revalidate(self.client, url)[1] for url in self.urls]
+        Comment.objects.create(
+            post=self.post, author=self.reader, text='Комментарий')
+        for url, url_headers in zip(self.urls, headers):
+            with self.subTest(url=url):
+                response = self.client.get(
+                    url, HTTP_IF_NONE_MATCH=url_headers['HTTP_IF_NONE_MATCH'])
+                self.assertEqual(response.status_code, 200)
+
+    def test_validators_are_per_user(self):
+        """ETag зависит от пользователя и его подписок, Last-Modified
+        авторизованным не отдаётся.
+        """
+        url = reverse('posts:profile', args=(self.user.username,))
+        anonymous, _ = self.revalidate(self.client, url)
+        self.client.force_login(self.reader)
+        response, headers = self.revalidate(self.client, url)
+        self.assertNotEqual(response['ETag'], anonymous['ETag'])
+        self.assertFalse(response.has_header('Last-Modified'))
+        self.assertIn('private', response['Cache-Control'])
+        Follow.objects.create(user=self.reader, author=self.user)
+        self.assertEqual(self.client.get(url, **headers).status_code, 200)
+
+    def test_detail_follows_author_stats(self):
+        """Новая публикация автора меняет страницу его старого поста."""
+        url = reverse('posts:post_detail', args=(self.post.pk,))
+        _, headers = self.revalidate(self.client, url)
+        Post.objects.create(author=self.user, text='Ещё публикация')
+        self.assertEqual(self.client.get(url, **headers).status_code, 200)
+
+    def test_missing_objects_still_not_found(self):
+        """Для несуществующих объектов валидаторы не считаются."""
+        for url in (reverse('posts:group_list', args=('missing',)),
+                    reverse('posts:post_detail', args=(0,))):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 404)
+
+
+class AnonymousPageCacheTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.group = Group.objects.create(
+            title='Тестовая группа', slug='test_slug', description='')
+        cls.other_group = Group.objects.create(
+            title='Другая группа', slug='other_slug', description='')
+        cls.post = Post.objects.create(
+            author=cls.user, group=cls.group, text='Тестовая публикация')
+
+    def setUp(self):
+        cache.clear()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def status(self, url):
+        return self.client.get(url)[page_cache.STATUS_HEADER]
+
+    def test_anonymous_pages_are_cached(self):
+        """Повторный запрос анонима отдаётся из кэша страниц; остаётся
+        только поиск объекта страницы для её тегов.
+        """
+        pages = {
+            reverse('posts:index'): 0,
+            reverse('posts:group_list', args=(self.group.slug,)): 1,
+            reverse('posts:profile', args=(self.user.username,)): 1,
+            reverse('posts:post_detail', args=(self.post.pk,)): 1,
+        }
+        for url, queries in pages.items():
+            with self.subTest(url=url):
+                first = self.client.get(url)
+                self.assertEqual(first[page_cache.STATUS_HEADER], 'MISS')
+                with self.assertNumQueries(queries):
+                    second = self.client.get(url)
+                self.assertEqual(second[page_cache.STATUS_HEADER], 'HIT')
+                self.assertEqual(second.content, first.content)
+                self.assertIn('Cookie', second['Vary'])
+
+    def test_writes_purge_only_tagged_pages(self):
+        """Комментарий и правка поста сбрасывают только свои страницы."""
+        detail = reverse('posts:post_detail', args=(self.post.pk,))
+        other = reverse('posts:group_list', args=(self.other_group.slug,))
+        self.client.get(detail)
+        self.client.get(other)
+        self.authorized_client.post(
+            reverse('posts:add_comment', args=(self.post.pk,)),
+            {'text': 'Новый комментарий'})
+        response = self.client.get(detail)
+        self.assertEqual(response[page_cache.STATUS_HEADER], 'MISS')
+        self.assertContains(response, 'Новый комментарий')
+        self.assertEqual(self.status(other), 'HIT')
+        group = reverse('posts:group_list', args=(self.group.slug,))
+        self.client.get(group)
+        self.authorized_client.post(
+            reverse('posts:post_edit', args=(self.post.pk,)),
+            {'text': 'Исправленная публикация', 'group': self.group.pk})
+        response = self.client.get(group)
+        self.assertEqual(response[page_cache.STATUS_HEADER], 'MISS')
+        self.assertContains(response, 'Исправленная публикация')
+        self.assertEqual(self.status(other), 'HIT')
+
+    def test_unknown_query_params_share_page_entry(self):
+        """Параметры, которых представление не читает, не создают
+        отдельных записей кэша; номер страницы и курсор — создают.
+        """
+        url = reverse('posts:index')
+        self.client.get(url)
+        for query in ('?x=1', '?utm_source=a&x=2', '?page=abc',
+                      '?cursor=мусор'):
+            with self.subTest(query=query):
+                self.assertEqual(self.status(url + query), 'HIT')
+        cursor = utils.encode_cursor(['2020-01-01T00:00:00+00:00', 1], 'n')
+        for query in ('?page=2', f'?cursor={cursor}'):
+            with self.subTest(query=query):
+                self.assertEqual(self.status(url + query), 'MISS')
+                self.assertEqual(self.status(url + query + '&x=1'), 'HIT')
+
+    def test_author_rename_purges_group_pages(self):
+        """Новое имя автора сбрасывает страницы групп его публикаций."""
+        group = reverse('posts:group_list', args=(self.group.slug,))
+        other = reverse('posts:group_list', args=(self.other_group.slug,))
+        self.client.get(group)
+        self.client.get(other)
+        author = User.objects.get(pk=self.user.pk)
+        author.username = 'renamed'
+        author.save()
+        response = self.client.get(group)
+        self.assertEqual(response[page_cache.STATUS_HEADER], 'MISS')
+        self.assertContains(response, 'renamed')
+        self.assertEqual(self.status(other), 'HIT')
+
+    def test_stale_page_served_while_regenerating(self):
+        """Пока другой запрос перерисовывает страницу, отдаётся прежняя."""
+        url = reverse('posts:post_detail', args=(self.post.pk,))
+        self.client.get(url)
+        Comment.objects.create(
+            post=self.post, author=self.user, text='Новый комментарий')
+        lock = page_cache.LOCK_PREFIX + page_cache.PREFIX + hashlib.sha1(
+            url.encode()).hexdigest()
+        cache.add(lock, 1)
+        response = self.client.get(url)
+        self.assertEqual(response[page_cache.STATUS_HEADER], 'STALE')
+        self.assertNotContains(response, 'Новый комментарий')
+        cache.delete(lock)
+        self.assertEqual(self.status(url), 'MISS')
+        self.assertEqual(self.status(url), 'HIT')
+
+    def test_sessions_bypass_page_cache(self):
+        """Пользователи с сессией получают страницу без кэша."""
+        url = reverse('posts:index')
+        self.client.get(url)
+        response = self.authorized_client.get(url)
+        self.assertFalse(response.has_header(page_cache.STATUS_HEADER))
+        self.assertContains(response, 'Новая запись')
+
+
+class SyndicationTests(TestCase):
+    ATOM = '{http://www.w3.org/2005/Atom}'
+    SITEMAP = '{http://www.sitemaps.org/schemas/sitemap/0.9}'
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.group = Group.objects.create(
+            title='Группа & <друзья>', slug='test_slug', description='')
+        cls.posts = [
+            Post.objects.create(
+                author=cls.user, group=cls.group if number % 2 else None,
+                text=f'Публикация {number}\x0b\nвторая строка')
+            for number in range(5)
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    def fetch(self, url, **headers):
+        response = self.client.get(url, **headers)
+        self.assertTrue(response.streaming)
+        content = b''.join(response.streaming_content)
+        return response, ElementTree.fromstring(content)
+
+    def test_group_and_author_feeds(self):
+        """Ленты — корректный XML с новыми публикациями сначала."""
+        group_posts = [post for post in self.posts if post.group]
+        cases = (
+            ('posts:group_rss', self.group.slug, group_posts),
+            ('posts:author_rss', self.user.username, self.posts),
+        )
+        for name, arg, posts in cases:
+            with self.subTest(name=name):
+                response, rss = self.fetch(reverse(name, args=(arg,)))
+                self.assertEqual(
+                    response['Content-Type'],
+                    'application/rss+xml; charset=utf-8')
+                self.assertEqual(
+                    [item.findtext('link') for item in rss.iter('item')],
+                    ['http://testserver' + reverse(
+                        'posts:post_detail', args=(post.pk,))
+                     for post in reversed(posts)])
+        _, atom = self.fetch(
+            reverse('posts:group_atom', args=(self.group.slug,)))
+        self.assertEqual(atom.findtext(f'{self.ATOM}title'),
+                         'Группа & <друзья>')
+        entry = atom.find(f'{self.ATOM}entry')
+        self.assertEqual(entry.findtext(f'{self.ATOM}title'),
+                         'Публикация 3')
+
+    @override_settings(FEED_ITEMS=2)
+    def test_feed_is_bounded_and_revalidated(self):
+        """Лента ограничена FEED_ITEMS и отдаёт 304, пока не изменилась."""
+        url = reverse('posts:author_atom', args=(self.user.username,))
+        response, atom = self.fetch(url)
+        self.assertEqual(len(atom.findall(f'{self.ATOM}entry')), 2)
+        headers = {'HTTP_IF_NONE_MATCH': response['ETag'],
+                   'HTTP_IF_MODIFIED_SINCE': response['Last-Modified']}
+        self.assertEqual(self.client.get(url, **headers).status_code, 304)
+        Post.objects.create(author=self.user, text='Новая')
+        self.assertEqual(self.client.get(url, **headers).status_code, 200)
+
+    @override_settings(SITEMAP_SIZE=2)
+    def test_sitemap_sections_cover_all_posts(self):
+        """Индекс ссылается на разделы, вместе они содержат все посты."""
+        _, index = self.fetch(reverse('posts:sitemap'))
+        locations = [loc.text for loc in index.iter(f'{self.SITEMAP}loc')]
+        self.assertEqual(locations[0], 'http://testserver' + reverse(
+            'posts:sitemap_groups'))
+        last = max(post.pk for post in self.posts)
+        self.assertEqual(len(locations), 1 + -(-last // 2))
+        urls = []
+        for location in locations[1:]:
+            _, urlset = self.fetch(location)
+            urls.extend(loc.text for loc in urlset.iter(f'{self.SITEMAP}loc'))
+        self.assertEqual(urls, [
+            'http://testserver' + reverse('posts:post_detail', args=(pk,))
+            for pk in sorted(post.pk for post in self.posts)])
+        response = self.client.get(
+            reverse('posts:sitemap_posts', args=(len(locations) - 1,)))
+        self.assertEqual(response.status_code, 404)
+
+    def test_missing_objects_not_found(self):
+        """Ленты несуществующих сообщества и автора отдают 404."""
+        for url in (reverse('posts:group_rss', args=('missing',)),
+                    reverse('posts:author_atom', args=('missing',))):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 404)
+
+
+class SearchViewTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.in_text = Post.objects.create(
+            author=cls.user, text='Рецепт борща со сметаной')
+        cls.in_comment = Post.objects.create(
+            author=cls.user, text='Обед готов')
+        Comment.objects.create(
+            post=cls.in_comment, author=cls.user, text='Где борщ?')
+        cls.other = Post.objects.create(author=cls.user, text='Про котов')
+
+    def search(self, query, **params):
+        return self.client.get(
+            reverse('posts:post_search'), {'q': query, **params})
+
+    def test_search_ranks_post_text_above_comments(self):
+        """Поиск находит слово в тексте и в комментариях, текст выше."""
+        self.assertTrue(search.available())
+        response = self.search('БОРЩ')
+        self.assertEqual(list(response.context['page_obj']),
+                         [self.in_text, self.in_comment])
+
+    def test_search_index_follows_signals(self):
+        """Индекс обновляется при правке и удалении постов и
+        комментариев.
+        """
+        post = Post.objects.get(pk=self.other.pk)
+        post.text = 'Про котов и борщ'
+        post.save()
+        comment = Comment.objects.get(post=self.in_comment)
+        comment.delete()
+        Post.objects.get(pk=self.in_text.pk).delete()
+        self.assertEqual(list(self.search('борщ').context['page_obj']),
+                         [post])
+
+    def test_search_pages_keep_query(self):
+        """Страницы результатов сохраняют запрос в ссылках."""
+        Post.objects.bulk_create([
+            Post(author=self.user, text=f'Борщ номер {number}')
+            for number in range(settings.NUMBER_OF_POSTS)
+        ])
+        search.rebuild()
+        response = self.search('борщ', page=2)
+        self.assertEqual(response.context['page_obj'].paginator.count,
+                         settings.NUMBER_OF_POSTS + 2)
+        self.assertEqual(len(response.context['page_obj']), 2)
+        self.assertContains(response, '?q=%D0%B1%D0%BE%D1%80%D1%89&amp;page=1')
+
+    def test_search_query_syntax_is_escaped(self):
+        """Операторы FTS5 в запросе не ломают поиск."""
+        for query in ('"борщ', 'борщ OR NEAR(', '*', ''):
+            with self.subTest(query=query):
+                self.assertEqual(self.search(query).status_code, 200)
+
+    def test_admin_search_uses_index(self):
+        """Поиск в админке идёт по тому же индексу."""
+        admin = User.objects.create_superuser(
+            'admin', 'admin@example.com', 'password')
+        self.client.force_login(admin)
+        response = self.client.get(
+            reverse('admin:posts_post_changelist'), {'q': 'борщ'})
+        self.assertEqual(
+            set(response.context['cl'].result_list),
+            {self.in_text, self.in_comment})
+
+
+class QueryBudgetTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.authors = benchmark.seed(
+            60, users=4, groups=2, follows=6, comments=40, random_seed=1)
+        cls.group = Group.objects.filter(posts__isnull=False).first()
+        cls.post = Post.objects.filter(comments__isnull=False).first()
+
+    def test_views_fit_query_budgets(self):
+        """Число запросов страниц при холодном кэше не превышает
+        бюджет и не растёт с объёмом данных.
+        """
+        reader = self.authors[0]
+        self.client.force_login(reader)
+        urls = {
+            'index': reverse('posts:index'),
+            'group_posts': reverse(
+                'posts:group_list', args=(self.group.slug,)),
+            'profile': reverse('posts:profile', args=(reader.username,)),
+            'post_detail': reverse(
+                'posts:post_detail', args=(self.post.pk,)),
+            'follow_index': reverse('posts:follow_index'),
+        }
+        for view, url in urls.items():
+            with self.subTest(view=view):
+                result = benchmark.summary(
+                    benchmark.measure(self.client, [url] * 2, cold=True))
+                self.assertFalse(result['errors'])
+                self.assertLessEqual(
+                    result['queries'], benchmark.QUERY_BUDGETS[view])
+
+    def test_anonymous_views_fit_query_budgets(self):
+        """Страницы анонима при холодном кэше укладываются в свой
+        бюджет, повторный запрос отдаётся из кэша страниц.
+        """
+        urls = {
+            'index': reverse('posts:index'),
+            'group_posts': reverse(
+                'posts:group_list', args=(self.group.slug,)),
+            'profile': reverse(
+                'posts:profile', args=(self.authors[0].username,)),
+            'post_detail': reverse(
+                'posts:post_detail', args=(self.post.pk,)),
+        }
+        for view, url in urls.items():
+            with self.subTest(view=view):
+                cold = benchmark.summary(
+                    benchmark.measure(self.client, [url] * 2, cold=True))
+                self.assertFalse(cold['errors'])
+                self.assertLessEqual(
+                    cold['queries'], benchmark.ANONYMOUS_QUERY_BUDGETS[view])
+                warm = benchmark.measure(self.client, [url] * 2)
+                self.assertLess(warm[-1][1], cold['queries'])
+
+    def test_cold_pass_refuses_shared_cache(self):
+        """Холодный замер не сбрасывает общий кэш сайта."""
+        with override_settings(CACHES={**settings.CACHES, 'shared': {
+                'BACKEND': 'core.cache_backends.SQLiteCache',
+                'LOCATION': 'cache.sqlite3'}}):
+            with self.assertRaises(ValueError):
+                benchmark.measure(self.client, ['/'], cold=True)
+            with benchmark.private_cache():
+                benchmark.measure(self.client, ['/'], cold=True)
+
+
+class QueryPlanTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.authors = benchmark.seed(
+            40, users=3, groups=2, follows=4, comments=20, random_seed=2)
+        cls.group = Group.objects.filter(posts__isnull=False).first()
+        cls.post = Post.objects.filter(comments__isnull=False).first()
+
+    def capture(self, url):
+        """SQL и параметры всех запросов страницы."""
+        queries = []
+
+        def wrapper(execute, sql, params, many, context):
+            queries.append((sql, params))
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(wrapper):
+            self.assertEqual(self.client.get(url).status_code, 200)
+        return queries
+
+    def test_view_queries_use_indexes(self):
+        """EXPLAIN запросов страниц: без полного просмотра таблиц и без
+        сортировки во временном B-дереве.
+        """
+        reader = self.authors[0]
+        self.client.force_login(reader)
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list', args=(self.group.slug,)),
+            reverse('posts:profile', args=(reader.username,)),
+            reverse('posts:post_detail', args=(self.post.pk,)),
+            reverse('posts:follow_index'),
+        )
+        for url in urls:
+            cache.clear()
+            for sql, params in self.capture(url):
+                if not sql.startswith('SELECT'):
+                    continue
+                with connection.cursor() as cursor:
+                    cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+                    plan = [row[-1] for row in cursor.fetchall()]
+                with self.subTest(url=url, sql=sql, plan=plan):
+                    self.assertFalse([
+                        step for step in plan
+                        if 'TEMP B-TREE' in step
+                        or step.startswith('SCAN') and ' USING ' not in step
+                    ])
+
 
 class PaginatorViewsTest(TestCase):
     @classmethod
@@ -320,3 +1002,62 @@ class PaginatorViewsTest(TestCase):
                             reverse(name, args=args) + page)
                         self.assertEqual(
                             len(response.context['page_obj']), posts_number)
+
+    def test_keyset_paginator_cursors_walk_all_pages(self):
+        """Проверка paginator по курсору: переход вперёд и назад по
+        next_cursor/previous_cursor без пропусков и без COUNT(*).
+        """
+        url = reverse('posts:index')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.authorized_client.get(url)
+        self.assertFalse(
+            [q for q in queries if 'COUNT(' in q['sql'].upper()])
+        first_page = response.context['page_obj']
+        self.assertEqual(len(first_page), settings.NUMBER_OF_POSTS)
+        self.assertFalse(first_page.has_previous())
+        response = self.authorized_client.get(
+            url, {'cursor': first_page.next_cursor})
+        second_page = response.context['page_obj']
+        self.assertEqual(len(second_page),
+                         self.NUMBER_OF_TEST_POSTS - settings.NUMBER_OF_POSTS)
+        self.assertFalse(second_page.has_next())
+        seen = [post.pk for post in first_page] + [
+            post.pk for post in second_page]
+        self.assertEqual(
+            seen, list(Post.objects.order_by('-pub_date', '-pk').values_list(
+                'pk', flat=True)))
+        response = self.authorized_client.get(
+            url, {'cursor': second_page.previous_cursor})
+        self.assertEqual(
+            [post.pk for post in response.context['page_obj']],
+            [post.pk for post in first_page])
+        response = self.authorized_client.get(url, {'cursor': 'broken'})
+        self.assertEqual(
+            len(response.context['page_obj']), settings.NUMBER_OF_POSTS)
+
+    def test_tampered_cursor_returns_first_page(self):
+        """Курсор с подделанными значениями ключа даёт первую страницу,
+        а не ошибку.
+        """
+        cursors = [
+            utils.encode_cursor(values, utils.NEXT) for values in (
+                ['notadate', 1],
+                ['2020-01-01T00:00:00+00:00', 'x'],
+                [None, None],
+                [{'a': 1}, [1]],
+                [True, False],
+            )
+        ]
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list', args=(self.group.slug,)),
+            reverse('posts:profile', args=(self.user.username,)),
+            reverse('posts:follow_index'),
+        )
+        for url in urls:
+            for cursor in cursors:
+                with self.subTest(url=url, cursor=cursor):
+                    response = self.authorized_client.get(
+                        url, {'cursor': cursor})
+                    self.assertEqual(len(response.context['page_obj']),
+                                     settings.NUMBER_OF_POSTS)
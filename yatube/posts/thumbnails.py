@@ -0,0 +1,149 @@
+"""Фоновая подготовка адаптивных вариантов изображений публикаций.
+
+Исходное изображение декодируется один раз, обрезается по центру до
+пропорций ``POST_IMAGE_SIZE`` и сохраняется в каждой ширине из
+``POST_IMAGE_WIDTHS`` во всех форматах ``POST_IMAGE_FORMATS``, которые
+поддерживает установленный Pillow, и в JPEG. Варианты строит задача
+``posts.tasks.generate_thumbnails`` и записывает в ``PostImage``. Пока
+вариантов нет, шаблоны показывают исходное изображение.
+"""
+import logging
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections
+from PIL import Image, ImageOps
+
+from core import metrics
+
+from . import cache
+from .models import Post, PostImage
+
+logger = logging.getLogger(__name__)
+
+CARD = 'card'
+FALLBACK_FORMAT = 'JPEG'
+EXTENSIONS = {'AVIF': 'avif', 'WEBP': 'webp', 'JPEG': 'jpg'}
+MIME_TYPES = {'AVIF': 'image/avif', 'WEBP': 'image/webp',
+              'JPEG': 'image/jpeg'}
+EXIF_ORIENTATION = 0x0112
+# Значения Orientation с поворотом на 90°.
+ROTATED = (5, 6, 7, 8)
+
+
+def output_formats():
+    """Форматы вариантов, которые умеет сохранять установленный Pillow."""
+    Image.init()
+    formats = [
+        image_format for image_format in settings.POST_IMAGE_FORMATS
+        if image_format in Image.SAVE and image_format in EXTENSIONS
+    ]
+    return formats + [FALLBACK_FORMAT]
+
+
+def generate_safely(post_id):
+    """generate() для фонового потока: ошибки только логируются."""
+    close_old_connections()
+    try:
+        generate(post_id)
+    except Exception:
+        logger.exception('Не удалось подготовить миниатюры поста %s',
+                         post_id)
+    finally:
+        close_old_connections()
+
+
+def variant_sizes():
+    width, height = settings.POST_IMAGE_SIZE
+    return [
+        (variant_width, round(variant_width * height / width))
+        for variant_width in sorted(settings.POST_IMAGE_WIDTHS, reverse=True)
+    ]
+
+
+def decode(image, width, height):
+    """Кадр RGB не меньше ``width``×``height``, повёрнутый по EXIF.
+
+    ``draft`` уменьшает JPEG при декодировании, то есть до поворота,
+    поэтому у повёрнутого на 90° снимка стороны запроса меняются
+    местами. Прозрачные области кладутся на белый фон, а не чёрный.
+    """
+    if image.getexif().get(EXIF_ORIENTATION) in ROTATED:
+        width, height = height, width
+    image.draft('RGB', (width, height))
+    image = ImageOps.exif_transpose(image)
+    if image.mode in ('LA', 'PA') or (
+            image.mode == 'P' and 'transparency' in image.info):
+        image = image.convert('RGBA')
+    if image.mode != 'RGBA':
+        return image.convert('RGB')
+    frame = Image.new('RGB', image.size, 'white')
+    frame.paste(image, mask=image.getchannel('A'))
+    return frame
+
+
+def render_variants(source):
+    """Строит варианты изображения: [(ширина, высота, формат, байты)]."""
+    metrics.record_thumbnail()
+    width, height = settings.POST_IMAGE_SIZE
+    with Image.open(source) as image:
+        frame = ImageOps.fit(
+            decode(image, width, height),
+            (width, height),
+            method=Image.LANCZOS,
+        )
+    variants = []
+    for size in variant_sizes():
+        if frame.size != size:
+            frame = frame.resize(size, Image.LANCZOS)
+        for image_format in output_formats():
+            buffer = BytesIO()
+            frame.save(buffer, image_format,
+                       quality=settings.POST_IMAGE_QUALITY)
+            variants.append((*size, image_format, buffer.getvalue()))
+    return variants
+
+
+def variant_name(source_name, width, image_format):
+    return f'thumbs/{source_name}/{CARD}-{width}.{EXTENSIONS[image_format]}'
+
+
+def generate(post_id):
+    """Строит все варианты изображения публикации, удаляет устаревшие."""
+    post = Post.objects.filter(pk=post_id).only(
+        'image', 'author_id', 'group_id').first()
+    if post is None:
+        return
+    stale = PostImage.objects.filter(post_id=post_id)
+    if post.image:
+        source = post.image.name
+        variants = [
+            (width, height, image_format, None)
+            for width, height in variant_sizes()
+            for image_format in output_formats()
+        ]
+        if not all(default_storage.exists(variant_name(source, width, fmt))
+                   for width, _, fmt, _ in variants):
+            with post.image.open('rb') as image_file:
+                variants = render_variants(image_file)
+        for width, height, image_format, data in variants:
+            name = variant_name(source, width, image_format)
+            if data is not None and not default_storage.exists(name):
+                name = default_storage.save(name, ContentFile(data))
+            PostImage.objects.update_or_create(
+                post_id=post_id,
+                name=CARD,
+                format=image_format,
+                width=width,
+                defaults={
+                    'source': source,
+                    'url': default_storage.url(name),
+                    'height': height,
+                },
+            )
+        stale = stale.exclude(source=source, format__in=output_formats(),
+                              width__in=settings.POST_IMAGE_WIDTHS)
+    stale.delete()
+    cache.bump(*cache.post_scopes(post))
@@ -0,0 +1,350 @@
+"""Потоковые выгрузка и загрузка публикаций, комментариев и подписок.
+
+Формат — NDJSON (строка на запись, вид записи в поле ``kind``, все виды
+в одном файле) или CSV (файл на один вид). Пользователи указываются
+именем, сообщества — slug, а публикации и комментарии сохраняют свои
+id: комментарий ссылается на id публикации, и повторная загрузка того
+же файла ничего не дублирует — записи с занятым id пропускаются.
+
+Выгрузка читает базу ``iterator()`` порциями, загрузка пишет
+``bulk_create`` пачками по ``BATCH_SIZE`` в своей транзакции, поэтому
+память не зависит от объёма данных. ``bulk_create`` не вызывает
+сигналы, и денормализованные данные (счётчики, ленты, поисковый индекс,
+версии кэша) пересчитываются в ``Importer.finish()``.
+
+Изображение передаётся именем файла в хранилище. Имена
+``ContentAddressedStorage`` содержат SHA-256 содержимого, так что файл,
+который уже есть в хранилище, не копируется, а остальные копируются из
+``media_root`` источника и получают имя по содержимому.
+"""
+import csv
+import json
+import os
+import time
+from contextlib import contextmanager
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.files import File
+from django.core.management import call_command
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.utils.dateparse import parse_datetime
+
+from . import feed, search
+from .models import Comment, Follow, Group, Post, User
+
+BATCH_SIZE = 2000
+# Сколько имён пользователей и slug сообществ помнить между пачками.
+LOOKUP_CACHE_SIZE = 10000
+
+KINDS = ('group', 'post', 'comment', 'follow')
+FIELDS = {
+    'group': (('slug', 'slug'), ('title', 'title'),
+              ('description', 'description')),
+    'post': (('id', 'id'), ('author', 'author__username'),
+             ('group', 'group__slug'), ('text', 'text'),
+             ('pub_date', 'pub_date'), ('image', 'image')),
+    'comment': (('id', 'id'), ('post', 'post_id'),
+                ('author', 'author__username'), ('text', 'text'),
+                ('created', 'created')),
+    'follow': (('user', 'user__username'), ('author', 'author__username')),
+}
+# Поля, без которых запись не загрузить.
+REQUIRED = {
+    'group': ('slug', 'title'),
+    'post': ('id', 'author', 'text', 'pub_date'),
+    'comment': ('id', 'post', 'author', 'text', 'created'),
+    'follow': ('user', 'author'),
+}
+QUERYSETS = {
+    'group': lambda: Group.objects.order_by('pk'),
+    'post': lambda: Post.objects.order_by('pk'),
+    'comment': lambda: Comment.objects.order_by('pk'),
+    'follow': lambda: Follow.objects.order_by('pk'),
+}
+
+
+def export_rows(kind):
+    """Записи вида ``kind`` словарями с полями ``FIELDS[kind]``."""
+    names, columns = zip(*FIELDS[kind])
+    rows = QUERYSETS[kind]().values_list(*columns)
+    for row in rows.iterator(chunk_size=BATCH_SIZE):
+        yield {name: value.isoformat() if hasattr(value, 'isoformat')
+               else value for name, value in zip(names, row)}
+
+
+def write_ndjson(stream, kinds):
+    """Пишет записи видов ``kinds``; возвращает {вид: число записей}."""
+    written = {}
+    for kind in kinds:
+        written[kind] = 0
+        for record in export_rows(kind):
+            stream.write(json.dumps(
+                {'kind': kind, **record}, ensure_ascii=False,
+                separators=(',', ':')))
+            stream.write('\n')
+            written[kind] += 1
+    return written
+
+
+def write_csv(stream, kind):
+    writer = csv.DictWriter(stream, [name for name, _ in FIELDS[kind]])
+    writer.writeheader()
+    written = 0
+    for record in export_rows(kind):
+        writer.writerow(record)
+        written += 1
+    return {kind: written}
+
+
+def read_ndjson(stream):
+    for number, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            raise ValueError(f'Строка {number}: не JSON.')
+        if record.get('kind') not in KINDS:
+            raise ValueError(f'Строка {number}: неизвестный вид записи.')
+        yield record.pop('kind'), record
+
+
+def read_csv(stream, kind):
+    for record in csv.DictReader(stream):
+        yield kind, {name: value if value != '' else None
+                     for name, value in record.items()}
+
+
+@contextmanager
+def original_dates():
+    """bulk_create с датами из файла, а не с моментом загрузки."""
+    fields = [Post._meta.get_field('pub_date'),
+              Comment._meta.get_field('created')]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+class Lookup:
+    """id по естественному ключу с ограниченным кэшем между пачками."""
+
+    def __init__(self, model, field, create):
+        self.model = model
+        self.field = field
+        self.create = create
+        self.known = {}
+
+    def resolve(self, values):
+        """{значение: id} для значений пачки; недостающие создаются."""
+        values = {value for value in values if value is not None}
+        result = {value: self.known[value]
+                  for value in values if value in self.known}
+        missing = values - result.keys()
+        if missing:
+            lookup = f'{self.field}__in'
+            found = dict(self.model.objects.filter(
+                **{lookup: missing}).values_list(self.field, 'pk'))
+            new = missing - found.keys()
+            if new:
+                self.model.objects.bulk_create(
+                    [self.create(value) for value in new],
+                    ignore_conflicts=True)
+                found.update(self.model.objects.filter(
+                    **{lookup: new}).values_list(self.field, 'pk'))
+            if len(self.known) + len(found) > LOOKUP_CACHE_SIZE:
+                self.known.clear()
+            self.known.update(found)
+            result.update(found)
+        return result
+
+
+def parse_date(value):
+    date = parse_datetime(value)
+    if date is None:
+        raise ValueError(f'Неверная дата: {value}.')
+    return date
+
+
+def new_user(username):
+    user = User(username=username)
+    user.set_unusable_password()
+    return user
+
+
+class Importer:
+    """Загружает записи пачками; после ``finish()`` — сводка по видам.
+
+    Записи одного вида копятся в пачку. Смена вида сбрасывает пачку,
+    так что комментарии пишутся после публикаций, на которые ссылаются.
+
+    Публикация или комментарий с id, который уже занят такой же записью,
+    пропускаются (повторная загрузка), а занятый другой записью —
+    останавливает загрузку с ValueError: иначе комментарии файла
+    достались бы чужой публикации.
+    """
+
+    def __init__(self, media_root=None, batch_size=BATCH_SIZE):
+        self.media_root = media_root
+        self.batch_size = batch_size
+        self.users = Lookup(User, 'username', new_user)
+        self.groups = Lookup(Group, 'slug', lambda slug: Group(
+            slug=slug, title=slug, description=''))
+        self.storage = Post._meta.get_field('image').storage
+        self.kind = None
+        self.batch = []
+        self.stats = {kind: {'rows': 0, 'skipped': 0, 'seconds': 0.0}
+                      for kind in KINDS}
+        # Авторы, чьим подписчикам надо дополнить ленты.
+        self.authors = set()
+        self.missing_images = 0
+
+    def load(self, records):
+        with original_dates():
+            for number, (kind, record) in enumerate(records, 1):
+                missing = [name for name in REQUIRED[kind]
+                           if record.get(name) in (None, '')]
+                if missing:
+                    raise ValueError('Запись {} ({}): нет полей {}.'.format(
+                        number, kind, ', '.join(missing)))
+                if kind != self.kind:
+                    self.flush()
+                    self.kind = kind
+                self.batch.append(record)
+                if len(self.batch) >= self.batch_size:
+                    self.flush()
+            self.flush()
+
+    def flush(self):
+        if not self.batch:
+            return
+        started = time.perf_counter()
+        with transaction.atomic():
+            written = getattr(self, f'_write_{self.kind}')(self.batch)
+        stats = self.stats[self.kind]
+        stats['seconds'] += time.perf_counter() - started
+        stats['rows'] += len(self.batch)
+        stats['skipped'] += len(self.batch) - written
+        self.batch = []
+
+    def _write_group(self, records):
+        existing = set(Group.objects.filter(
+            slug__in=[record['slug'] for record in records],
+        ).values_list('slug', flat=True))
+        groups = {
+            record['slug']: Group(
+                slug=record['slug'], title=record['title'],
+                description=record.get('description') or '')
+            for record in records if record['slug'] not in existing
+        }
+        Group.objects.bulk_create(groups.values(), ignore_conflicts=True)
+        return len(groups)
+
+    def _new(self, model, rows, fields, label):
+        """Строки, id которых свободны. Строки с id, занятым такой же
+        записью, отбрасываются, занятым другой — ValueError.
+        """
+        existing = {
+            pk: values for pk, *values in model.objects.filter(
+                pk__in=[row.pk for row in rows],
+            ).values_list('pk', *fields)
+        }
+        new = []
+        for row in rows:
+            if row.pk not in existing:
+                new.append(row)
+            elif existing[row.pk] != [getattr(row, field)
+                                      for field in fields]:
+                raise ValueError(
+                    f'{label} id={row.pk} уже есть в базе с другими '
+                    f'данными. Загрузка остановлена.')
+        return new
+
+    def _image(self, name):
+        """Имя изображения в хранилище: по ссылке или копией файла."""
+        if not name or self.storage.exists(name):
+            return name or ''
+        source = os.path.join(self.media_root or '', name)
+        if self.media_root is None or not os.path.isfile(source):
+            self.missing_images += 1
+            return ''
+        with open(source, 'rb') as image:
+            return self.storage.save(name, File(image, name))
+
+    def _write_post(self, records):
+        users = self.users.resolve(record['author'] for record in records)
+        groups = self.groups.resolve(record['group'] for record in records)
+        images = {}
+        posts = []
+        for record in records:
+            post = Post(pk=int(record['id']),
+                        author_id=users[record['author']],
+                        group_id=groups.get(record.get('group')),
+                        text=record['text'],
+                        pub_date=parse_date(record['pub_date']))
+            images[post.pk] = record.get('image')
+            posts.append(post)
+        posts = self._new(Post, posts, ('author_id', 'text', 'pub_date'),
+                          'Публикация')
+        for post in posts:
+            post.image = self._image(images[post.pk])
+        Post.objects.bulk_create(posts, ignore_conflicts=True)
+        search.index_posts([post.pk for post in posts])
+        self.authors.update(post.author_id for post in posts)
+        return len(posts)
+
+    def _write_comment(self, records):
+        users = self.users.resolve(record['author'] for record in records)
+        existing = set(Post.objects.filter(
+            pk__in={int(record['post']) for record in records},
+        ).values_list('pk', flat=True))
+        comments = self._new(Comment, [
+            Comment(pk=int(record['id']), post_id=int(record['post']),
+                    author_id=users[record['author']], text=record['text'],
+                    created=parse_date(record['created']))
+            for record in records if int(record['post']) in existing
+        ], ('post_id', 'author_id', 'text'), 'Комментарий')
+        Comment.objects.bulk_create(comments, ignore_conflicts=True)
+        search.index_posts(sorted({comment.post_id for comment in comments}))
+        return len(comments)
+
+    def _write_follow(self, records):
+        users = self.users.resolve(
+            name for record in records
+            for name in (record['user'], record['author']))
+        pairs = {
+            (users[record['user']], users[record['author']])
+            for record in records if record['user'] != record['author']
+        }
+        existing = set(Follow.objects.filter(
+            user_id__in={user_id for user_id, _ in pairs},
+            author_id__in={author_id for _, author_id in pairs},
+        ).values_list('user_id', 'author_id'))
+        follows = [Follow(user_id=user_id, author_id=author_id)
+                   for user_id, author_id in pairs - existing]
+        Follow.objects.bulk_create(follows, ignore_conflicts=True)
+        self.authors.update(follow.author_id for follow in follows)
+        return len(follows)
+
+    def finish(self):
+        """Пересчитывает то, что при обычной записи делают сигналы.
+
+        Поисковый индекс обновляется по пачкам в ``flush()``; здесь —
+        последовательности id, счётчики, ленты подписчиков авторов, чьи
+        публикации или подписки загружены, и кэш.
+        """
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(
+                    no_style(), [Post, Comment]):
+                cursor.execute(sql)
+        call_command('reconcile_counters', stdout=StringIO())
+        for author_id in sorted(self.authors):
+            with transaction.atomic():
+                feed.backfill_followers(author_id)
+        cache.clear()
+        return self.stats
@@ -0,0 +1,89 @@
+"""Потоковый приём и нормализация изображений публикаций.
+
+Загрузка пишется на диск кусками (``FILE_UPLOAD_MAX_MEMORY_SIZE``), а
+``UploadLimitHandler`` перестаёт принимать данные, как только файл
+превысил ``POST_IMAGE_MAX_UPLOAD_SIZE``. Размеры изображения проверяются
+по заголовку, без декодирования. Перекодирование (снятие EXIF и
+уменьшение до ``POST_IMAGE_MAX_DIMENSION``) использует ``draft()``,
+чтобы JPEG декодировался сразу в уменьшенном масштабе.
+"""
+import os
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.uploadedfile import (TemporaryUploadedFile,
+                                            UploadedFile)
+from django.core.files.uploadhandler import FileUploadHandler
+from PIL import Image, ImageOps
+
+
+class OversizedUploadedFile(UploadedFile):
+    """Заглушка файла, приём которого остановлен по размеру."""
+
+    def __init__(self, name, content_type, size, charset):
+        super().__init__(BytesIO(), name, content_type, size, charset)
+
+
+class UploadLimitHandler(FileUploadHandler):
+    """Отбрасывает остаток файла больше POST_IMAGE_MAX_UPLOAD_SIZE.
+
+    Ставится первым в ``FILE_UPLOAD_HANDLERS``: пока лимит не превышен,
+    куски передаются следующим обработчикам, после — не передаются и не
+    пишутся на диск, а форма получает ``OversizedUploadedFile``.
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.received = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > settings.POST_IMAGE_MAX_UPLOAD_SIZE:
+            return None
+        return raw_data
+
+    def file_complete(self, file_size):
+        if self.received > settings.POST_IMAGE_MAX_UPLOAD_SIZE:
+            return OversizedUploadedFile(
+                self.file_name, self.content_type, self.received,
+                self.charset)
+        return None
+
+
+def read_header(upload):
+    """Формат и размеры изображения по заголовку файла."""
+    upload.seek(0)
+    try:
+        with Image.open(upload) as image:
+            return image.format, image.size, image.info, getattr(
+                image, 'n_frames', 1)
+    finally:
+        upload.seek(0)
+
+
+def normalize(upload):
+    """Убирает EXIF и уменьшает слишком большое изображение.
+
+    Возвращает новый временный файл с тем же именем или исходную
+    загрузку, если перекодировать нечего. Анимации не трогаются.
+    """
+    image_format, (width, height), info, frames = read_header(upload)
+    limit = settings.POST_IMAGE_MAX_DIMENSION
+    too_large = max(width, height) > limit
+    if frames > 1 or image_format not in Image.SAVE or not (
+            too_large or 'exif' in info):
+        return upload
+    with Image.open(upload) as image:
+        if too_large:
+            image.draft(image.mode, (limit, limit))
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((limit, limit), Image.LANCZOS)
+        normalized = TemporaryUploadedFile(
+            os.path.basename(upload.name), upload.content_type, 0,
+            upload.charset)
+        image.save(normalized, image_format,
+                   quality=settings.POST_IMAGE_QUALITY)
+    normalized.size = normalized.tell()
+    normalized.seek(0)
+    upload.close()
+    return normalized
@@ -8,7 +8,13 @@ urlpatterns = [
     path('', views.index, name='index'),
     path('group/<slug:slug>/', views.group_posts, name='group_list'),
     path('profile/<str:author>/', views.profile, name='profile'),
+    path('search/', views.post_search, name='post_search'),
     path('posts/<int:post_id>/', views.post_detail, name='post_detail'),
+    path(
+        'posts/<int:post_id>/comments/',
+        views.post_comments,
+        name='post_comments'
+    ),
     path('create/', views.post_create, name='post_create'),
     path('posts/<int:post_id>/edit/', views.post_edit, name='post_edit'),
     path(
@@ -16,6 +22,41 @@ urlpatterns = [
         views.add_comment,
         name='add_comment'
     ),
+    path(
+        'group/<slug:slug>/rss/',
+        views.group_feed,
+        {'feed_format': 'rss'},
+        name='group_rss'
+    ),
+    path(
+        'group/<slug:slug>/atom/',
+        views.group_feed,
+        {'feed_format': 'atom'},
+        name='group_atom'
+    ),
+    path(
+        'profile/<str:author>/rss/',
+        views.author_feed,
+        {'feed_format': 'rss'},
+        name='author_rss'
+    ),
+    path(
+        'profile/<str:author>/atom/',
+        views.author_feed,
+        {'feed_format': 'atom'},
+        name='author_atom'
+    ),
+    path('sitemap.xml', views.sitemap_index, name='sitemap'),
+    path(
+        'sitemap-groups.xml',
+        views.sitemap_groups,
+        name='sitemap_groups'
+    ),
+    path(
+        'sitemap-posts-<int:section>.xml',
+        views.sitemap_posts,
+        name='sitemap_posts'
+    ),
     path('follow/', views.follow_index, name='follow_index'),
     path(
         'profile/<str:username>/follow/',
@@ -1,8 +1,201 @@
+import base64
+import binascii
+import json
+from collections.abc import Sequence
+from datetime import datetime
+
 from django.conf import settings
+from django.core.exceptions import ValidationError
 from django.core.paginator import Paginator
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.functional import cached_property
+
+NEXT = 'n'
+PREVIOUS = 'p'
+
+
+def encode_cursor(values, direction):
+    """Упаковывает значения ключа и направление в непрозрачную строку."""
+    values = [
+        value.isoformat() if isinstance(value, datetime) else value
+        for value in values
+    ]
+    data = json.dumps([direction, values], separators=(',', ':'))
+    return base64.urlsafe_b64encode(data.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Распаковывает курсор. Для испорченного курсора возвращает None."""
+    try:
+        data = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        direction, values = json.loads(data.decode())
+    except (binascii.Error, UnicodeDecodeError, TypeError, ValueError):
+        return None
+    if direction not in (NEXT, PREVIOUS) or not isinstance(values, list):
+        return None
+    return direction, values
+
+
+class KeysetPaginator:
+    """Постраничный вывод по ключу (курсору) вместо OFFSET.
+
+    Записи упорядочены по убыванию полей ``keys``; последнее поле должно
+    быть уникальным. Каждая страница выбирается одним запросом с
+    ``LIMIT per_page + 1`` по индексу, поэтому глубокие страницы стоят
+    столько же, сколько первая. ``COUNT(*)`` выполняется, только если
+    шаблон обратится к ``count`` или ``num_pages``.
+    """
+
+    def __init__(self, object_list, per_page, keys=('pub_date', 'pk')):
+        self.per_page = int(per_page)
+        self.keys = tuple(keys)
+        self.object_list = object_list.order_by(
+            *(f'-{key}' for key in self.keys))
+
+    @cached_property
+    def count(self):
+        return self.object_list.count()
+
+    @cached_property
+    def num_pages(self):
+        return max(1, -(-self.count // self.per_page))
+
+    @property
+    def page_range(self):
+        return range(1, self.num_pages + 1)
+
+    def _key_values(self, obj):
+        if isinstance(obj, dict):
+            return [obj[key] for key in self.keys]
+        return [getattr(obj, key) for key in self.keys]
+
+    def _coerce(self, values):
+        """Значения курсора, приведённые к типам полей ключа.
+
+        Курсор приходит от клиента: значение, которое поле не принимает,
+        даёт ValueError, а не ошибку запроса.
+        """
+        query = self.object_list.query
+        meta = self.object_list.model._meta
+        coerced = []
+        for key, value in zip(self.keys, values):
+            if value is None or isinstance(value, (bool, dict, list)):
+                raise ValueError(f'Неверное значение ключа {key}.')
+            if key in query.annotations:
+                field = query.annotations[key].output_field
+            else:
+                field = meta.pk if key == 'pk' else meta.get_field(key)
+            try:
+                value = field.to_python(value)
+            except ValidationError as error:
+                raise ValueError(error)
+            if isinstance(value, datetime) and timezone.is_naive(value):
+                value = timezone.make_aware(value, timezone.utc)
+            coerced.append(value)
+        return coerced
+
+    def _seek(self, values, direction):
+        """Условие «строго после» (NEXT) или «строго до» (PREVIOUS)."""
+        lookup = 'lt' if direction == NEXT else 'gt'
+        condition = Q()
+        for position, key in enumerate(self.keys):
+            step = Q(**{f'{key}__{lookup}': values[position]})
+            for previous, value in zip(self.keys[:position], values):
+                step &= Q(**{previous: value})
+            condition |= step
+        return condition
+
+    def get_page(self, cursor=None, number=None):
+        """Возвращает страницу по курсору.
+
+        Без курсора поддерживается старый параметр ``?page=N``, чтобы
+        ранее выданные ссылки продолжали работать.
+        """
+        decoded = decode_cursor(cursor) if cursor else None
+        if decoded is not None and len(decoded[1]) == len(self.keys):
+            direction, values = decoded
+            try:
+                values = self._coerce(values)
+            except ValueError:
+                return self.get_page(number=number)
+            # Канонический вид: курсор входит в ключи кэша фрагментов.
+            cursor = encode_cursor(values, direction)
+            queryset = self.object_list.filter(self._seek(values, direction))
+            if direction == PREVIOUS:
+                queryset = queryset.reverse()
+            rows = list(queryset[:self.per_page + 1])
+            has_more = len(rows) > self.per_page
+            rows = rows[:self.per_page]
+            if direction == PREVIOUS:
+                rows.reverse()
+                return KeysetPage(rows, self, None, cursor,
+                                  has_next=True, has_previous=has_more)
+            return KeysetPage(rows, self, None, cursor,
+                              has_next=has_more, has_previous=True)
+        try:
+            number = max(1, int(number))
+        except (TypeError, ValueError):
+            number = 1
+        offset = (number - 1) * self.per_page
+        rows = list(self.object_list[offset:offset + self.per_page + 1])
+        if not rows and number > 1:
+            return self.get_page()
+        return KeysetPage(rows[:self.per_page], self, number, None,
+                          has_next=len(rows) > self.per_page,
+                          has_previous=number > 1)
+
+
+class KeysetPage(Sequence):
+    is_keyset = True
+
+    def __init__(self, object_list, paginator, number, cursor,
+                 has_next, has_previous):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.number = number
+        self.cursor = cursor
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __repr__(self):
+        return f'<Keyset page {self.number or self.cursor}>'
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self._has_next and bool(self.object_list)
+
+    def has_previous(self):
+        return self._has_previous and bool(self.object_list)
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    @cached_property
+    def next_cursor(self):
+        if not self.has_next():
+            return None
+        return encode_cursor(
+            self.paginator._key_values(self.object_list[-1]), NEXT)
+
+    @cached_property
+    def previous_cursor(self):
+        if not self.has_previous():
+            return None
+        return encode_cursor(
+            self.paginator._key_values(self.object_list[0]), PREVIOUS)
 
 
-def paginator(request, posts):
+def paginator(request, posts, keys=('pub_date', 'pk')):
+    if settings.PAGINATION_MODE == 'keyset':
+        return KeysetPaginator(
+            posts, settings.NUMBER_OF_POSTS, keys).get_page(
+            request.GET.get('cursor'), request.GET.get('page'))
     paginator = Paginator(posts, settings.NUMBER_OF_POSTS)
     page_number = request.GET.get('page')
     return paginator.get_page(page_number)
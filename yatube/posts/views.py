@@ -1,30 +1,55 @@
+from functools import partial
+
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
+from django.core.paginator import Paginator
+from django.db import transaction
+from django.http import Http404, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, redirect, render
+from django.urls import reverse
+from django.utils.dateparse import parse_datetime
+
+from core import sqlite
 
-from . import utils
+from . import (cache, cards, conditional, counters, feed, page_cache, search,
+               syndication, utils)
 from .forms import CommentForm, PostForm
-from .models import Follow, Group, Post, User
+from .models import Comment, Follow, Group, Post, User
 
 
+@conditional.page_condition(conditional.index_scopes)
+@page_cache.anonymous_page_cache(
+    conditional.index_scopes, page_cache.LIST_PARAMS)
 def index(request):
-    posts = Post.objects.select_related('author', 'group').all()
-    context = {'page_obj': utils.paginator(request, posts)}
+    posts = cards.for_cards(Post.objects.all())
+    context = {
+        'page_obj': utils.paginator(request, posts),
+        'cache_version': cache.version('posts'),
+    }
     return render(request, 'posts/index.html', context)
 
 
+@conditional.page_condition(conditional.group_scopes)
+@page_cache.anonymous_page_cache(
+    conditional.group_scopes, page_cache.LIST_PARAMS)
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    posts = group.posts.select_related('author').all()
+    posts = cards.for_cards(group.posts.all())
     context = {
         'group': group,
-        'page_obj': utils.paginator(request, posts)
+        'page_obj': utils.paginator(request, posts),
+        'cache_version': cache.version(f'group:{group.pk}'),
     }
     return render(request, 'posts/group_list.html', context)
 
 
+@conditional.page_condition(conditional.profile_scopes)
+@page_cache.anonymous_page_cache(
+    conditional.profile_scopes, page_cache.LIST_PARAMS)
 def profile(request, author):
-    author = get_object_or_404(User, username=author)
-    profile_posts = author.posts.select_related('group')
+    author = get_object_or_404(
+        User.objects.select_related('stats'), username=author)
+    profile_posts = cards.for_cards(author.posts.all())
     following = request.user.is_authenticated and author.following.filter(
         user=request.user).exists()
     context = {
@@ -32,24 +57,156 @@ def profile(request, author):
         'profile_posts': profile_posts,
         'page_obj': utils.paginator(request, profile_posts),
         'following': following,
+        'stats': counters.stats_for(author),
+        'cache_version': cache.version(f'author:{author.pk}', 'groups'),
     }
     return render(request, 'posts/profile.html', context)
 
 
+FEED_CONTENT_TYPES = {
+    'rss': 'application/rss+xml; charset=utf-8',
+    'atom': 'application/atom+xml; charset=utf-8',
+}
+SITEMAP_CONTENT_TYPE = 'application/xml; charset=utf-8'
+
+
+def base_url(request):
+    return request.build_absolute_uri('/').rstrip('/')
+
+
+def feed_response(request, feed_format, title, link, description, posts,
+                  scope):
+    link = request.build_absolute_uri(link)
+    if feed_format == 'rss':
+        document = syndication.rss(
+            base_url(request), title, link, description, posts)
+    else:
+        updated = conditional.versions_time(cache.get_versions(scope))
+        document = syndication.atom(
+            base_url(request), title, link, description, posts, updated)
+    return StreamingHttpResponse(
+        document, content_type=FEED_CONTENT_TYPES[feed_format])
+
+
+@conditional.page_condition(conditional.group_feed_scopes)
+def group_feed(request, slug, feed_format):
+    group = get_object_or_404(Group, slug=slug)
+    return feed_response(
+        request, feed_format, group.title,
+        reverse('posts:group_list', args=(group.slug,)), group.description,
+        group.posts.all(), f'group:{group.pk}')
+
+
+@conditional.page_condition(conditional.author_feed_scopes)
+def author_feed(request, author, feed_format):
+    author = get_object_or_404(User, username=author)
+    return feed_response(
+        request, feed_format, author.get_full_name() or author.username,
+        reverse('posts:profile', args=(author.username,)),
+        f'Публикации {author.username}', author.posts.all(),
+        f'author:{author.pk}')
+
+
+@conditional.page_condition(conditional.sitemap_scopes)
+def sitemap_index(request):
+    return StreamingHttpResponse(
+        syndication.sitemap_index(base_url(request)),
+        content_type=SITEMAP_CONTENT_TYPE)
+
+
+@conditional.page_condition(conditional.sitemap_scopes)
+def sitemap_posts(request, section):
+    if section not in syndication.sitemap_sections():
+        raise Http404
+    return StreamingHttpResponse(
+        syndication.sitemap_posts(base_url(request), section),
+        content_type=SITEMAP_CONTENT_TYPE)
+
+
+@conditional.page_condition(conditional.sitemap_scopes)
+def sitemap_groups(request):
+    return StreamingHttpResponse(
+        syndication.sitemap_groups(base_url(request)),
+        content_type=SITEMAP_CONTENT_TYPE)
+
+
+def post_search(request):
+    query = request.GET.get('q', '').strip()
+    results = search.SearchResults(query)
+    context = {
+        'query': query,
+        'page_obj': Paginator(results, settings.NUMBER_OF_POSTS).get_page(
+            request.GET.get('page')),
+    }
+    return render(request, 'posts/search.html', context)
+
+
+def post_comments_page(post_id, cursor=None):
+    """Страница комментариев по курсору, от новых к старым.
+
+    Автор ограничен полями, которые выводит шаблон комментария.
+    """
+    comments = Comment.objects.filter(post_id=post_id).select_related(
+        'author').only('text', 'created', 'post_id', 'author__username')
+    return utils.KeysetPaginator(
+        comments, settings.NUMBER_OF_COMMENTS, ('created', 'pk'),
+    ).get_page(cursor)
+
+
+@conditional.page_condition(conditional.post_scopes)
+@page_cache.anonymous_page_cache(conditional.post_scopes)
 def post_detail(request, post_id):
     post = get_object_or_404(
         Post.objects.select_related(
-            'author').prefetch_related('comments__author').all(), pk=post_id)
+            'author__stats').prefetch_related('images').all(),
+        pk=post_id)
     form = CommentForm(request.POST or None)
     context = {
         'post': post,
         'form': form,
-        'comments': post.comments.all(),
+        # Вызывается шаблоном, только если первая страница комментариев
+        # не нашлась в кэше фрагментов.
+        'comments': partial(post_comments_page, post.pk),
+        'author_stats': counters.stats_for(post.author),
+        'cache_version': cache.version(f'post:{post.pk}', 'groups'),
     }
     return render(request, 'posts/post_detail.html', context)
 
 
+def comments_cursor(cursor):
+    """Курсор комментариев в каноническом виде или None (первая
+    страница): в ключ кэша фрагмента не попадает произвольная строка.
+    """
+    decoded = utils.decode_cursor(cursor) if cursor else None
+    if decoded is None:
+        return None
+    direction, values = decoded
+    try:
+        created, pk = values
+        created, pk = parse_datetime(created), int(pk)
+    except (TypeError, ValueError):
+        return None
+    if created is None:
+        return None
+    return utils.encode_cursor([created, pk], direction)
+
+
+def post_comments(request, post_id):
+    """Следующая страница комментариев — фрагмент для подгрузки."""
+    if not Post.objects.filter(pk=post_id).exists():
+        raise Http404
+    cursor = comments_cursor(request.GET.get('cursor'))
+    context = {
+        'post_id': post_id,
+        'cursor': cursor,
+        'comments': partial(post_comments_page, post_id, cursor),
+        'cache_version': cache.version(f'post:{post_id}', 'groups'),
+    }
+    return render(request, 'posts/includes/comment_list.html', context)
+
+
 @login_required
+@transaction.atomic
 def post_create(request):
     form = PostForm(request.POST or None, files=request.FILES or None)
     if not form.is_valid():
@@ -61,6 +218,7 @@ def post_create(request):
 
 
 @login_required
+@transaction.atomic
 def post_edit(request, post_id):
     post = get_object_or_404(Post, pk=post_id)
     if post.author != request.user:
@@ -74,6 +232,7 @@ def post_edit(request, post_id):
 
 
 @login_required
+@transaction.atomic
 def add_comment(request, post_id):
     post = get_object_or_404(Post, pk=post_id)
     form = CommentForm(request.POST or None)
@@ -87,16 +246,18 @@ def add_comment(request, post_id):
 
 @login_required
 def follow_index(request):
-    followed_posts = Post.objects.select_related('author', 'group').filter(
-        author__following__user=request.user)
+    followed_posts, keys = feed.feed_posts(request.user)
+    followed_posts = cards.for_cards(followed_posts)
     return render(
         request,
         'posts/follow.html',
-        {'page_obj': utils.paginator(request, followed_posts)}
+        {'page_obj': utils.paginator(request, followed_posts, keys)}
     )
 
 
+@sqlite.queued_write
 @login_required
+@transaction.atomic
 def profile_follow(request, username):
     author = get_object_or_404(User, username=username)
     if author != request.user:
@@ -104,7 +265,9 @@ def profile_follow(request, username):
     return redirect('posts:profile', author)
 
 
+@sqlite.queued_write
 @login_required
+@transaction.atomic
 def profile_unfollow(request, username):
     get_object_or_404(Follow,
                       user=request.user,
@@ -0,0 +1,179 @@
+"""Очередь исходящей почты.
+
+``QueuedEmailBackend`` — значение ``EMAIL_BACKEND``: он только
+записывает письма в ``OutgoingEmail`` и ставит задачу
+``users.tasks.deliver_email``, поэтому сброс пароля не ждёт почтовый
+сервер. Задача забирает письма пачками по ``EMAIL_BATCH_SIZE`` и
+отправляет их через одно соединение ``EMAIL_DELIVERY_BACKEND``,
+открытое на весь проход. ``EMAIL_RATE_LIMIT`` писем в секунду — общий
+предел всех воркеров: очередь на отправку держится в общем кэше.
+
+Неотправленное письмо повторяется с экспоненциальной паузой от
+``EMAIL_RETRY_DELAY`` секунд, после ``EMAIL_MAX_ATTEMPTS`` попыток
+остаётся в состоянии «Не отправлено». Если не открылось соединение,
+проход прекращается: остальные письма пачки ждут ``EMAIL_RETRY_DELAY``
+секунд, и попытка им не засчитывается — недоступный сервер не должен
+исчерпать попытки всей очереди.
+"""
+import copy
+import logging
+import math
+import pickle
+import time
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.mail import get_connection
+from django.core.mail.backends.base import BaseEmailBackend
+from django.db.models import Min
+from django.utils import timezone
+
+from . import tasks
+from .models import OutgoingEmail
+
+logger = logging.getLogger(__name__)
+
+QUEUE_KEY = 'deliver_email'
+# Ключи ``lock:`` читаются из общего кэша (L2), а не из памяти процесса.
+SLOT_KEY = 'lock:email-slot:{}'
+
+
+class QueuedEmailBackend(BaseEmailBackend):
+    def send_messages(self, email_messages):
+        emails = []
+        for message in email_messages:
+            if not message.recipients():
+                continue
+            message = copy.copy(message)
+            message.connection = None
+            emails.append(OutgoingEmail(
+                subject=message.subject[:255],
+                recipients=', '.join(message.recipients()),
+                message=pickle.dumps(message)))
+        if emails:
+            OutgoingEmail.objects.bulk_create(emails)
+            tasks.deliver_email.enqueue(key=QUEUE_KEY)
+        return len(emails)
+
+
+class RateLimiter:
+    """Не чаще ``rate`` событий в секунду на все процессы; 0 — без
+    ограничения.
+
+    Время делится на слоты по 1/``rate`` секунды. Процесс занимает
+    первый свободный ещё не начавшийся слот атомарным ``cache.add`` и
+    ждёт его начала, поэтому два воркера не отправят письма в одном
+    слоте.
+    """
+
+    def __init__(self, rate):
+        self.interval = 1 / rate if rate else 0
+
+    def wait(self):
+        if not self.interval:
+            return
+        slot = math.ceil(time.time() / self.interval)
+        while not cache.add(SLOT_KEY.format(slot), 1, 60):
+            slot += 1
+        delay = slot * self.interval - time.time()
+        if delay > 0:
+            time.sleep(delay)
+
+
+def claim_batch(sender):
+    """Забирает пачку готовых писем для отправителя ``sender``."""
+    now = timezone.now()
+    ready = OutgoingEmail.objects.filter(
+        status=OutgoingEmail.QUEUED, send_after__lte=now)
+    ids = list(ready.order_by('pk').values_list(
+        'pk', flat=True)[:settings.EMAIL_BATCH_SIZE])
+    # Условный UPDATE: письма, которые успел забрать другой
+    # отправитель, уже не готовы и не обновятся.
+    ready.filter(pk__in=ids).update(
+        sender=sender,
+        send_after=now + timedelta(seconds=settings.JOBS_LEASE_TIMEOUT))
+    return list(OutgoingEmail.objects.filter(
+        pk__in=ids, sender=sender).order_by('pk'))
+
+
+def record_failure(emails, error):
+    """Откладывает письма до следующей попытки или помечает
+    неотправленными.
+    """
+    now = timezone.now()
+    for email in emails:
+        email.attempts += 1
+        email.last_error = repr(error)
+        email.sender = ''
+        if email.attempts >= settings.EMAIL_MAX_ATTEMPTS:
+            email.status = OutgoingEmail.FAILED
+        email.send_after = now + timedelta(
+            seconds=settings.EMAIL_RETRY_DELAY * 2 ** (email.attempts - 1))
+        email.save(update_fields=('attempts', 'last_error', 'sender',
+                                  'status', 'send_after'))
+
+
+def postpone(emails, error):
+    """Откладывает письма, не засчитывая попытку: сервер недоступен."""
+    OutgoingEmail.objects.filter(
+        pk__in=[email.pk for email in emails],
+    ).update(last_error=repr(error), sender='',
+             send_after=timezone.now() + timedelta(
+                 seconds=settings.EMAIL_RETRY_DELAY))
+
+
+def schedule_retry():
+    """Ставит задачу к моменту ближайшего повтора."""
+    retry_at = OutgoingEmail.objects.filter(
+        status=OutgoingEmail.QUEUED).aggregate(
+            retry_at=Min('send_after'))['retry_at']
+    if retry_at is not None:
+        delay = max((retry_at - timezone.now()).total_seconds(), 0)
+        tasks.deliver_email.enqueue(key=QUEUE_KEY, delay=delay)
+
+
+def deliver():
+    """Отправляет готовые письма; возвращает (отправлено, с ошибкой)."""
+    sender = uuid.uuid4().hex
+    connection = get_connection(
+        settings.EMAIL_DELIVERY_BACKEND, fail_silently=False)
+    limiter = RateLimiter(settings.EMAIL_RATE_LIMIT)
+    sent = failed = 0
+    try:
+        batch = claim_batch(sender)
+        while batch:
+            delivered = []
+            for number, email in enumerate(batch):
+                try:
+                    connection.open()
+                except Exception as error:
+                    logger.warning('Почтовый сервер недоступен: %r', error)
+                    postpone(batch[number:], error)
+                    failed += len(batch) - number
+                    batch = []
+                    break
+                limiter.wait()
+                try:
+                    connection.send_messages(
+                        [pickle.loads(bytes(email.message))])
+                except Exception as error:
+                    logger.warning('Письмо %s не отправлено: %r',
+                                   email.pk, error)
+                    record_failure([email], error)
+                    failed += 1
+                    # Соединение после ошибки могло остаться в любом
+                    # состоянии — следующее письмо откроет новое.
+                    connection.close()
+                else:
+                    delivered.append(email.pk)
+            OutgoingEmail.objects.filter(pk__in=delivered).delete()
+            sent += len(delivered)
+            if batch:
+                batch = claim_batch(sender)
+    finally:
+        connection.close()
+    if failed:
+        schedule_retry()
+    return sent, failed
@@ -0,0 +1,43 @@
+from django.db import models
+from django.utils import timezone
+
+
+class OutgoingEmail(models.Model):
+    """Письмо в очереди отправки (см. ``users.mail``)."""
+    QUEUED = 'queued'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (QUEUED, 'В очереди'),
+        (FAILED, 'Не отправлено'),
+    )
+
+    subject = models.CharField('Тема', max_length=255)
+    recipients = models.TextField('Получатели')
+    # EmailMessage целиком: pickle сохраняет вложения и альтернативы.
+    message = models.BinaryField('Письмо')
+    status = models.CharField(
+        'Состояние',
+        max_length=10,
+        choices=STATUS_CHOICES,
+        default=QUEUED,
+    )
+    attempts = models.PositiveIntegerField('Попыток', default=0)
+    send_after = models.DateTimeField(
+        'Отправить не раньше',
+        default=timezone.now,
+        help_text='Срок захвата отправителем или пауза перед повтором',
+    )
+    sender = models.CharField('Отправитель', max_length=32, blank=True)
+    last_error = models.TextField('Последняя ошибка', blank=True)
+    created = models.DateTimeField('Поставлено', auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Исходящее письмо'
+        verbose_name_plural = 'Исходящие письма'
+        indexes = [
+            models.Index(fields=['status', 'send_after'],
+                         name='email_status_send_after_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.subject} → {self.recipients}'
@@ -0,0 +1,8 @@
+from jobs.registry import task
+
+from . import mail
+
+
+@task(atomic=False)
+def deliver_email():
+    mail.deliver()
@@ -0,0 +1,175 @@
+import socketserver
+import threading
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.mail import EmailMessage, get_connection, send_mass_mail
+from django.test import override_settings, TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from jobs import worker
+from jobs.models import Job
+
+from .. import mail
+from ..models import OutgoingEmail
+
+User = get_user_model()
+
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+    """Минимальный SMTP-сервер: принимает письма в ``server.messages``,
+    первые ``server.reject`` писем отклоняет кодом 451.
+    """
+
+    def reply(self, line):
+        self.wfile.write(f'{line}\r\n'.encode())
+
+    def handle(self):
+        self.server.connections += 1
+        self.reply('220 localhost')
+        for line in self.rfile:
+            verb = line[:4].decode().upper()
+            if verb == 'DATA':
+                self.reply('354 Конец — строка из точки')
+                data = b''.join(iter(self.rfile.readline, b'.\r\n'))
+                if self.server.reject:
+                    self.server.reject -= 1
+                    self.reply('451 Попробуйте позже')
+                else:
+                    self.server.messages.append(data.decode())
+                    self.reply('250 OK')
+            elif verb == 'QUIT':
+                self.reply('221 Bye')
+                return
+            elif verb in ('EHLO', 'HELO', 'MAIL', 'RCPT', 'RSET', 'NOOP'):
+                self.reply('250 OK')
+            else:
+                self.reply('502 Не поддерживается')
+
+
+class SMTPStandIn(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), SMTPHandler)
+        self.connections = 0
+        self.reject = 0
+        self.messages = []
+
+
+class QueuedEmailTests(TestCase):
+    def setUp(self):
+        self.smtp = SMTPStandIn()
+        thread = threading.Thread(target=self.smtp.serve_forever)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(self.smtp.server_close)
+        self.addCleanup(self.smtp.shutdown)
+        settings = override_settings(
+            EMAIL_BACKEND='users.mail.QueuedEmailBackend',
+            EMAIL_DELIVERY_BACKEND=(
+                'django.core.mail.backends.smtp.EmailBackend'),
+            EMAIL_HOST='127.0.0.1',
+            EMAIL_PORT=self.smtp.server_address[1],
+            EMAIL_USE_TLS=False,
+            EMAIL_RATE_LIMIT=0,
+            JOBS_BACKEND='jobs.backends.DatabaseBackend',
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def run_jobs(self):
+        return worker.Worker('test', poll_interval=0).run(burst=True)
+
+    def send(self, count):
+        send_mass_mail([
+            (f'Письмо {number}', 'Текст', 'site@yatube.ru',
+             [f'user{number}@yatube.ru'])
+            for number in range(count)
+        ])
+
+    def test_password_reset_only_queues_email(self):
+        """Сброс пароля ставит письмо в очередь, не обращаясь к серверу."""
+        User.objects.create_user(
+            username='auth', email='auth@yatube.ru', password='пароль')
+        response = self.client.post(reverse('users:password_reset_form'),
+                                    {'email': 'auth@yatube.ru'})
+        self.assertRedirects(response, reverse('users:password_reset_done'))
+        self.assertEqual(self.smtp.connections, 0)
+        self.assertEqual(OutgoingEmail.objects.get().recipients,
+                         'auth@yatube.ru')
+        self.assertEqual(self.run_jobs(), {'done': 1, 'failed': 0})
+        self.assertEqual(len(self.smtp.messages), 1)
+        self.assertIn('auth@yatube.ru', self.smtp.messages[0])
+        self.assertFalse(OutgoingEmail.objects.exists())
+
+    @override_settings(EMAIL_BATCH_SIZE=2)
+    def test_batches_share_one_connection(self):
+        """Все пачки прохода уходят через одно соединение, одна задача."""
+        self.send(5)
+        self.send(1)
+        self.assertEqual(Job.objects.count(), 1)
+        self.run_jobs()
+        self.assertEqual(self.smtp.connections, 1)
+        self.assertEqual(len(self.smtp.messages), 6)
+
+    def test_rejected_message_is_retried_later(self):
+        """Отклонённое письмо откладывается, остальные уходят."""
+        self.smtp.reject = 1
+        self.send(3)
+        Job.objects.all().delete()
+        self.assertEqual(mail.deliver(), (2, 1))
+        email = OutgoingEmail.objects.get()
+        self.assertEqual((email.attempts, email.status),
+                         (1, OutgoingEmail.QUEUED))
+        self.assertIn('451', email.last_error)
+        retry = Job.objects.get()
+        self.assertGreater(retry.run_at, timezone.now())
+        self.assertEqual(mail.deliver(), (0, 0))
+        OutgoingEmail.objects.update(send_after=timezone.now())
+        self.assertEqual(mail.deliver(), (1, 0))
+        self.assertEqual(len(self.smtp.messages), 3)
+
+    @override_settings(EMAIL_MAX_ATTEMPTS=2)
+    def test_unreachable_server_stops_pass(self):
+        """Без сервера проход прекращается, письма ждут повтора, но
+        попытки не расходуются и письма уходят, когда сервер вернётся.
+        """
+        self.send(2)
+        with override_settings(EMAIL_PORT=1):
+            for _ in range(3):
+                self.assertEqual(mail.deliver(), (0, 2))
+                OutgoingEmail.objects.update(send_after=timezone.now())
+        self.assertEqual(
+            set(OutgoingEmail.objects.values_list('status', 'attempts')),
+            {(OutgoingEmail.QUEUED, 0)})
+        self.assertEqual(mail.deliver(), (2, 0))
+
+    @override_settings(EMAIL_RATE_LIMIT=20)
+    def test_rate_limit(self):
+        """Письма уходят не чаще EMAIL_RATE_LIMIT в секунду."""
+        self.send(4)
+        started = time.monotonic()
+        mail.deliver()
+        self.assertGreaterEqual(time.monotonic() - started, 3 / 20)
+        self.assertEqual(len(self.smtp.messages), 4)
+
+    def test_rate_limit_shared_between_workers(self):
+        """Ограничители разных воркеров не занимают один слот."""
+        first, second = mail.RateLimiter(20), mail.RateLimiter(20)
+        started = time.monotonic()
+        for limiter in (first, second, first, second):
+            limiter.wait()
+        self.assertGreaterEqual(time.monotonic() - started, 3 / 20)
+
+    def test_messages_keep_attachments(self):
+        """Письмо в очереди сохраняет вложения."""
+        message = EmailMessage('Отчёт', 'Текст', 'site@yatube.ru',
+                               ['auth@yatube.ru'],
+                               connection=get_connection())
+        message.attach('report.csv', 'a,b\n1,2\n', 'text/csv')
+        message.send()
+        mail.deliver()
+        self.assertIn('report.csv', self.smtp.messages[0])
@@ -20,6 +20,8 @@ INSTALLED_APPS = [
     'users.apps.UsersConfig',
     'core.apps.CoreConfig',
     'about.apps.AboutConfig',
+    'api.apps.ApiConfig',
+    'jobs.apps.JobsConfig',
     'django.contrib.admin',
     'django.contrib.auth',
     'django.contrib.contenttypes',
@@ -31,6 +33,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.metrics.PerformanceMiddleware',
+    'core.routers.ReplicaRoutingMiddleware',
+    'core.sqlite.WriteQueueMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -64,15 +69,121 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'yatube.wsgi.application'
 
+TEST_RUNNER = 'core.test_runner.TestRunner'
+
 NUMBER_OF_POSTS = 10
 
+NUMBER_OF_COMMENTS = 20
+
+# Страница списков JSON API (?limit=) и срок действия токенов API.
+API_PAGE_SIZE = 20
+API_MAX_PAGE_SIZE = 100
+API_TOKEN_MAX_AGE = 60 * 60 * 24 * 30
+
+# Сколько символов текста публикации показывает карточка в списках.
+POST_PREVIEW_LENGTH = 500
+
+# Записей в RSS/Atom-ленте сообщества или автора, длина заголовка записи
+# и число адресов в одном разделе sitemap (предел протокола — 50 000).
+FEED_ITEMS = 50
+FEED_TITLE_LENGTH = 80
+SITEMAP_SIZE = 50000
+
+# Адаптивные варианты изображения публикации для <picture>/srcset:
+# кадр, ширины и форматы в порядке предпочтения. Форматы, которые не
+# поддерживает установленный Pillow, пропускаются; JPEG строится всегда.
+POST_IMAGE_SIZE = (960, 339)
+POST_IMAGE_WIDTHS = (320, 640, 960)
+POST_IMAGE_FORMATS = ('AVIF', 'WEBP')
+POST_IMAGE_QUALITY = 80
+
+# 'keyset' — постраничный вывод по курсору, 'offset' — Django Paginator.
+PAGINATION_MODE = 'keyset'
+
+# Авторы с большим числом подписчиков не раскладываются по лентам при
+# записи, их публикации подмешиваются в ленту при чтении.
+FEED_FANOUT_LIMIT = 10000
+
+# Сколько последних публикаций автора добавить в ленту при подписке.
+FEED_BACKFILL_LIMIT = 200
+
+THUMBNAIL_WORKERS = 2
+
+# Очередь фоновых задач (см. jobs): раскладка по лентам, поисковый индекс
+# и варианты изображений выполняются вне запроса. DatabaseBackend хранит
+# задачи в основной базе, выполняет их manage.py run_jobs; с
+# JOBS_BACKEND=jobs.backends.ImmediateBackend — сразу, в процессе
+# запроса (так работают тесты). Задача числится за воркером
+# JOBS_LEASE_TIMEOUT секунд, потом её может забрать другой.
+JOBS_BACKEND = os.getenv('JOBS_BACKEND', 'jobs.backends.DatabaseBackend')
+JOBS_LEASE_TIMEOUT = 300
+JOBS_POLL_INTERVAL = 1
+
+# База данных задаётся переменными окружения. По умолчанию — SQLite;
+# в продакшене — PostgreSQL (драйвер psycopg2-binary из requirements.txt;
+# 2.9 несовместим с Django 2.2):
+#   DB_ENGINE=django.db.backends.postgresql DB_NAME=yatube DB_USER=...
+#   DB_PASSWORD=... DB_HOST=... DB_PORT=5432 DB_CONN_MAX_AGE=60
+# DB_CONN_MAX_AGE держит соединение открытым между запросами одного
+# воркера; общий пул для всех воркеров — PgBouncer перед DB_HOST.
+# DB_REPLICA_HOSTS — адреса реплик через запятую: на них уходят чтения
+# представлений из READ_REPLICA_VIEWS (см. core.routers).
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'ENGINE': os.getenv('DB_ENGINE', 'django.db.backends.sqlite3'),
+        'NAME': os.getenv('DB_NAME', os.path.join(BASE_DIR, 'db.sqlite3')),
+        'USER': os.getenv('DB_USER', ''),
+        'PASSWORD': os.getenv('DB_PASSWORD', ''),
+        'HOST': os.getenv('DB_HOST', ''),
+        'PORT': os.getenv('DB_PORT', ''),
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', '0')),
     }
 }
 
+# Режим для одного узла на SQLite (см. core.sqlite): WAL, PRAGMA
+# соединений и очередь записи для воркеров gunicorn.
+SQLITE_CONCURRENCY = os.getenv('SQLITE_CONCURRENCY', '') == '1'
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
+    'busy_timeout': 5000,
+    'temp_store': 'MEMORY',
+}
+# Файл блокировки очереди записи; по умолчанию рядом с базой.
+SQLITE_WRITE_LOCK = os.getenv('SQLITE_WRITE_LOCK', '')
+# Общий кэш страниц для потоков одного процесса. Блокирует таблицы
+# целиком, поэтому полезен только при многопоточном воркере.
+if (os.getenv('SQLITE_SHARED_CACHE', '') == '1'
+        and DATABASES['default']['ENGINE'].endswith('sqlite3')):
+    DATABASES['default']['NAME'] = (
+        f'file:{DATABASES["default"]["NAME"]}?cache=shared')
+    DATABASES['default']['OPTIONS'] = {'uri': True}
+
+DATABASE_REPLICAS = []
+for number, host in enumerate(
+        filter(None, os.getenv('DB_REPLICA_HOSTS', '').split(',')), 1):
+    DATABASES[f'replica{number}'] = {
+        **DATABASES['default'],
+        'HOST': host.strip(),
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(f'replica{number}')
+
+DATABASE_ROUTERS = ['core.routers.PrimaryReplicaRouter']
+
+READ_REPLICA_VIEWS = (
+    'posts:index',
+    'posts:group_list',
+    'posts:profile',
+    'posts:post_detail',
+)
+
+# После записи пользователь читает с основной базы столько секунд,
+# чтобы не увидеть устаревшие данные реплики. Должно быть больше
+# задержки репликации.
+PRIMARY_STICKINESS_SECONDS = 15
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth'
@@ -109,7 +220,29 @@ LOGIN_URL = 'users:login'
 
 LOGIN_REDIRECT_URL = 'posts:index'
 
-EMAIL_BACKEND = 'django.core.mail.backends.filebased.EmailBackend'
+# Письма ставятся в очередь (users.mail) и уходят задачей jobs пачками
+# по EMAIL_BATCH_SIZE через одно соединение EMAIL_DELIVERY_BACKEND, не
+# чаще EMAIL_RATE_LIMIT писем в секунду на все воркеры вместе (0 — без
+# ограничения). Письмо, которое сервер не принял, повторяется с паузой
+# от EMAIL_RETRY_DELAY секунд, всего не больше EMAIL_MAX_ATTEMPTS
+# попыток; недоступность сервера попыткой не считается.
+# Для SMTP задайте в окружении EMAIL_DELIVERY_BACKEND со значением
+#   django.core.mail.backends.smtp.EmailBackend
+# и параметры сервера EMAIL_HOST, EMAIL_PORT, EMAIL_HOST_USER, ...
+EMAIL_BACKEND = 'users.mail.QueuedEmailBackend'
+EMAIL_DELIVERY_BACKEND = os.getenv(
+    'EMAIL_DELIVERY_BACKEND',
+    'django.core.mail.backends.filebased.EmailBackend')
+EMAIL_HOST = os.getenv('EMAIL_HOST', 'localhost')
+EMAIL_PORT = int(os.getenv('EMAIL_PORT', '25'))
+EMAIL_HOST_USER = os.getenv('EMAIL_HOST_USER', '')
+EMAIL_HOST_PASSWORD = os.getenv('EMAIL_HOST_PASSWORD', '')
+EMAIL_USE_TLS = os.getenv('EMAIL_USE_TLS', '') == '1'
+EMAIL_TIMEOUT = 10
+EMAIL_BATCH_SIZE = 100
+EMAIL_RATE_LIMIT = 10
+EMAIL_RETRY_DELAY = 60
+EMAIL_MAX_ATTEMPTS = 5
 
 EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 
@@ -117,12 +250,80 @@ CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# Файлы с именем по содержимому не меняются, их можно кэшировать навсегда.
+MEDIA_IMMUTABLE_MAX_AGE = 60 * 60 * 24 * 365
+
+# Загрузки больше 256 КБ сразу пишутся на диск кусками, приём файла
+# прекращается после POST_IMAGE_MAX_UPLOAD_SIZE.
+FILE_UPLOAD_MAX_MEMORY_SIZE = 256 * 1024
+FILE_UPLOAD_HANDLERS = [
+    'posts.uploads.UploadLimitHandler',
+    'django.core.files.uploadhandler.MemoryFileUploadHandler',
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+POST_IMAGE_MAX_UPLOAD_SIZE = 10 * 1024 * 1024
+POST_IMAGE_MAX_PIXELS = 40 * 10 ** 6
+# Изображения больше этого размера по длинной стороне уменьшаются при
+# загрузке, EXIF при этом удаляется.
+POST_IMAGE_MAX_DIMENSION = 2560
 
+# Общий для воркеров кэш (L2): 'sqlite' — файл рядом с базой (свой у
+# каждой копии проекта; значения в нём — pickle, поэтому файл не должен
+# быть доступен на запись другим пользователям), 'memcached' —
+# серверы CACHE_LOCATION через запятую (клиент python-memcached),
+# 'locmem' — память процесса.
+# Проект обращается к 'default': перед общим кэшем стоит кэш процесса
+# (L1) для неизменяемых ключей, см. core.cache_backends.
+# CACHE_KEY_VERSION меняют, когда меняется формат значений в кэше.
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'sqlite')
+SHARED_CACHE_BACKENDS = {
+    'sqlite': {
+        'BACKEND': 'core.cache_backends.SQLiteCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache.sqlite3'),
+        'OPTIONS': {'MAX_ENTRIES': 100_000},
+    },
+    'memcached': {
+        'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+        'LOCATION': '127.0.0.1:11211',
+    },
+    'locmem': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+}
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-    }
+        'BACKEND': 'core.cache_backends.TwoLevelCache',
+        'OPTIONS': {
+            'SHARED': 'shared',
+            'LOCAL_PREFIXES': ('card:', 'template.cache.'),
+            'LOCAL_TIMEOUT': 60,
+            'LOCAL_MAX_ENTRIES': 2000,
+        },
+    },
+    'shared': {
+        **SHARED_CACHE_BACKENDS[CACHE_BACKEND],
+        'KEY_PREFIX': 'yatube',
+        'VERSION': int(os.getenv('CACHE_KEY_VERSION', '1')),
+    },
 }
+if os.getenv('CACHE_LOCATION'):
+    CACHES['shared']['LOCATION'] = os.getenv('CACHE_LOCATION')
+
+# Фрагменты шаблонов сбрасываются сигналами при изменении данных,
+# поэтому могут храниться долго.
+FRAGMENT_CACHE_TIMEOUT = 60 * 60 * 6
+# Целые страницы для анонимов; устаревшую страницу перерисовывает один
+# запрос, остальные до PAGE_CACHE_LOCK_TIMEOUT секунд получают прежнюю.
+PAGE_CACHE_TIMEOUT = 60 * 60 * 6
+PAGE_CACHE_LOCK_TIMEOUT = 30
+
+# Доля запросов, для которых PerformanceMiddleware снимает подробные
+# метрики (SQL, шаблоны, кэш). Метрики доступны по /metrics/ с
+# заголовком «Authorization: Bearer METRICS_TOKEN» (bearer_token в
+# Prometheus). Без METRICS_TOKEN — только напрямую с адресов INTERNAL_IPS:
+# запрос с X-Forwarded-For, то есть через прокси, получает 403.
+PERF_SAMPLE_RATE = float(os.getenv('PERF_SAMPLE_RATE', '0.05'))
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
 
 INTERNAL_IPS = [
     '127.0.0.1',
@@ -1,13 +1,16 @@
 from django.conf import settings
-from django.conf.urls.static import static
 from django.contrib import admin
-from django.urls import include, path
+from django.urls import include, path, re_path
+
+from core.views import media, metrics_export
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('auth/', include('users.urls')),
     path('auth/', include('django.contrib.auth.urls')),
     path('about/', include('about.urls', namespace='about')),
+    path('metrics/', metrics_export, name='metrics'),
+    path('api/v1/', include('api.urls', namespace='api')),
     path('', include('posts.urls', namespace='posts')),
 ]
 
@@ -16,8 +19,8 @@ handler404 = 'core.views.page_not_found'
 handler500 = 'core.views.server_error'
 
 if settings.DEBUG:
-    urlpatterns += static(
-        settings.MEDIA_URL, document_root=settings.MEDIA_ROOT
+    urlpatterns += (
+        re_path(rf'^{settings.MEDIA_URL.lstrip("/")}(?P<path>.*)$', media),
     )
     import debug_toolbar
     urlpatterns += (path('__debug__/', include(debug_toolbar.urls)),)